@@ -0,0 +1,32 @@
+"""Add rolling summary to conversations
+
+Revision ID: 0012
+Revises: 0011_create_audit_logs
+Create Date: 2026-10-19
+
+Changes:
+- Add summary column (resumo das mensagens antigas)
+- Add summary_upto_message_id column (última mensagem incluída no resumo)
+- Add summary_updated_at column
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011_create_audit_logs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_upto_message_id', sa.Integer(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('conversations', 'summary_updated_at')
+    op.drop_column('conversations', 'summary_upto_message_id')
+    op.drop_column('conversations', 'summary')
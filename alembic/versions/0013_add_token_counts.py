@@ -0,0 +1,37 @@
+"""Add token_count to conversation messages and knowledge chunks
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19
+
+Changes:
+- Add token_count column to conversation_messages (calculado na inserção)
+- Add token_count column to knowledge_chunks
+- Add (conversation_id, id) index para a janela de histórico
+- Linhas existentes: rodar tools/backfill_token_counts.py
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('conversation_messages', sa.Column('token_count', sa.Integer(), nullable=True))
+    op.add_column('knowledge_chunks', sa.Column('token_count', sa.Integer(), nullable=True))
+    op.create_index(
+        'ix_conversation_messages_conversation_id_id',
+        'conversation_messages',
+        ['conversation_id', 'id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_conversation_messages_conversation_id_id', table_name='conversation_messages')
+    op.drop_column('knowledge_chunks', 'token_count')
+    op.drop_column('conversation_messages', 'token_count')
@@ -0,0 +1,45 @@
+"""Side-by-side embedding columns per model
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19
+
+Changes:
+- Add embedding_model column to knowledge_chunks (modelo que gerou o vetor)
+- Add embedding_large column (text-embedding-3-large, 3072 dims)
+- HNSW index on embedding_large via halfvec (vector é limitado a 2000 dims no índice)
+- Existing embeddings are marked as text-embedding-3-small
+"""
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('knowledge_chunks', sa.Column('embedding_model', sa.String(100), nullable=True))
+    op.add_column('knowledge_chunks', sa.Column('embedding_large', Vector(3072), nullable=True))
+
+    op.execute("""
+        UPDATE knowledge_chunks
+        SET embedding_model = 'text-embedding-3-small'
+        WHERE embedding IS NOT NULL AND embedding_model IS NULL
+    """)
+
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_embeddings_large
+        ON knowledge_chunks
+        USING hnsw ((embedding_large::halfvec(3072)) halfvec_cosine_ops)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_embeddings_large")
+    op.drop_column('knowledge_chunks', 'embedding_large')
+    op.drop_column('knowledge_chunks', 'embedding_model')
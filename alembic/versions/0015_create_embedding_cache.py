@@ -0,0 +1,35 @@
+"""Create content-addressed embedding cache
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19
+
+Changes:
+- Create embedding_cache table keyed by (model, content_hash)
+"""
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'embedding_cache',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('model', sa.String(100), nullable=False),
+        sa.Column('content_hash', sa.String(64), nullable=False),
+        sa.Column('embedding', Vector(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('NOW()')),
+        sa.UniqueConstraint('model', 'content_hash', name='uq_embedding_cache_model_hash')
+    )
+
+
+def downgrade():
+    op.drop_table('embedding_cache')
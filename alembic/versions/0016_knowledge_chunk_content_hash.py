@@ -0,0 +1,41 @@
+"""Content hash on knowledge chunks
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19
+
+Changes:
+- Add content_hash column to knowledge_chunks (sha256 hex do texto do chunk)
+- Backfill existing rows in SQL (pgcrypto não é necessário: sha256() é nativo no PG 11+)
+- Index (document_id, content_hash) para o diff de atualização incremental
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('knowledge_chunks', sa.Column('content_hash', sa.String(64), nullable=True))
+
+    op.execute("""
+        UPDATE knowledge_chunks
+        SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+        WHERE content_hash IS NULL
+    """)
+
+    op.create_index(
+        'ix_knowledge_chunks_document_id_content_hash',
+        'knowledge_chunks',
+        ['document_id', 'content_hash']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_knowledge_chunks_document_id_content_hash', table_name='knowledge_chunks')
+    op.drop_column('knowledge_chunks', 'content_hash')
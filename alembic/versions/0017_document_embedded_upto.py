@@ -0,0 +1,41 @@
+"""Ingestion checkpoint on documents
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19
+
+Changes:
+- Add embedded_upto column to documents (chunks já gravados com embedding, em ordem)
+- Documentos existentes: checkpoint = número de chunks gravados
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'documents',
+        sa.Column('embedded_upto', sa.Integer(), server_default='0', nullable=False)
+    )
+
+    op.execute("""
+        UPDATE documents d
+        SET embedded_upto = c.total
+        FROM (
+            SELECT document_id, COUNT(*) AS total
+            FROM knowledge_chunks
+            GROUP BY document_id
+        ) c
+        WHERE c.document_id = d.id
+    """)
+
+
+def downgrade():
+    op.drop_column('documents', 'embedded_upto')
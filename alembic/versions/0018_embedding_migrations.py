@@ -0,0 +1,48 @@
+"""Corpus re-embedding jobs and per-tenant active embedding model
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-19
+
+Changes:
+- Add embedding_model column to tenants (modelo ativo; NULL = EMBEDDINGS_MODEL)
+- Create embedding_migrations table (progresso, checkpoint e estimativas do re-embedding)
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tenants', sa.Column('embedding_model', sa.String(100), nullable=True))
+
+    op.create_table(
+        'embedding_migrations',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('tenant_id', sa.Integer(), sa.ForeignKey('tenants.id'), nullable=True),
+        sa.Column('target_model', sa.String(100), nullable=False),
+        sa.Column('status', sa.Text(), server_default='PENDING', nullable=False),
+        sa.Column('chunks_total', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('chunks_done', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('tokens_total', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('tokens_done', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('estimated_cost_usd', sa.Float(), nullable=True),
+        sa.Column('last_chunk_id', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_embedding_migrations_tenant_id', 'embedding_migrations', ['tenant_id'])
+
+
+def downgrade():
+    op.drop_index('ix_embedding_migrations_tenant_id', table_name='embedding_migrations')
+    op.drop_table('embedding_migrations')
+    op.drop_column('tenants', 'embedding_model')
@@ -0,0 +1,35 @@
+"""Vector column for the local (ONNX) embedding model
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-10-19
+
+Changes:
+- Add embedding_local column (paraphrase-multilingual-MiniLM-L12-v2, 384 dims)
+- HNSW index on embedding_local
+"""
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = '0019'
+down_revision = '0018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('knowledge_chunks', sa.Column('embedding_local', Vector(384), nullable=True))
+
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_embeddings_local
+        ON knowledge_chunks
+        USING hnsw (embedding_local vector_cosine_ops)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_embeddings_local")
+    op.drop_column('knowledge_chunks', 'embedding_local')
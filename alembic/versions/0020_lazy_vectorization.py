@@ -0,0 +1,50 @@
+"""Lazy vectorization and full-text search on knowledge chunks
+
+Revision ID: 0020
+Revises: 0019
+Create Date: 2026-10-19
+
+Changes:
+- Add vector_status / vector_requested_at columns to documents (vetores sob demanda)
+- Partial index on documents (tenant_id, agent_id) for pending lazy documents
+- Add content_tsv generated column (to_tsvector('portuguese', content)) to knowledge_chunks
+- GIN index on content_tsv (busca por palavra-chave)
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0020'
+down_revision = '0019'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('vector_status', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('vector_requested_at', sa.DateTime(), nullable=True))
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_documents_vector_pending
+        ON documents (tenant_id, agent_id)
+        WHERE vector_status IN ('PENDING', 'RUNNING')
+    """)
+
+    op.execute("""
+        ALTER TABLE knowledge_chunks
+        ADD COLUMN content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('portuguese', content)) STORED
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_knowledge_chunks_content_tsv
+        ON knowledge_chunks
+        USING gin (content_tsv)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_knowledge_chunks_content_tsv")
+    op.drop_column('knowledge_chunks', 'content_tsv')
+    op.execute("DROP INDEX IF EXISTS ix_documents_vector_pending")
+    op.drop_column('documents', 'vector_requested_at')
+    op.drop_column('documents', 'vector_status')
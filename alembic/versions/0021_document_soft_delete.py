@@ -0,0 +1,33 @@
+"""Soft delete of documents (purged in background)
+
+Revision ID: 0021
+Revises: 0020
+Create Date: 2026-10-19
+
+Changes:
+- Add deleted_at column to documents (NULL = documento ativo)
+- Partial index on documents (deleted_at) for the reaper queue
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0021'
+down_revision = '0020'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_documents_deleted
+        ON documents (deleted_at)
+        WHERE deleted_at IS NOT NULL
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_documents_deleted")
+    op.drop_column('documents', 'deleted_at')
@@ -0,0 +1,26 @@
+"""Heartbeat on corpus re-embedding jobs
+
+Revision ID: 0022
+Revises: 0021
+Create Date: 2026-10-19
+
+Changes:
+- Add heartbeat_at column to embedding_migrations (RUNNING sem heartbeat recente = processo morreu)
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0022'
+down_revision = '0021'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('embedding_migrations', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('embedding_migrations', 'heartbeat_at')
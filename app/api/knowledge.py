@@ -6,15 +6,19 @@ from sqlalchemy.orm import Session
 from app.core.database import SessionLocal
 from app.models.models import KnowledgeItem, Agent, AgentDocument
 from app.core.security import get_current_user
-from app.services.knowledge import extract_text, vectorize_document
+from app.services.knowledge import extract_text_from_path, vectorize_document
+import os
+import tempfile
 import uuid
-import hashlib
 import logging
+from app.services.uploads import save_upload
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+KNOWLEDGE_UPLOAD_DIR = os.getenv("KNOWLEDGE_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "orkio_knowledge"))
+
 def get_db():
     db = SessionLocal()
     try:
@@ -35,18 +39,20 @@ async def upload_document(
     v3.9.0: Usa agent_documents (N:N) e services/knowledge.py
     """
     try:
-        raw = await file.read()
-        
         # Criar documento
         doc_id = str(uuid.uuid4())
+        
+        # Upload em streaming para o disco (sha256 calculado na cópia); nome gerado, nunca o do cliente
+        ext = os.path.splitext(os.path.basename(file.filename or ""))[1].lower()
+        upload = await save_upload(file, os.path.join(KNOWLEDGE_UPLOAD_DIR, f"{doc_id}{ext}"))
         doc = KnowledgeItem(
             id=doc_id,
             tenant_id=1,  # Admin tenant stub
             filename=file.filename,
             mime=file.content_type,
-            size=len(raw),
+            size=upload.size_bytes,
             tags=[t.strip() for t in tags.split(",") if t.strip()],
-            checksum=hashlib.sha256(raw).hexdigest(),
+            checksum=upload.sha256,
             status="processing",
         )
         db.add(doc)
@@ -55,12 +61,18 @@ async def upload_document(
 
         # Extrair + vetorizar
         try:
-            text = extract_text(file, raw)
+            text = extract_text_from_path(upload.path, file.filename)
             result = vectorize_document(db, 1, doc.id, text)
         except Exception as e:
             db.query(KnowledgeItem).filter(KnowledgeItem.id==doc.id).update({"status": "error", "error_reason": str(e)})
             db.commit()
             raise HTTPException(status_code=500, detail=f"vectorization_failed: {e}")
+        finally:
+            # O arquivo só serve para a extração; o conteúdo fica nos chunks
+            try:
+                os.remove(upload.path)
+            except OSError:
+                pass
 
         # Criar vínculos N:N
         if link_agent_ids:
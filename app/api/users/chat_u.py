@@ -1,6 +1,6 @@
 _# api/users/chat_u.py
 # v4.5: Chat com RAG e multi-tenant
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -8,6 +8,9 @@ from app.core.deps import get_db, get_current_user, get_current_user_tenant
 from app.models.models import Agent, User, Conversation, ConversationMessage
 from app.services.rag_service import search as rag_search
 from app.services.llm_manager import chat_completion as llm_chat
+from app.services.prompt_builder import PromptBuilder, PromptTooLargeError
+from app.services.tokenizer import count_tokens, truncate_to_tokens
+from app.services.conversation_memory import load_history_window, summarize_conversation
 from typing import List, Literal, Optional
 import time
 import logging
@@ -28,6 +31,7 @@ class ChatRequest(BaseModel):
 @router.post("/chat", tags=["User Console - Chat"])
 def user_chat(
     payload: ChatRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     tenant_id: int = Depends(get_current_user_tenant)
@@ -47,20 +51,45 @@ def user_chat(
     if not agent:
         raise HTTPException(status_code=404, detail="Agente não encontrado ou não habilitado para este tenant.")
 
+    model = agent.llm_model or "gpt-4.1-mini"
+    system_prompt = agent.purpose or "Você é um assistente prestativo."
+
+    # Orçamento de tokens do modelo: system prompt + mensagem atual precisam caber
+    prompt_builder = PromptBuilder.for_model(db, model)
+    try:
+        prompt_builder.require(system_prompt, payload.message)
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
     context_blocks, hits = ([], 0)
     if agent.use_rag:
         context_blocks, hits = rag_search(db, tenant_id=tenant_id, agent_id=agent.id, query=payload.message)
 
-    messages = [{"role": "system", "content": agent.purpose or "Você é um assistente prestativo."}]
-
     if context_blocks:
-        ctx = "\n\n".join(context_blocks)
-        messages.append({"role": "system", "content": f"Use os seguintes trechos da base de conhecimento quando relevante:\n{ctx}"})
-
-    for msg in payload.history:
-        messages.append({"role": msg.role, "content": msg.content})
+        ctx = truncate_to_tokens("\n\n".join(context_blocks), prompt_builder.rag_budget(), model)
+        system_prompt = f"{system_prompt}\n\nUse os seguintes trechos da base de conhecimento quando relevante:\n{ctx}"
+
+    # Histórico: janela da conversa persistida (token_count já gravado), senão o enviado pelo cliente
+    conversation = None
+    if payload.conversation_id:
+        conversation = db.query(Conversation).filter(
+            Conversation.id == payload.conversation_id,
+            Conversation.tenant_id == tenant_id
+        ).first()
+
+    if conversation:
+        summary = conversation.summary
+        history = load_history_window(
+            db,
+            conversation.id,
+            after_message_id=conversation.summary_upto_message_id,
+            max_tokens=prompt_builder.max_prompt_tokens - prompt_builder.required_tokens
+        )
+    else:
+        summary = None
+        history = [{"role": msg.role, "content": msg.content} for msg in payload.history]
 
-    messages.append({"role": "user", "content": payload.message})
+    messages = prompt_builder.pack(system_prompt, history, payload.message, summary=summary)
 
     if agent.use_rag and hits == 0:
         return {
@@ -82,21 +111,28 @@ def user_chat(
         conversation_id = new_conversation.id
 
     if conversation_id:
-        user_message = ConversationMessage(conversation_id=conversation_id, role='user', content=payload.message)
+        user_message = ConversationMessage(
+            conversation_id=conversation_id, role='user', content=payload.message,
+            token_count=count_tokens(payload.message)
+        )
         db.add(user_message)
         db.commit()
 
     try:
         out = llm_chat(
             messages=messages,
-            model=agent.llm_model or "gpt-4.1-mini",
+            model=model,
             temperature=agent.temperature or 0.7
         )
 
         if conversation_id:
-            assistant_message = ConversationMessage(conversation_id=conversation_id, role='assistant', content=out)
+            assistant_message = ConversationMessage(
+                conversation_id=conversation_id, role='assistant', content=out,
+                token_count=count_tokens(out)
+            )
             db.add(assistant_message)
             db.commit()
+            background_tasks.add_task(summarize_conversation, conversation_id, model)
 
         return {"reply": out, "conversation_id": conversation_id}
 
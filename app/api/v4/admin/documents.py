@@ -2,16 +2,22 @@
 Rotas Admin v4 - Documents (Knowledge Base)
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 import os
+import uuid
 from datetime import datetime
 
 from app.core.database import get_db
 from app.models.models import Document, Agent, Membership, KnowledgeChunk
 from app.core.auth_v4 import get_current_user, CurrentUser
 from app.services.document_processor import DocumentProcessor
+from app.services.chunk_sync import sync_document_chunks
+from app.services.embedding_models import active_embedding_model
+from app.services.uploads import save_upload
+from app.services import bulk_ingest, document_reaper, lazy_vectorize
 
 router = APIRouter(prefix="/admin")
 
@@ -51,7 +57,8 @@ def list_documents(
     query = db.query(Document, Agent).join(
         Agent, Document.agent_id == Agent.id
     ).filter(
-        Document.tenant_id == current_user.tenant_id
+        Document.tenant_id == current_user.tenant_id,
+        Document.deleted_at.is_(None)
     )
     
     # Filtro por agente
@@ -74,6 +81,8 @@ def list_documents(
             "filename": doc.filename,
             "size_kb": doc.size_bytes // 1024 if doc.size_bytes else 0,
             "chunks": chunks_count,
+            "status": doc.status,
+            "vector_status": doc.vector_status,
             "created_at": doc.created_at.isoformat() if doc.created_at else None
         })
     
@@ -85,6 +94,8 @@ async def upload_document(
     file: UploadFile = File(...),
     agent_id: int = Form(...),
     tags: Optional[str] = Form(None),
+    table_mode: Optional[str] = Form(None),
+    lazy: bool = Form(False),
     current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -92,10 +103,14 @@ async def upload_document(
     Upload de documento e processamento para RAG com chunking e embeddings REAIS.
     
     Processo:
-    1. Extrai texto (PDF/TXT/DOCX)
-    2. Cria chunks (800 tokens, 200 overlap)
+    1. Extrai texto (PDF/TXT/DOCX/CSV/XLSX)
+    2. Cria chunks (800 tokens, 200 overlap; planilhas: N linhas com cabeçalho,
+       ou um chunk por registro com table_mode="record")
     3. Gera embeddings OpenAI (text-embedding-3-small)
     4. Armazena no pgvector
+    
+    Com lazy=true, o passo 3 fica para a primeira consulta ao agente (ou para o
+    backfill); até lá os chunks são encontrados por palavra-chave.
     """
     # Verificar permissão
     membership = db.query(Membership).filter(
@@ -115,16 +130,13 @@ async def upload_document(
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # Ler conteúdo do arquivo
-    content = await file.read()
-    size_bytes = len(content)
+    if table_mode and table_mode not in ["rows", "record"]:
+        raise HTTPException(status_code=400, detail="table_mode deve ser 'rows' ou 'record'")
     
-    # Salvar arquivo temporariamente
+    # Salvar arquivo em disco por streaming (413 ao passar do limite)
     storage_path = f"/tmp/orkio_docs/{current_user.tenant_id}/{file.filename}"
-    os.makedirs(os.path.dirname(storage_path), exist_ok=True)
-    
-    with open(storage_path, "wb") as f:
-        f.write(content)
+    upload = await save_upload(file, storage_path)
+    size_bytes = upload.size_bytes
     
     # Criar documento no banco com status PROCESSING
     document = Document(
@@ -134,7 +146,8 @@ async def upload_document(
         storage_path=storage_path,
         size_bytes=size_bytes,
         tags=tags,
-        status="PROCESSING"  # Indica que está sendo processado
+        status="PROCESSING",  # Indica que está sendo processado
+        vector_status="PENDING" if lazy else None
     )
     
     db.add(document)
@@ -144,31 +157,26 @@ async def upload_document(
     try:
         # Processar documento: extrair texto, chunking, embeddings
         processor = DocumentProcessor()
-        chunk_texts, chunk_embeddings = processor.process_document(storage_path, file.filename)
-        
-        # Criar chunks no banco com embeddings
-        for idx, (chunk_text, embedding) in enumerate(zip(chunk_texts, chunk_embeddings)):
-            chunk = KnowledgeChunk(
-                document_id=document.id,
-                content=chunk_text,
-                chunk_index=idx,
-                embedding=embedding  # pgvector armazena como ARRAY
-            )
-            db.add(chunk)
+        if table_mode:
+            processor.table_mode = table_mode
+        # Parsing/chunking/embeddings fora do event loop (parsing CPU-bound vai para o pool de processos)
+        chunks_count = await run_in_threadpool(
+            processor.index_document, db, document.id, storage_path, file.filename
+        )
         
         # Atualizar status do documento para READY
         document.status = "READY"
         db.commit()
         
-        chunks_count = len(chunk_texts)
-        
     except Exception as e:
-        # Em caso de erro, marcar documento como ERROR
+        # Em caso de erro, descartar o lote em andamento e marcar como ERROR;
+        # lotes já gravados ficam (retomar com POST /admin/documents/{id}/resume)
+        db.rollback()
         document.status = "ERROR"
         db.commit()
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao processar documento: {str(e)}"
+            detail=f"Erro ao processar documento (checkpoint: {document.embedded_upto} chunks): {str(e)}"
         )
     
     return {
@@ -179,19 +187,114 @@ async def upload_document(
             "filename": document.filename,
             "size_kb": size_bytes // 1024,
             "chunks": chunks_count,
+            "sha256": upload.sha256,
+            "vector_status": document.vector_status,
             "created_at": document.created_at.isoformat() if document.created_at else None
-        }
+        },
+        "parse": processor.parse_info,
+        "embedding_cache": processor.cache_stats
     }
 
 
-@router.delete("/documents/{document_id}", status_code=204)
-def delete_document(
+@router.post("/documents/bulk", response_model=dict, status_code=202)
+async def bulk_upload_documents(
+    agent_id: int = Form(...),
+    tags: Optional[str] = Form(None),
+    lazy: Optional[bool] = Form(None),
+    archive: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Ingestão em lote: um arquivo zip/tar e/ou vários arquivos no mesmo form.
+    
+    Processo:
+    1. Grava os uploads em disco por streaming
+    2. Descompacta em background, membro a membro
+    3. Cria um documento por arquivo (mesmo agente e tags) e processa em paralelo
+    4. Embeddings deduplicados em todo o lote (lazy=true: adiados até a primeira
+       consulta; padrão em BULK_LAZY_EMBEDDINGS)
+    
+    Retorna o handle do job; o progresso agregado fica em GET /admin/documents/bulk/{job_id}.
+    """
+    # Verificar permissão
+    membership = db.query(Membership).filter(
+        Membership.user_id == current_user.user_id,
+        Membership.tenant_id == current_user.tenant_id
+    ).first()
+    
+    if not membership or membership.role not in ["OWNER", "ADMIN"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    # Verificar se agente existe e pertence ao tenant
+    agent = db.query(Agent).filter(
+        Agent.id == agent_id,
+        Agent.tenant_id == current_user.tenant_id
+    ).first()
+    
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    uploads = ([archive] if archive else []) + list(files or [])
+    uploads = [upload for upload in uploads if upload.filename]
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Envie um arquivo compactado ou ao menos um arquivo")
+    
+    storage_dir = f"/tmp/orkio_docs/{current_user.tenant_id}/bulk_{uuid.uuid4().hex[:12]}"
+    sources = []
+    for index, upload in enumerate(uploads):
+        # Prefixo por posição: dois arquivos com o mesmo nome não se sobrescrevem
+        dest = os.path.join(storage_dir, f"{index:04d}_{os.path.basename(upload.filename)}")
+        if upload is archive:
+            await save_upload(upload, dest, bulk_ingest.BULK_ARCHIVE_MAX_MB * 1024 * 1024)
+        else:
+            await save_upload(upload, dest)
+        sources.append((dest, upload.filename))
+    
+    job = bulk_ingest.start_bulk_job(
+        current_user.tenant_id, agent_id, tags, sources, storage_dir,
+        lazy=bulk_ingest.BULK_LAZY_EMBEDDINGS if lazy is None else lazy
+    )
+    return job.progress()
+
+
+@router.get("/documents/bulk/{job_id}", response_model=dict)
+def get_bulk_job(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Progresso agregado de uma ingestão em lote.
+    
+    O job vive na memória do processo que o criou e expira depois de concluído
+    (BULK_JOB_TTL_MINUTES); com vários workers, ou depois disso, o status de
+    cada documento continua em GET /admin/documents.
+    """
+    job = bulk_ingest.get_job(job_id, current_user.tenant_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk job not found")
+    return job.progress()
+
+
+@router.put("/documents/{document_id}", response_model=dict)
+async def update_document(
     document_id: int,
+    file: UploadFile = File(...),
     current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Remove documento + chunks + embeddings.
+    Atualiza o conteúdo de um documento com re-vetorização incremental.
+    
+    Processo:
+    1. Re-extrai e re-chunka o novo arquivo
+    2. Compara os chunks com os existentes por content_hash
+    3. Mantém os inalterados, embeda só os novos, remove os que saíram
+    4. Reindexa as posições (tudo em uma transação)
+    
+    O novo arquivo é gravado num caminho temporário e só substitui o anterior
+    depois do commit; se algo falhar, o documento continua como estava.
     """
     # Verificar permissão
     membership = db.query(Membership).filter(
@@ -205,25 +308,199 @@ def delete_document(
     # Buscar documento
     document = db.query(Document).filter(
         Document.id == document_id,
-        Document.tenant_id == current_user.tenant_id
+        Document.tenant_id == current_user.tenant_id,
+        Document.deleted_at.is_(None)
     ).first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Deletar chunks
-    db.query(KnowledgeChunk).filter(
-        KnowledgeChunk.document_id == document_id
-    ).delete()
+    # Novo conteúdo num arquivo temporário: o atual só é substituído depois do commit
+    storage_path = document.storage_path or f"/tmp/orkio_docs/{current_user.tenant_id}/{file.filename}"
+    pending_path = f"{storage_path}.{uuid.uuid4().hex}.update"
+    upload = await save_upload(file, pending_path)
+    
+    try:
+        processor = DocumentProcessor()
+        processor.use_embedding_model(active_embedding_model(db, current_user.tenant_id))
+        chunk_texts = await run_in_threadpool(processor.extract_chunks, pending_path, file.filename)
+        
+        stats = await run_in_threadpool(
+            sync_document_chunks,
+            db,
+            document.id,
+            chunk_texts,
+            processor.embedding_spec,
+            embed_fn=processor.generate_embeddings_batch
+        )
+        
+        # Retomada e parsing lazy usam o nome para detectar o tipo (ex: pdf -> docx)
+        document.filename = file.filename
+        document.storage_path = storage_path
+        document.size_bytes = upload.size_bytes
+        document.status = "READY"
+        db.commit()
+        
+    except Exception as e:
+        # Chunks e arquivo anteriores intactos: o documento segue buscável
+        db.rollback()
+        os.remove(pending_path)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao atualizar documento: {str(e)}"
+        )
+    
+    os.replace(pending_path, storage_path)
+    
+    return {
+        "document": {
+            "id": document.id,
+            "filename": document.filename,
+            "size_kb": document.size_bytes // 1024,
+            "chunks": len(chunk_texts),
+            "sha256": upload.sha256
+        },
+        "parse": processor.parse_info,
+        "changes": stats
+    }
+
+
+@router.post("/documents/{document_id}/resume", response_model=dict)
+async def resume_document(
+    document_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Retoma a indexação de um documento interrompido a partir do checkpoint.
+    
+    Só os chunks depois de documents.embedded_upto são embedados e gravados;
+    os anteriores são mantidos (sem novo custo de embeddings).
+    """
+    # Verificar permissão
+    membership = db.query(Membership).filter(
+        Membership.user_id == current_user.user_id,
+        Membership.tenant_id == current_user.tenant_id
+    ).first()
     
-    # Deletar arquivo físico
-    if document.storage_path and os.path.exists(document.storage_path):
-        os.remove(document.storage_path)
+    if not membership or membership.role not in ["OWNER", "ADMIN"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.tenant_id == current_user.tenant_id,
+        Document.deleted_at.is_(None)
+    ).first()
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    if document.status == "READY":
+        raise HTTPException(status_code=409, detail="Documento já está indexado")
+    
+    if not document.storage_path or not os.path.exists(document.storage_path):
+        raise HTTPException(status_code=410, detail="Arquivo original não está mais disponível")
     
-    # Deletar documento
-    db.delete(document)
+    document.status = "PROCESSING"
     db.commit()
     
+    try:
+        processor = DocumentProcessor()
+        chunks_count = await run_in_threadpool(
+            processor.index_document, db, document.id, document.storage_path, document.filename
+        )
+        
+        document.status = "READY"
+        db.commit()
+        
+    except Exception as e:
+        db.rollback()
+        document.status = "ERROR"
+        db.commit()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao retomar documento (checkpoint: {document.embedded_upto} chunks): {str(e)}"
+        )
+    
+    return {
+        "document": {
+            "id": document.id,
+            "filename": document.filename,
+            "chunks": chunks_count,
+            "resumed_from": processor.resumed_from,
+        },
+        "parse": processor.parse_info,
+        "embedding_cache": processor.cache_stats
+    }
+
+
+@router.post("/documents/{document_id}/vectorize", response_model=dict, status_code=202)
+def vectorize_document(
+    document_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Antecipa a vetorização de um documento lazy (em background, prioridade de ingestão).
+    """
+    # Verificar permissão
+    membership = db.query(Membership).filter(
+        Membership.user_id == current_user.user_id,
+        Membership.tenant_id == current_user.tenant_id
+    ).first()
+    
+    if not membership or membership.role not in ["OWNER", "ADMIN"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.tenant_id == current_user.tenant_id,
+        Document.deleted_at.is_(None)
+    ).first()
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    if document.vector_status not in ["PENDING", "RUNNING"]:
+        raise HTTPException(status_code=409, detail="Documento não está pendente de vetorização")
+    
+    lazy_vectorize.request_vectorization([document.id])
+    return {"document_id": document.id, "vector_status": document.vector_status}
+
+
+@router.delete("/documents/{document_id}", status_code=204)
+def delete_document(
+    document_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Remove documento + chunks + embeddings.
+    
+    O documento sai da busca na hora (soft delete); chunks, embeddings e
+    arquivo são apagados em background pelo reaper (services/document_reaper.py).
+    """
+    # Verificar permissão
+    membership = db.query(Membership).filter(
+        Membership.user_id == current_user.user_id,
+        Membership.tenant_id == current_user.tenant_id
+    ).first()
+    
+    if not membership or membership.role not in ["OWNER", "ADMIN"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    
+    # Buscar documento
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.tenant_id == current_user.tenant_id,
+        Document.deleted_at.is_(None)
+    ).first()
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    document_reaper.mark_deleted(db, document)
+    
     return None
 
 
@@ -248,7 +525,8 @@ def get_document_chunks(
     # Buscar documento
     document = db.query(Document).filter(
         Document.id == document_id,
-        Document.tenant_id == current_user.tenant_id
+        Document.tenant_id == current_user.tenant_id,
+        Document.deleted_at.is_(None)
     ).first()
     
     if not document:
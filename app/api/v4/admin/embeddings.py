@@ -0,0 +1,159 @@
+"""
+Rotas Admin v4 - Embeddings (backends e re-embedding do corpus do tenant)
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+
+from app.core.database import get_db
+from app.models.models import EmbeddingMigration, Membership
+from app.core.auth_v4 import get_current_user, CurrentUser
+from app.services import reembed
+from app.services.embedding_backends import backend_name, backend_stats
+from app.services.embedding_models import EMBEDDING_MODELS, active_embedding_model
+from app.services.embedding_scheduler import limiter_stats
+
+router = APIRouter(prefix="/admin")
+
+
+class ReembedRequest(BaseModel):
+    model: str
+
+
+def _require_admin(db: Session, current_user: CurrentUser):
+    membership = db.query(Membership).filter(
+        Membership.user_id == current_user.user_id,
+        Membership.tenant_id == current_user.tenant_id
+    ).first()
+
+    if not membership or membership.role not in ["OWNER", "ADMIN"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+
+
+def _get_migration(db: Session, migration_id: int, tenant_id: int) -> EmbeddingMigration:
+    migration = db.query(EmbeddingMigration).filter(
+        EmbeddingMigration.id == migration_id,
+        EmbeddingMigration.tenant_id == tenant_id
+    ).first()
+    if not migration:
+        raise HTTPException(status_code=404, detail="Re-embedding not found")
+    return migration
+
+
+@router.get("/embeddings/backends", response_model=dict)
+def get_embedding_backends(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Modelo ativo do tenant, backend usado e métricas (throughput local em
+    chunks/s, limites de rate das APIs).
+    """
+    _require_admin(db, current_user)
+    spec = active_embedding_model(db, current_user.tenant_id)
+    return {
+        "active_model": spec.name,
+        "backend": backend_name(spec),
+        "models": {
+            name: {"dim": model.dim, "provider": model.provider, "column": model.column}
+            for name, model in EMBEDDING_MODELS.items()
+        },
+        "backends": backend_stats(),
+        "rate_limits": limiter_stats(),
+    }
+
+
+@router.get("/embeddings/estimate", response_model=dict)
+def estimate_reembed(
+    model: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Estimativa de chunks, tokens, custo e tempo para migrar o tenant para `model`.
+    """
+    _require_admin(db, current_user)
+    if model not in EMBEDDING_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown embedding model: {model}")
+
+    stats = reembed.estimate(db, model, current_user.tenant_id)
+    stats["active_model"] = active_embedding_model(db, current_user.tenant_id).name
+    return stats
+
+
+@router.post("/embeddings/reembed", response_model=dict, status_code=202)
+def start_reembed(
+    request: ReembedRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Re-embeda o corpus do tenant no modelo pedido, em background.
+
+    A busca continua no modelo atual até o fim; então o modelo ativo do tenant
+    é trocado de uma vez. Progresso em GET /admin/embeddings/reembed/{id}.
+    """
+    _require_admin(db, current_user)
+    if request.model not in EMBEDDING_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown embedding model: {request.model}")
+
+    try:
+        migration = reembed.create_migration(db, request.model, current_user.tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    reembed.start_migration(migration.id)
+    return reembed.progress(migration)
+
+
+@router.get("/embeddings/reembed/{migration_id}", response_model=dict)
+def get_reembed(
+    migration_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Progresso, custo acumulado e ETA de um re-embedding do tenant.
+    """
+    _require_admin(db, current_user)
+    return reembed.progress(_get_migration(db, migration_id, current_user.tenant_id))
+
+
+@router.post("/embeddings/reembed/{migration_id}/resume", response_model=dict, status_code=202)
+def resume_reembed(
+    migration_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Retoma um re-embedding interrompido a partir do checkpoint: ERROR, CANCELLED
+    ou PENDING/RUNNING sem heartbeat recente (processo reiniciado no meio).
+    """
+    _require_admin(db, current_user)
+    migration = _get_migration(db, migration_id, current_user.tenant_id)
+    if not reembed.claim_resume(db, migration.id):
+        db.refresh(migration)
+        raise HTTPException(status_code=409, detail=f"Re-embedding is {migration.status}")
+
+    db.refresh(migration)
+    reembed.start_migration(migration.id)
+    return reembed.progress(migration)
+
+
+@router.post("/embeddings/reembed/{migration_id}/cancel", response_model=dict)
+def cancel_reembed(
+    migration_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Interrompe o re-embedding depois dos lotes em andamento (o modelo ativo não muda).
+    """
+    _require_admin(db, current_user)
+    migration = _get_migration(db, migration_id, current_user.tenant_id)
+    if migration.status not in ["PENDING", "RUNNING"]:
+        raise HTTPException(status_code=409, detail=f"Re-embedding is {migration.status}")
+
+    migration.status = "CANCELLED"
+    db.commit()
+    return reembed.progress(migration)
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import AsyncGenerator
@@ -10,6 +11,9 @@ from app.core.database import get_db
 from app.models.models import Conversation, ConversationMessage, Agent
 from app.core.auth_v4 import get_current_user, CurrentUser
 from app.services.rag_service import RAGService
+from app.services.prompt_builder import PromptBuilder, PromptTooLargeError
+from app.services.conversation_memory import load_history_window, summarize_conversation
+from app.services.tokenizer import count_tokens
 
 router = APIRouter(prefix="/chat")
 
@@ -51,11 +55,23 @@ async def chat_stream(
     agent_model = agent.model or "gpt-4.1-mini"
     agent_id = agent.id
     
+    # Memória da conversa: resumo persistido + mensagens ainda não resumidas
+    conversation_summary = conversation.summary
+    summary_upto_message_id = conversation.summary_upto_message_id
+    
+    # Orçamento de tokens do modelo: system prompt + mensagem atual precisam caber
+    prompt_builder = PromptBuilder.for_model(db, agent_model)
+    try:
+        prompt_builder.require(agent_system_prompt, request.message)
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
     # Salvar mensagem do usuário
     user_msg = ConversationMessage(
         conversation_id=request.conversation_id,
         role="user",
-        content=request.message
+        content=request.message,
+        token_count=count_tokens(request.message)
     )
     db.add(user_msg)
     db.commit()
@@ -63,15 +79,17 @@ async def chat_stream(
     user_msg_id = user_msg.id
     
     # 🔥 RAG: Buscar contexto relevante e aumentar o system prompt
-    rag_service = RAGService(db)
+    rag_service = RAGService(db, tenant_id=current_user.tenant_id)
     rag_sources = []
     try:
         augmented_system_prompt, chunks_used, rag_sources = rag_service.retrieve_and_augment(
             query=request.message,
+            tenant_id=current_user.tenant_id,
             agent_id=agent_id,
             conversation_id=request.conversation_id,
             message_id=user_msg_id,
-            original_system_prompt=agent_system_prompt
+            original_system_prompt=agent_system_prompt,
+            max_context_tokens=prompt_builder.rag_budget()
         )
         print(f"[RAG] Chunks usados: {chunks_used}, Sources: {rag_sources}")
     except Exception as e:
@@ -83,24 +101,23 @@ async def chat_stream(
     async def generate_stream() -> AsyncGenerator[str, None]:
         """Gera stream SSE com pseudo-streaming"""
         try:
-            # Buscar histórico de mensagens
-            messages = db.query(ConversationMessage).filter(
-                ConversationMessage.conversation_id == request.conversation_id
-            ).order_by(ConversationMessage.created_at).all()
-            
-            # Preparar mensagens para OpenAI com RAG
-            openai_messages = [
-                {"role": "system", "content": augmented_system_prompt}
-            ]
+            # Buscar janela recente do histórico (sem a mensagem atual, que entra por último)
+            history = load_history_window(
+                db,
+                request.conversation_id,
+                after_message_id=summary_upto_message_id,
+                exclude_message_id=user_msg_id,
+                max_tokens=prompt_builder.max_prompt_tokens - prompt_builder.required_tokens
+            )
             
-            for msg in messages:
-                openai_messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
+            # Preparar mensagens para OpenAI com RAG + resumo dentro do orçamento de tokens
+            openai_messages = prompt_builder.pack(
+                augmented_system_prompt, history, request.message, summary=conversation_summary
+            )
             
             # Chamar OpenAI SEM streaming
-            print(f"[DEBUG] Chamando OpenAI (NON-streaming) com {len(openai_messages)} mensagens")
+            print(f"[DEBUG] Chamando OpenAI (NON-streaming) com {len(openai_messages)} mensagens, "
+                  f"{prompt_builder.prompt_tokens} tokens ({prompt_builder.history_dropped} mensagens antigas descartadas)")
             
             from openai import OpenAI
             client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -134,7 +151,8 @@ async def chat_stream(
             assistant_msg = ConversationMessage(
                 conversation_id=request.conversation_id,
                 role="assistant",
-                content=full_response
+                content=full_response,
+                token_count=count_tokens(full_response)
             )
             db.add(assistant_msg)
             db.commit()
@@ -155,6 +173,8 @@ async def chat_stream(
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no"  # Desabilitar buffering do nginx
-        }
+        },
+        # Após enviar a resposta, dobrar mensagens antigas no resumo da conversa
+        background=BackgroundTask(summarize_conversation, request.conversation_id, agent_model)
     )
 
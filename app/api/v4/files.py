@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.core.auth_v4 import get_current_user, CurrentUser
 from app.models.models import Conversation
+from app.services.uploads import save_upload
 import os
 import uuid
 from datetime import datetime
@@ -63,30 +64,20 @@ async def upload_file(
             detail=f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Ler conteúdo do arquivo
-    content = await file.read()
-    
-    # Validar tamanho
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE / 1024 / 1024}MB"
-        )
-    
     # Gerar nome único
     file_id = str(uuid.uuid4())
     safe_filename = f"{file_id}{ext}"
     file_path = os.path.join(UPLOAD_DIR, safe_filename)
     
-    # Salvar arquivo
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Salvar arquivo por streaming (413 assim que passar de MAX_FILE_SIZE)
+    upload = await save_upload(file, file_path, MAX_FILE_SIZE)
     
     # Retornar informações do arquivo
     return {
         "file_id": file_id,
         "filename": filename,
-        "size": len(content),
+        "size": upload.size_bytes,
+        "sha256": upload.sha256,
         "content_type": file.content_type,
         "path": file_path,
         "uploaded_at": datetime.utcnow().isoformat()
@@ -2,6 +2,7 @@
 Rotas User v4 - Document Processing (RAG)
 """
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List
 import traceback
@@ -32,7 +33,8 @@ async def process_document(
         # Buscar documento
         document = db.query(Document).filter(
             Document.id == document_id,
-            Document.tenant_id == current_user._tenant_id
+            Document.tenant_id == current_user._tenant_id,
+            Document.deleted_at.is_(None)
         ).first()
         
         if not document:
@@ -58,23 +60,15 @@ async def process_document(
         processor = DocumentProcessor()
         
         try:
-            chunk_texts, embeddings = processor.process_document(
+            # Parsing/chunking/embeddings fora do event loop
+            chunks_created = await run_in_threadpool(
+                processor.index_document,
+                db,
+                document.id,
                 document.storage_path,
                 document.filename
             )
             
-            # Salvar chunks no banco
-            chunks_created = 0
-            for i, (text, embedding) in enumerate(zip(chunk_texts, embeddings)):
-                chunk = KnowledgeChunk(
-                    document_id=document.id,
-                    content=text,
-                    embedding=embedding,
-                    chunk_index=i
-                )
-                db.add(chunk)
-                chunks_created += 1
-            
             # Atualizar documento
             document.status = "COMPLETED"
             document.chunks_count = chunks_created
@@ -84,11 +78,13 @@ async def process_document(
                 "message": "Document processed successfully",
                 "document_id": document_id,
                 "status": "COMPLETED",
-                "chunks_count": chunks_created
+                "chunks_count": chunks_created,
+                "embedding_cache": processor.cache_stats
             }
             
         except Exception as e:
-            # Erro no processamento
+            # Erro no processamento (descarta chunks parciais)
+            db.rollback()
             document.status = "ERROR"
             document.error_message = str(e)
             db.commit()
@@ -116,7 +112,8 @@ async def list_documents(
     Lista todos os documentos do tenant do usuário.
     """
     documents = db.query(Document).filter(
-        Document.tenant_id == current_user._tenant_id
+        Document.tenant_id == current_user._tenant_id,
+        Document.deleted_at.is_(None)
     ).order_by(Document.created_at.desc()).all()
     
     return {
@@ -147,7 +144,8 @@ async def get_document_chunks(
     # Verificar se documento existe e pertence ao tenant
     document = db.query(Document).filter(
         Document.id == document_id,
-        Document.tenant_id == current_user._tenant_id
+        Document.tenant_id == current_user._tenant_id,
+        Document.deleted_at.is_(None)
     ).first()
     
     if not document:
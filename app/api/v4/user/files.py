@@ -11,6 +11,8 @@ import uuid
 
 from app.core.deps import get_db, get_current_user, get_current_user_tenant
 from app.models.models import Document, Conversation, User, ConversationMessage
+from app.services.tokenizer import count_tokens
+from app.services.uploads import save_upload
 
 router = APIRouter()
 
@@ -26,18 +28,14 @@ async def upload_file(
     db: Session = Depends(get_db)
 ):
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
-    contents = await file.read()
-    file_size = len(contents)
-
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"Arquivo muito grande. O máximo é 50MB.")
 
     file_extension = os.path.splitext(file.filename)[1]
     unique_filename = f"{uuid.uuid4()}{file_extension}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
 
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    # Streaming para o disco; 413 assim que passar do limite
+    upload = await save_upload(file, file_path, MAX_FILE_SIZE)
+    file_size = upload.size_bytes
 
     document = Document(
         tenant_id=tenant_id,
@@ -59,10 +57,12 @@ async def upload_file(
             raise HTTPException(status_code=404, detail="Conversa não encontrada.")
         
         # Adiciona uma mensagem ao chat informando sobre o upload
+        content = f"Arquivo '{file.filename}' foi enviado com sucesso."
         message = ConversationMessage(
             conversation_id=conversation_id,
             role="system",
-            content=f"Arquivo '{file.filename}' foi enviado com sucesso."
+            content=content,
+            token_count=count_tokens(content)
         )
         db.add(message)
         db.commit()
@@ -73,6 +73,7 @@ async def upload_file(
         "url": f"/v4/user/files/{document.id}",
         "status": "uploaded",
         "size_kb": round(file_size / 1024, 2),
+        "sha256": upload.sha256,
         "created_at": document.created_at.isoformat()
     }
 
@@ -84,7 +85,7 @@ async def download_file(
     db: Session = Depends(get_db)
 ):
     document = db.query(Document).filter(
-        Document.id == file_id, Document.tenant_id == tenant_id
+        Document.id == file_id, Document.tenant_id == tenant_id, Document.deleted_at.is_(None)
     ).first()
 
     if not document:
@@ -69,7 +69,8 @@ async def get_rag_stats(
     from app.models.models import Document, KnowledgeChunk
     
     total_docs = db.query(Document).filter(
-        Document.tenant_id == current_user._tenant_id
+        Document.tenant_id == current_user._tenant_id,
+        Document.deleted_at.is_(None)
     ).count()
     
     processed_docs = db.query(Document).filter(
@@ -78,7 +79,8 @@ async def get_rag_stats(
     ).count()
     
     total_chunks = db.query(KnowledgeChunk).join(Document).filter(
-        Document.tenant_id == current_user._tenant_id
+        Document.tenant_id == current_user._tenant_id,
+        Document.deleted_at.is_(None)
     ).count()
     
     return {
@@ -129,3 +129,9 @@ def seed():
 def on_startup():
     # Schema gerenciado via Alembic migrations
     seed()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Encerra os workers do pool de parsing
+    from app.services import parsing_pool
+    parsing_pool.shutdown()
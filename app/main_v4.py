@@ -9,10 +9,11 @@ from app.core.config import settings
 from app.core.database import SessionLocal
 from app.models.models import Tenant, User, Membership, Agent
 from app.core.security import get_password_hash
+from app.services import document_reaper, parsing_pool
 
 # Importar rotas v4
 from app.api.v4 import auth, agents, conversations, chat, password_reset
-from app.api.v4.admin import users as admin_users, agents as admin_agents, documents as admin_documents, agent_links as admin_agent_links, users_approval as admin_users_approval, tenants as admin_tenants, audit_logs as admin_audit_logs, llm_providers as admin_llm
+from app.api.v4.admin import users as admin_users, agents as admin_agents, documents as admin_documents, agent_links as admin_agent_links, users_approval as admin_users_approval, tenants as admin_tenants, audit_logs as admin_audit_logs, llm_providers as admin_llm, embeddings as admin_embeddings
 
 app = FastAPI(
     title="ORKIO API v4.0",
@@ -51,6 +52,7 @@ app.include_router(admin_users.router, prefix=settings.API_V1_STR, tags=["admin-
 app.include_router(admin_users_approval.router, prefix=settings.API_V1_STR, tags=["admin-users-approval"])
 app.include_router(admin_agents.router, prefix=settings.API_V1_STR, tags=["admin-agents"])
 app.include_router(admin_documents.router, prefix=settings.API_V1_STR, tags=["admin-documents"])
+app.include_router(admin_embeddings.router, prefix=settings.API_V1_STR, tags=["admin-embeddings"])
 app.include_router(admin_agent_links.router, prefix=settings.API_V1_STR, tags=["admin-agent-links"])
 app.include_router(admin_tenants.router, prefix=settings.API_V1_STR, tags=["admin-tenants"])
 app.include_router(admin_audit_logs.router, prefix=settings.API_V1_STR, tags=["admin-audit-logs"])
@@ -134,4 +136,12 @@ def seed():
 def on_startup():
     # Schema gerenciado via Alembic migrations
     seed()
+    # Remoção em background dos documentos deletados (soft delete)
+    document_reaper.start_reaper()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Encerra os workers de parsing (senão sobrevivem ao processo da API)
+    parsing_pool.shutdown()
 
@@ -11,6 +11,7 @@ from .models import (
     Agent,
     Document,
     KnowledgeChunk,
+    EmbeddingCache,
     Conversation,
     ConversationMessage,
     RAGEvent,
@@ -27,6 +28,7 @@ __all__ = [
     "Agent",
     "Document",
     "KnowledgeChunk",
+    "EmbeddingCache",
     "Conversation",
     "ConversationMessage",
     "RAGEvent",
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, JSON, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, BigInteger, String, Float, Boolean, Text, DateTime, ForeignKey, JSON, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 from pgvector.sqlalchemy import Vector
@@ -21,6 +22,7 @@ class Tenant(Base):
     is_active = Column(Boolean, server_default="true", nullable=False)
     default_provider = Column(String(50), nullable=True)  # openai, anthropic, google, etc.
     allowed_models = Column(JSON, nullable=True)  # Lista de modelos permitidos para este tenant
+    embedding_model = Column(String(100), nullable=True)  # Modelo de embedding ativo (NULL = EMBEDDINGS_MODEL)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
@@ -80,7 +82,11 @@ class Document(Base):
     filename = Column(Text, nullable=False)
     storage_path = Column(Text, nullable=True)
     size_bytes = Column(Integer, nullable=True)
-    status = Column(Text, server_default="PENDING", nullable=False)  # PENDING, PROCESSING, READY, ERROR
+    status = Column(Text, server_default="PENDING", nullable=False)  # PENDING, PROCESSING, READY, ERROR, DELETED
+    embedded_upto = Column(Integer, server_default="0", nullable=False)  # Checkpoint: chunks [0, n) já gravados (com embedding, exceto em modo lazy)
+    vector_status = Column(Text, nullable=True)  # Modo lazy: PENDING, RUNNING, READY (NULL = embeddings na ingestão)
+    vector_requested_at = Column(DateTime, nullable=True)  # Início da vetorização lazy em andamento
+    deleted_at = Column(DateTime, nullable=True)  # Soft delete: chunks e arquivo removidos em background (document_reaper)
     tags = Column(Text, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     
@@ -94,10 +100,50 @@ class KnowledgeChunk(Base):
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     content = Column(Text, nullable=False)
     chunk_index = Column(Integer, server_default="0", nullable=False)
-    embedding = Column(Vector(1536))
+    token_count = Column(Integer, nullable=True)  # Calculado na inserção (tokenizer cl100k_base)
+    content_hash = Column(String(64), nullable=True)  # sha256 hex do conteúdo (diff na atualização)
+    embedding_model = Column(String(100), nullable=True)  # Modelo que gerou o embedding na ingestão
+    # Uma coluna por modelo registrado (ver services/embedding_models.py)
+    embedding = Column(Vector(1536))  # text-embedding-3-small
+    embedding_large = Column(Vector(3072))  # text-embedding-3-large
+    embedding_local = Column(Vector(384))  # modelo local ONNX (paraphrase-multilingual-MiniLM-L12-v2)
+    # Busca por palavra-chave (chunks ainda sem vetor); gerada pelo Postgres
+    content_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('portuguese', content)", persisted=True)))
     created_at = Column(DateTime, server_default=func.now())
     
     document = relationship("Document", back_populates="chunks")
+    
+    __table_args__ = (Index("ix_knowledge_chunks_document_id_content_hash", "document_id", "content_hash"),)
+
+class EmbeddingCache(Base):
+    """Cache de embeddings endereçado por conteúdo: (modelo, sha256 do texto do chunk)."""
+    __tablename__ = "embedding_cache"
+    id = Column(Integer, primary_key=True)
+    model = Column(String(100), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # sha256 hex do texto
+    embedding = Column(Vector(), nullable=False)  # dimensão depende do modelo
+    created_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (UniqueConstraint("model", "content_hash", name="uq_embedding_cache_model_hash"),)
+
+class EmbeddingMigration(Base):
+    """Re-embedding do corpus (de um tenant ou de todos) para outro modelo/coluna."""
+    __tablename__ = "embedding_migrations"
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)  # NULL = todos os tenants
+    target_model = Column(String(100), nullable=False)
+    status = Column(Text, server_default="PENDING", nullable=False)  # PENDING, RUNNING, COMPLETED, ERROR, CANCELLED
+    chunks_total = Column(Integer, server_default="0", nullable=False)
+    chunks_done = Column(Integer, server_default="0", nullable=False)
+    tokens_total = Column(BigInteger, server_default="0", nullable=False)
+    tokens_done = Column(BigInteger, server_default="0", nullable=False)
+    estimated_cost_usd = Column(Float, nullable=True)
+    last_chunk_id = Column(Integer, server_default="0", nullable=False)  # checkpoint (keyset por id)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # atualizado a cada lote; parado há muito = processo morreu
 
 # ===== CONVERSATIONS =====
 
@@ -107,6 +153,9 @@ class Conversation(Base):
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
     agent_id = Column(Integer, ForeignKey("agents.id"), nullable=False)
     title = Column(Text)
+    summary = Column(Text, nullable=True)  # Resumo das mensagens antigas (memória de longo prazo)
+    summary_upto_message_id = Column(Integer, nullable=True)  # Última mensagem incluída no resumo
+    summary_updated_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     
     tenant = relationship("Tenant", back_populates="conversations")
@@ -120,8 +169,11 @@ class ConversationMessage(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(Text, nullable=False)  # "user" | "assistant"
     content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=True)  # Calculado na inserção (tokenizer cl100k_base)
     created_at = Column(DateTime, server_default=func.now())
     
+    __table_args__ = (Index("ix_conversation_messages_conversation_id_id", "conversation_id", "id"),)
+    
     conversation = relationship("Conversation", back_populates="messages")
 
 class RAGEvent(Base):
@@ -7,6 +7,8 @@ import logging
 import os
 from typing import List
 from openai import OpenAI
+from app.services.chunker import iter_chunks
+from app.services.embedding_models import get_embedding_model, embed_texts
 
 logger = logging.getLogger(__name__)
 
@@ -15,45 +17,26 @@ client = OpenAI(
     base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
 )
 
-EMBEDDING_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-large")
+# Modelo ativo do registro (EMBEDDINGS_MODEL): define dimensão e coluna de destino
+EMBEDDING_SPEC = get_embedding_model()
+EMBEDDING_MODEL = EMBEDDING_SPEC.name
 
 
-def split_into_chunks(text: str, chunk_size: int = 1500, overlap: int = 200) -> List[str]:
+def split_into_chunks(text: str, chunk_size: int = 400, overlap: int = 50) -> List[str]:
     """
     Split text into overlapping chunks
-    v3.7.0: Chunk size 1.5k tokens (~2k chars)
+    v4.5: Sizes in tokens (~1.5k chars), cut at paragraph/sentence boundaries
     """
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        
-        start = end - overlap
-    
-    return chunks
+    return [chunk.text.strip() for chunk in iter_chunks(text, chunk_size, overlap)]
 
 
 def get_embedding(text: str) -> List[float]:
     """
     Get embedding vector from OpenAI
-    v3.7.0: Using text-embedding-3-large (3072 dimensions)
+    v3.7.0: Model/dimensions from the embedding registry
+    v4.5: Rate-limited by the embedding scheduler; errors propagate (no zero vectors)
     """
-    try:
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text
-        )
-        return response.data[0].embedding
-    
-    except Exception as e:
-        logger.error(f"Embedding API error: {e}")
-        # Return stub vector (3072 dimensions for text-embedding-3-large)
-        return [0.0] * 3072
+    return embed_texts([text], EMBEDDING_SPEC)[0]
 
 
 def vectorize_text(text: str) -> tuple[List[str], List[List[float]]]:
@@ -62,11 +45,7 @@ def vectorize_text(text: str) -> tuple[List[str], List[List[float]]]:
     Returns: (chunks, embeddings)
     """
     chunks = split_into_chunks(text)
-    embeddings = []
-    
-    for chunk in chunks:
-        embedding = get_embedding(chunk)
-        embeddings.append(embedding)
+    embeddings = embed_texts(chunks, EMBEDDING_SPEC)
     
     return chunks, embeddings
 
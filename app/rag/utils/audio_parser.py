@@ -1,12 +1,16 @@
 """
 RAG Audio Parser - ORKIO v3.7.0
 Parser para áudio/vídeo com Whisper API
+v4.5: segmentação por silêncio (ffmpeg), transcrição concorrente, texto com timestamps
 """
 
 import logging
 import os
+import re
 import subprocess
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Tuple
 from openai import OpenAI
 
 logger = logging.getLogger(__name__)
@@ -20,19 +24,160 @@ client = OpenAI(
 )
 
 
+# Segmentação por silêncio
+SEGMENT_TARGET_SECONDS = int(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", 600))
+SEGMENT_TOLERANCE = float(os.getenv("TRANSCRIBE_SEGMENT_TOLERANCE", 0.25))
+SILENCE_NOISE_DB = os.getenv("TRANSCRIBE_SILENCE_DB", "-30dB")
+SILENCE_MIN_SECONDS = float(os.getenv("TRANSCRIBE_SILENCE_SECONDS", 0.5))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", 4))
+# mp3 mono 16 kHz 64 kbps: ~4.8 MB por 10 min, abaixo do limite de 25 MB do Whisper
+SEGMENT_BITRATE = os.getenv("TRANSCRIBE_BITRATE", "64k")
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_SILENCE_START_RE = re.compile(r"silence_start:\s*(-?\d+(?:\.\d+)?)")
+_SILENCE_END_RE = re.compile(r"silence_end:\s*(\d+(?:\.\d+)?)")
+
+
+@dataclass(frozen=True)
+class AudioSegment:
+    index: int
+    start: float
+    end: float
+
+
+def _format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def detect_silences(file_path: str) -> Tuple[float, List[float]]:
+    """
+    Uma passada do ffmpeg (silencedetect, saída descartada) sobre o arquivo.
+    
+    Returns:
+        (duração em segundos, pontos de corte = meio de cada silêncio)
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", file_path,
+        "-vn",
+        "-af", f"silencedetect=noise={SILENCE_NOISE_DB}:d={SILENCE_MIN_SECONDS}",
+        "-f", "null", "-"
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return _parse_silencedetect(result.stderr)
+
+
+def _parse_silencedetect(stderr: str) -> Tuple[float, List[float]]:
+    match = _DURATION_RE.search(stderr)
+    if not match:
+        raise ValueError("Could not read media duration")
+    hours, minutes, seconds = match.groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    
+    starts = [max(0.0, float(value)) for value in _SILENCE_START_RE.findall(stderr)]
+    ends = [float(value) for value in _SILENCE_END_RE.findall(stderr)]
+    cut_points = [(start + end) / 2 for start, end in zip(starts, ends)]
+    return duration, cut_points
+
+
+def plan_segments(
+    duration: float,
+    cut_points: List[float],
+    target: float = SEGMENT_TARGET_SECONDS,
+    tolerance: float = SEGMENT_TOLERANCE
+) -> List[AudioSegment]:
+    """
+    Segmentos de ~`target` segundos cortados no silêncio mais próximo do alvo
+    (dentro de ±tolerance); sem silêncio na faixa, corta exatamente no alvo.
+    """
+    segments = []
+    start = 0.0
+    while duration - start > target * (1 + tolerance):
+        ideal = start + target
+        candidates = [
+            point for point in cut_points
+            if ideal - target * tolerance <= point <= ideal + target * tolerance
+        ]
+        end = min(candidates, key=lambda point: abs(point - ideal)) if candidates else ideal
+        segments.append(AudioSegment(len(segments), start, end))
+        start = end
+    segments.append(AudioSegment(len(segments), start, duration))
+    return segments
+
+
+def _extract_segment(file_path: str, segment: AudioSegment) -> bytes:
+    """Trecho do áudio em mp3 mono, lido do stdout do ffmpeg (sem arquivo temporário)."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error",
+        "-ss", f"{segment.start:.3f}",
+        "-t", f"{segment.end - segment.start:.3f}",
+        "-i", file_path,
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-acodec", "libmp3lame", "-b:a", SEGMENT_BITRATE,
+        "-f", "mp3", "pipe:1"
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return result.stdout
+
+
+def _transcribe_segment(file_path: str, segment: AudioSegment) -> List[Tuple[float, str]]:
+    """Transcreve um segmento; timestamps já deslocados para o tempo do arquivo."""
+    audio = _extract_segment(file_path, segment)
+    transcript = client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(f"segment_{segment.index:04d}.mp3", audio),
+        response_format="verbose_json"
+    )
+    parts = getattr(transcript, "segments", None) or []
+    if not parts:
+        return [(segment.start, (transcript.text or "").strip())]
+    return [
+        (segment.start + _part_start(part), _part_text(part).strip())
+        for part in parts
+    ]
+
+
+def _part_start(part) -> float:
+    return float(part["start"] if isinstance(part, dict) else part.start)
+
+
+def _part_text(part) -> str:
+    return part["text"] if isinstance(part, dict) else part.text
+
+
+def transcribe_media(file_path: str, concurrency: int = TRANSCRIBE_CONCURRENCY) -> str:
+    """
+    Transcreve áudio ou vídeo longo:
+    1. ffmpeg detecta silêncios (uma passada, sem gravar áudio)
+    2. Segmentos de ~TRANSCRIBE_SEGMENT_SECONDS cortados em silêncio
+    3. Cada segmento sai do ffmpeg por pipe e vai ao Whisper, `concurrency` por vez
+    4. Texto reunido na ordem, com timestamps [hh:mm:ss]
+    """
+    duration, cut_points = detect_silences(file_path)
+    segments = plan_segments(duration, cut_points)
+    logger.info(f"Transcribing {duration:.0f}s in {len(segments)} segments (concurrency {concurrency})")
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        # map preserva a ordem dos segmentos
+        results = executor.map(lambda segment: _transcribe_segment(file_path, segment), segments)
+        lines = [
+            f"[{_format_timestamp(start)}] {text}"
+            for parts in results
+            for start, text in parts
+            if text
+        ]
+    
+    return "\n".join(lines)
+
+
 def transcribe_audio(file_path: str) -> str:
-    """Transcribe audio with OpenAI Whisper API"""
+    """Transcribe audio with OpenAI Whisper API (segmentado por silêncio, em paralelo)"""
     if not ALLOW_AUDIO:
         raise ValueError("Audio transcription not enabled")
     
     try:
-        with open(file_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        
-        text = transcript.text
+        text = transcribe_media(file_path)
         logger.info(f"Audio transcribed: {len(text)} chars")
         return text
     
@@ -42,36 +187,15 @@ def transcribe_audio(file_path: str) -> str:
 
 
 def transcribe_video(file_path: str) -> str:
-    """Transcribe video by extracting audio and transcribing"""
+    """Transcribe video: o áudio é extraído por segmento via pipe (sem arquivo temporário)"""
     if not ALLOW_VIDEO:
         raise ValueError("Video transcription not enabled")
     
     try:
-        # Extract audio with ffmpeg
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_audio:
-            audio_path = tmp_audio.name
-        
-        cmd = [
-            "ffmpeg",
-            "-i", file_path,
-            "-vn",  # No video
-            "-acodec", "libmp3lame",
-            "-y",  # Overwrite
-            audio_path
-        ]
-        
-        subprocess.run(cmd, check=True, capture_output=True)
-        
-        # Transcribe audio
-        text = transcribe_audio(audio_path)
-        
-        # Cleanup
-        os.remove(audio_path)
-        
+        text = transcribe_media(file_path)
         logger.info(f"Video transcribed: {len(text)} chars")
         return text
     
     except Exception as e:
         logger.error(f"Video transcription failed: {e}")
         raise ValueError(f"Video transcription failed: {e}")
-
@@ -1,6 +1,7 @@
 """
 RAG OCR Parser - ORKIO v3.7.0
 Parser para imagens com OCR (pytesseract)
+v4.5: OCR por página de PDF (só páginas sem camada de texto)
 """
 
 import logging
@@ -11,17 +12,24 @@ logger = logging.getLogger(__name__)
 ALLOW_OCR = os.getenv("ALLOW_OCR", "true").lower() == "true"
 
 
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+
+
+def _ocr_image(image) -> str:
+    import pytesseract
+    return pytesseract.image_to_string(image)
+
+
 def parse_image_ocr(file_path: str) -> str:
     """Parse image com OCR (pytesseract)"""
     if not ALLOW_OCR:
         raise ValueError("OCR not enabled")
     
     try:
-        import pytesseract
         from PIL import Image
         
         image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
+        text = _ocr_image(image)
         
         logger.info(f"Image OCR: {len(text)} chars")
         return text
@@ -30,3 +38,40 @@ def parse_image_ocr(file_path: str) -> str:
         logger.error(f"OCR failed: {e}")
         raise ValueError(f"OCR failed: {e}")
 
+
+def _render_pdf_page(file_path: str, page_index: int):
+    """
+    Rasteriza a página com pypdfium2 (se instalado). Sem ele, usa as imagens
+    embutidas na página (o caso de PDFs escaneados: uma imagem por página).
+    """
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+    
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            bitmap = pdf[page_index].render(scale=OCR_DPI / 72)
+            return [bitmap.to_pil()]
+        finally:
+            pdf.close()
+    
+    from pypdf import PdfReader
+    page = PdfReader(file_path).pages[page_index]
+    return [image.image for image in page.images]
+
+
+def ocr_pdf_page(file_path: str, page_index: int) -> str:
+    """OCR de uma página de PDF sem camada de texto (page_index começa em 0)."""
+    if not ALLOW_OCR:
+        raise ValueError("OCR not enabled")
+    
+    try:
+        text = "\n".join(_ocr_image(image) for image in _render_pdf_page(file_path, page_index))
+        logger.info(f"PDF page {page_index + 1} OCR: {len(text)} chars")
+        return text
+    
+    except Exception as e:
+        logger.error(f"OCR failed on PDF page {page_index + 1}: {e}")
+        raise ValueError(f"OCR failed: {e}")
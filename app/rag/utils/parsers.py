@@ -4,69 +4,166 @@ Parsers genéricos para extração de texto de documentos
 """
 
 import logging
-from typing import Optional
+from typing import Iterator, Optional
 
 logger = logging.getLogger(__name__)
 
 
 def parse_txt(file_path: str) -> str:
-    """Parse TXT/Markdown com auto-detecção de encoding"""
-    import chardet
-    
-    with open(file_path, "rb") as f:
-        raw = f.read()
-    
-    detected = chardet.detect(raw)
-    encoding = detected.get("encoding", "utf-8") or "utf-8"
-    logger.info(f"Detected encoding: {encoding} (confidence: {detected.get('confidence', 0):.2f})")
-    
-    try:
-        content = raw.decode(encoding, errors="ignore")
-    except Exception as e:
-        logger.warning(f"Failed to decode with {encoding}, falling back to utf-8: {e}")
-        content = raw.decode("utf-8", errors="ignore")
-    
-    return content
+    """Parse TXT/Markdown com auto-detecção de encoding (UTF-8 direto, detecção por amostra)"""
+    from app.rag.utils.text_encoding import read_text
+    return read_text(file_path).text
 
 
-def parse_pdf(file_path: str) -> str:
-    """Parse PDF com pypdf, fallback para pdfminer"""
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """
+    Yield PDF text page by page (pypdf, fallback para pdfminer).
+    
+    Páginas são extraídas sob demanda: o documento inteiro nunca fica em memória.
+    Páginas sem camada de texto passam por OCR individualmente; o pdfminer só
+    roda se o pypdf não conseguir abrir o arquivo.
+    Para processar em paralelo, use services/parsing_pool.iter_pdf_pages.
+    """
+    from app.rag.utils.ocr_parser import ALLOW_OCR, ocr_pdf_page
+    
     try:
-        # Try pypdf first (faster)
         from pypdf import PdfReader
         
         reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        
-        if text.strip():
-            logger.info(f"PDF parsed with pypdf: {len(text)} chars")
-            return text
-    
+        pages = reader.pages
     except Exception as e:
         logger.warning(f"pypdf failed, trying pdfminer: {e}")
+        pages = None
+    
+    if pages is not None:
+        for number, page in enumerate(pages):
+            try:
+                page_text = page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"pypdf failed on page {number + 1}: {e}")
+                page_text = ""
+            
+            if not page_text.strip() and ALLOW_OCR:
+                try:
+                    page_text = ocr_pdf_page(file_path, number)
+                except ValueError as e:
+                    logger.warning(str(e))
+            yield page_text + "\n"
+        return
     
     # Fallback to pdfminer
     try:
-        from pdfminer.high_level import extract_text
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
         
-        text = extract_text(file_path)
-        logger.info(f"PDF parsed with pdfminer: {len(text)} chars")
-        return text
+        for page_layout in extract_pages(file_path):
+            yield "".join(
+                element.get_text() for element in page_layout
+                if isinstance(element, LTTextContainer)
+            ) + "\n"
     
     except Exception as e:
         logger.error(f"pdfminer also failed: {e}")
         raise ValueError(f"PDF parsing failed: {e}")
 
 
-def parse_docx(file_path: str) -> str:
-    """Parse DOCX com python-docx"""
-    from docx import Document
+def parse_pdf(file_path: str) -> str:
+    """Parse PDF com pypdf, fallback para pdfminer"""
+    text = "".join(iter_pdf_pages(file_path))
+    logger.info(f"PDF parsed: {len(text)} chars")
+    return text
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _docx_paragraph_text(paragraph) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == _W + "t":
+            parts.append(node.text or "")
+        elif node.tag == _W + "tab":
+            parts.append("\t")
+        elif node.tag in (_W + "br", _W + "cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def iter_docx_blocks(source) -> Iterator[str]:
+    """
+    Yield DOCX text em ordem de leitura: um bloco por parágrafo e por linha de tabela.
+    
+    Lê word/document.xml em streaming (iterparse) direto do zip, sem montar o
+    DOM do documento: elementos já processados são descartados, então a memória
+    não cresce com o tamanho do arquivo. Linhas de tabela saem como
+    "célula | célula"; tabelas aninhadas entram no texto da célula que as contém.
+    
+    Args:
+        source: caminho do arquivo ou objeto file-like (ex: BytesIO)
+    """
+    import zipfile
+    from xml.etree.ElementTree import iterparse
     
-    doc = Document(file_path)
-    paragraphs = [para.text for para in doc.paragraphs]
-    text = "\n".join(paragraphs)
+    with zipfile.ZipFile(source) as archive:
+        with archive.open("word/document.xml") as xml:
+            body = None
+            # Uma entrada por tabela aberta: linha atual e textos da célula atual
+            tables = []
+            
+            for event, elem in iterparse(xml, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    if tag == _W + "body":
+                        body = elem
+                    elif tag == _W + "tbl":
+                        tables.append({"row": [], "cell": []})
+                    continue
+                
+                if tag == _W + "p":
+                    text = _docx_paragraph_text(elem)
+                    elem.clear()
+                    if tables:
+                        tables[-1]["cell"].append(text)
+                        continue
+                    yield text
+                
+                elif tag == _W + "tc":
+                    table = tables[-1]
+                    table["row"].append(" ".join(t.strip() for t in table["cell"] if t.strip()))
+                    table["cell"] = []
+                    elem.clear()
+                    continue
+                
+                elif tag == _W + "tr":
+                    table = tables[-1]
+                    row = " | ".join(table["row"])
+                    table["row"] = []
+                    elem.clear()
+                    if len(tables) > 1:
+                        tables[-2]["cell"].append(row)
+                        continue
+                    if row.strip(" |"):
+                        yield row
+                    continue
+                
+                elif tag == _W + "tbl":
+                    tables.pop()
+                    elem.clear()
+                    if tables:
+                        continue
+                    yield ""  # linha em branco após a tabela
+                
+                else:
+                    continue
+                
+                # Bloco de nível superior emitido: solta o que o body ainda referencia
+                if body is not None:
+                    body.clear()
+
+
+def parse_docx(file_path: str) -> str:
+    """Parse DOCX (parágrafos e tabelas) em streaming"""
+    text = "\n".join(iter_docx_blocks(file_path))
     
     logger.info(f"DOCX parsed: {len(text)} chars")
     return text
@@ -0,0 +1,163 @@
+"""
+RAG Tabular Parser - ORKIO v4.5
+- CSV e XLSX lidos linha a linha (csv em streaming, openpyxl em modo read_only)
+- Chunks de N linhas com o cabeçalho repetido em cada chunk
+- Modo "record": um chunk por registro (coluna: valor)
+- Linha maior que o limite de tokens é dividida (cabeçalho repetido em cada parte)
+- Chunks e lotes de embedding crescem linearmente com o número de linhas
+"""
+
+import csv
+import logging
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TABULAR_EXTENSIONS = {"csv", "xlsx"}
+TABULAR_ROWS_PER_CHUNK = int(os.getenv("TABULAR_ROWS_PER_CHUNK", 50))
+# Limite de caracteres por chunk (linhas largas fecham o chunk antes de N linhas)
+TABULAR_MAX_CHUNK_CHARS = int(os.getenv("TABULAR_MAX_CHUNK_CHARS", 6000))
+# Limite duro por chunk (entrada do modelo de embedding é ~8k tokens)
+TABULAR_MAX_CHUNK_TOKENS = int(os.getenv("TABULAR_MAX_CHUNK_TOKENS", 2000))
+# "rows" (N linhas por chunk) ou "record" (um chunk por linha)
+TABULAR_CHUNK_MODE = os.getenv("TABULAR_CHUNK_MODE", "rows")
+
+# (nome da planilha, cabeçalho, linha)
+TableRow = Tuple[Optional[str], List[str], List[str]]
+
+
+def is_tabular(filename: str) -> bool:
+    return filename.lower().rsplit(".", 1)[-1] in TABULAR_EXTENSIONS
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("\n", " ").strip()
+
+
+def _iter_with_header(sheet: Optional[str], rows: Iterator[Sequence]) -> Iterator[TableRow]:
+    """Primeira linha não vazia vira o cabeçalho; linhas vazias são ignoradas."""
+    header = None
+    for raw in rows:
+        row = [_cell(value) for value in raw]
+        if not any(row):
+            continue
+        if header is None:
+            header = [name or f"col{index + 1}" for index, name in enumerate(row)]
+            continue
+        yield sheet, header, row
+
+
+def iter_csv_rows(file_path: str) -> Iterator[TableRow]:
+    """Linhas do CSV em streaming (encoding por amostra, delimitador detectado)."""
+    from app.rag.utils.text_encoding import sniff_file_encoding
+
+    encoding = sniff_file_encoding(file_path)
+    with open(file_path, "r", encoding=encoding, errors="replace", newline="") as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.read(64 * 1024), delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        yield from _iter_with_header(None, csv.reader(f, dialect))
+
+
+def iter_xlsx_rows(file_path: str) -> Iterator[TableRow]:
+    """Linhas de todas as planilhas do XLSX (openpyxl read_only: sem carregar o arquivo inteiro)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Suporte a XLSX requer openpyxl")
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from _iter_with_header(sheet.title, sheet.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def iter_table_rows(file_path: str, filename: str) -> Iterator[TableRow]:
+    extension = filename.lower().rsplit(".", 1)[-1]
+    if extension == "csv":
+        return iter_csv_rows(file_path)
+    if extension == "xlsx":
+        return iter_xlsx_rows(file_path)
+    raise ValueError(f"Formato tabular não suportado: {extension}")
+
+
+def _header_context(sheet: Optional[str], header: List[str]) -> str:
+    context = f"Colunas: {' | '.join(header)}"
+    return f"Planilha: {sheet}\n{context}" if sheet else context
+
+
+def _record_text(sheet: Optional[str], header: List[str], row: List[str]) -> str:
+    lines = [f"Planilha: {sheet}"] if sheet else []
+    for index, value in enumerate(row):
+        if value:
+            name = header[index] if index < len(header) else f"col{index + 1}"
+            lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def _fit_tokens(context: str, body: str, max_tokens: int) -> Iterator[str]:
+    """
+    `context` + `body` como um chunk; se passar de `max_tokens`, o corpo é
+    dividido em partes que cabem no limite, cada uma com o contexto na frente.
+    """
+    from app.services.tokenizer import get_encoder
+
+    text = f"{context}\n{body}" if context else body
+    encoder = get_encoder()
+    if len(encoder.encode_ordinary(text)) <= max_tokens:
+        yield text
+        return
+    prefix = f"{context}\n" if context else ""
+    # Contexto enorme (centenas de colunas) não pode consumir todo o orçamento
+    budget = max(max_tokens - len(encoder.encode_ordinary(prefix)), max_tokens // 2)
+    tokens = encoder.encode_ordinary(body)
+    for start in range(0, len(tokens), budget):
+        yield prefix + encoder.decode(tokens[start:start + budget])
+
+
+def iter_table_chunks(
+    rows: Iterator[TableRow],
+    rows_per_chunk: int = TABULAR_ROWS_PER_CHUNK,
+    mode: str = TABULAR_CHUNK_MODE,
+    max_chars: int = TABULAR_MAX_CHUNK_CHARS,
+    max_tokens: int = TABULAR_MAX_CHUNK_TOKENS
+) -> Iterator[str]:
+    """
+    Agrupa as linhas em chunks de texto com o contexto do cabeçalho.
+
+    mode="rows": até `rows_per_chunk` linhas (ou `max_chars`) por chunk, cada
+    chunk começando pelo cabeçalho da sua planilha. mode="record": um chunk por
+    linha no formato "coluna: valor". Nenhum chunk passa de `max_tokens`
+    (uma linha/registro maior é dividido em partes).
+    """
+    if mode == "record":
+        for sheet, header, row in rows:
+            yield from _fit_tokens("", _record_text(sheet, header, row), max_tokens)
+        return
+
+    context = None
+    lines: List[str] = []
+    size = 0
+    for sheet, header, row in rows:
+        row_context = _header_context(sheet, header)
+        line = " | ".join(row)
+        if lines and (
+            row_context != context
+            or len(lines) >= rows_per_chunk
+            or size + len(line) > max_chars
+        ):
+            yield from _fit_tokens(context, "\n".join(lines), max_tokens)
+            lines, size = [], 0
+        context = row_context
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        yield from _fit_tokens(context, "\n".join(lines), max_tokens)
+
@@ -0,0 +1,158 @@
+"""
+Detecção de encoding de texto v4.5
+- Caminho rápido: BOM, depois UTF-8 estrito (decodifica o arquivo inteiro em uma passada)
+- Senão: detecção em amostra limitada (início, meio e fim) com charset-normalizer
+- Varredura completa só quando a confiança da amostra é baixa
+- sniff_file_encoding: só a amostra, para leitores em streaming (CSV)
+"""
+
+import codecs
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Tamanho de cada trecho da amostra (início/meio/fim)
+ENCODING_SAMPLE_KB = int(os.getenv("ENCODING_SAMPLE_KB", 64))
+# Abaixo disso a detecção na amostra é descartada e o arquivo inteiro é analisado
+ENCODING_MIN_CONFIDENCE = float(os.getenv("ENCODING_MIN_CONFIDENCE", 0.9))
+# Usado quando nem a varredura completa é conclusiva (exportações Windows/Excel)
+ENCODING_FALLBACK = os.getenv("ENCODING_FALLBACK", "cp1252")
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+@dataclass(frozen=True)
+class DecodedText:
+    text: str
+    encoding: str
+    confidence: float
+    method: str  # bom, utf8, sample, full, fallback
+    seconds: float
+
+    def info(self) -> dict:
+        """Campos para o payload de eventos (ex: rag.parsed)."""
+        return {
+            "encoding": self.encoding,
+            "encoding_confidence": round(self.confidence, 3),
+            "encoding_method": self.method,
+            "decode_ms": round(self.seconds * 1000, 1),
+        }
+
+
+def _sample(raw: bytes) -> bytes:
+    """Início, meio e fim do conteúdo (o conteúdo inteiro se for pequeno)."""
+    size = ENCODING_SAMPLE_KB * 1024
+    if len(raw) <= size * 3:
+        return raw
+    middle = (len(raw) - size) // 2
+    return b"\n".join((raw[:size], raw[middle:middle + size], raw[-size:]))
+
+
+def _detect(data: bytes):
+    """(encoding, confiança) pelo charset-normalizer; chardet se ele não estiver instalado."""
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        import chardet
+        detected = chardet.detect(data)
+        return detected.get("encoding"), detected.get("confidence") or 0.0
+
+    best = from_bytes(data).best()
+    if best is None:
+        return None, 0.0
+    return best.encoding, 1.0 - best.chaos
+
+
+def decode_bytes(raw: bytes) -> DecodedText:
+    """Decodifica o conteúdo de um arquivo texto detectando o encoding."""
+    started = time.perf_counter()
+
+    def result(text: str, encoding: str, confidence: float, method: str) -> DecodedText:
+        return DecodedText(text, encoding, confidence, method, time.perf_counter() - started)
+
+    for bom, encoding in _BOMS:
+        if raw.startswith(bom):
+            return result(raw.decode(encoding, errors="ignore"), encoding, 1.0, "bom")
+
+    try:
+        return result(raw.decode("utf-8"), "utf-8", 1.0, "utf8")
+    except UnicodeDecodeError:
+        pass
+
+    encoding, confidence = _detect(_sample(raw))
+    method = "sample"
+    if not encoding or confidence < ENCODING_MIN_CONFIDENCE:
+        encoding, confidence = _detect(raw)
+        method = "full"
+
+    if encoding and confidence >= ENCODING_MIN_CONFIDENCE:
+        try:
+            return result(raw.decode(encoding, errors="ignore"), encoding, confidence, method)
+        except LookupError as e:
+            logger.warning(f"Failed to decode with {encoding}, falling back to {ENCODING_FALLBACK}: {e}")
+
+    return result(raw.decode(ENCODING_FALLBACK, errors="ignore"), ENCODING_FALLBACK, confidence, "fallback")
+
+
+def read_text(file_path: str) -> DecodedText:
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    decoded = decode_bytes(raw)
+    logger.info(
+        f"Detected encoding: {decoded.encoding} (confidence: {decoded.confidence:.2f}, "
+        f"{decoded.method}, {decoded.seconds * 1000:.1f}ms, {len(raw)} bytes)"
+    )
+    return decoded
+
+
+def _skip_continuation(piece: bytes) -> bytes:
+    """Descarta bytes de continuação UTF-8 no início de um trecho cortado no meio."""
+    start = 0
+    while start < min(len(piece), 4) and (piece[start] & 0xC0) == 0x80:
+        start += 1
+    return piece[start:]
+
+
+def sniff_file_encoding(file_path: str) -> str:
+    """
+    Encoding do arquivo a partir de uma amostra (início/meio/fim), sem ler o
+    arquivo inteiro. Para leitura em streaming: abrir com errors="replace".
+    """
+    size = ENCODING_SAMPLE_KB * 1024
+    total = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        pieces = [f.read(size)]
+        if total > size * 3:
+            f.seek((total - size) // 2)
+            pieces.append(f.read(size))
+            f.seek(total - size)
+            pieces.append(f.read(size))
+        elif total > size:
+            pieces.append(f.read())
+
+    for bom, encoding in _BOMS:
+        if pieces[0].startswith(bom):
+            return encoding
+
+    try:
+        for index, piece in enumerate(pieces):
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            decoder.decode(_skip_continuation(piece) if index else piece, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    encoding, confidence = _detect(b"\n".join(pieces))
+    logger.info(f"Sniffed encoding: {encoding} (confidence: {confidence:.2f})")
+    if not encoding or confidence < ENCODING_MIN_CONFIDENCE:
+        return ENCODING_FALLBACK
+    return encoding
@@ -0,0 +1,371 @@
+"""
+Ingestão em lote (zip/tar ou vários arquivos) v4.5
+- Arquivo compactado lido membro a membro, cada membro gravado em disco por streaming
+- Um job de ingestão por arquivo, no pipeline em estágios (services/ingest_pipeline.py)
+- Progresso agregado em um único handle (arquivos, chunks, falhas)
+- Embeddings deduplicados no lote inteiro (além do cache persistente)
+- Modo lazy: só parsing, chunking e índice de texto; embeddings sob demanda (services/lazy_vectorize.py)
+- Job concluído libera pipeline e vetores (fica só o resumo); jobs antigos expiram (TTL e limite)
+- Progresso vive só no processo que criou o job: com vários workers do uvicorn, o GET pode
+  cair em outro processo e dar 404; o estado durável é documents.status de cada document_id
+"""
+import logging
+import os
+import tarfile
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.database import SessionLocal
+from app.models.models import Document
+from app.services.document_processor import DocumentProcessor, SUPPORTED_EXTENSIONS
+from app.services.embedding_cache import content_hash
+from app.services.embedding_models import active_embedding_model
+from app.services.ingest_pipeline import IngestPipeline, IngestTask
+from app.services.uploads import store_stream
+
+logger = logging.getLogger(__name__)
+
+BULK_ARCHIVE_MAX_MB = int(os.getenv("BULK_ARCHIVE_MAX_MB", 500))
+# Limite por membro descompactado (proteção contra zip bomb)
+BULK_MEMBER_MAX_MB = int(os.getenv("BULK_MEMBER_MAX_MB", 50))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", 2000))
+# Vetores mantidos em memória para deduplicação entre documentos do lote
+BULK_SHARED_EMBEDDINGS = int(os.getenv("BULK_SHARED_EMBEDDINGS", 5000))
+# Padrão do modo lazy para lotes (arquivos frios: embeddings só quando consultados)
+BULK_LAZY_EMBEDDINGS = os.getenv("BULK_LAZY_EMBEDDINGS", "false").lower() == "true"
+# Jobs concluídos consultáveis por este tempo; no máximo BULK_MAX_JOBS concluídos em memória
+BULK_JOB_TTL_MINUTES = int(os.getenv("BULK_JOB_TTL_MINUTES", 60))
+BULK_MAX_JOBS = int(os.getenv("BULK_MAX_JOBS", 100))
+
+
+class SharedEmbeddings:
+    """
+    Deduplica embeddings entre os documentos de um lote: cada texto vai ao
+    provider uma única vez, mesmo com vários documentos processando em paralelo
+    (o segundo pedido do mesmo texto espera o primeiro). Vetores já prontos
+    ficam num LRU limitado (float32); o cache persistente cobre o resto.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], max_entries: int = BULK_SHARED_EMBEDDINGS):
+        self.embed_fn = embed_fn
+        self.max_entries = max_entries
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._done: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        hashes = [content_hash(text) for text in texts]
+        results: Dict[str, object] = {}
+        owned: Dict[str, Future] = {}
+        with self._lock:
+            for key in hashes:
+                if key in results or key in owned:
+                    continue
+                if key in self._done:
+                    self._done.move_to_end(key)
+                    results[key] = self._done[key]
+                    self.deduplicated += 1
+                elif key in self._inflight:
+                    results[key] = self._inflight[key]
+                    self.deduplicated += 1
+                else:
+                    self._inflight[key] = owned[key] = Future()
+
+        if owned:
+            keys = list(owned)
+            text_by_hash = dict(zip(hashes, texts))
+            try:
+                vectors = self.embed_fn([text_by_hash[key] for key in keys])
+            except Exception as e:
+                with self._lock:
+                    for key in keys:
+                        self._inflight.pop(key, None)
+                for future in owned.values():
+                    future.set_exception(e)
+                raise
+            with self._lock:
+                for key, vector in zip(keys, vectors):
+                    stored = np.asarray(vector, dtype=np.float32)
+                    self._done[key] = stored
+                    self._inflight.pop(key, None)
+                    owned[key].set_result(stored)
+                    results[key] = stored
+                while len(self._done) > self.max_entries:
+                    self._done.popitem(last=False)
+
+        vectors = {
+            key: (value.result() if isinstance(value, Future) else value)
+            for key, value in results.items()
+        }
+        return [vectors[key].tolist() for key in hashes]
+
+
+@dataclass
+class BulkJob:
+    id: str
+    tenant_id: int
+    agent_id: int
+    tags: Optional[str]
+    lazy: bool = False  # documentos criados em modo lazy (embeddings sob demanda)
+    status: str = "UNPACKING"  # UNPACKING, PROCESSING, COMPLETED
+    files_total: int = 0
+    files_done: int = 0
+    files_failed: int = 0
+    files_skipped: int = 0
+    chunks: int = 0
+    document_ids: List[int] = field(default_factory=list)
+    failures: List[Dict] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    embeddings: Optional[SharedEmbeddings] = field(default=None, repr=False)
+    pipeline: Optional[IngestPipeline] = field(default=None, repr=False)
+    unpacked: bool = False
+    # Métricas do pipeline congeladas quando ele é liberado
+    summary: Dict = field(default_factory=dict, repr=False)
+
+    def progress(self) -> Dict:
+        with self.lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "lazy": self.lazy,
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "files_failed": self.files_failed,
+                "files_skipped": self.files_skipped,
+                "chunks": self.chunks,
+                "document_ids": list(self.document_ids),
+                "failures": list(self.failures),
+                **(self._pipeline_stats() if self.pipeline else self.summary),
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+    def _pipeline_stats(self) -> Dict:
+        return {
+            "embedding_cache": self.pipeline.cache_stats,
+            "embeddings_deduplicated": self.embeddings.deduplicated if self.embeddings else 0,
+            "pipeline": self.pipeline.stats(),
+        }
+
+    def release(self):
+        """Pipeline encerrado: guarda só os números e solta threads, filas e o LRU de vetores."""
+        with self.lock:
+            if self.pipeline is None:
+                return
+            self.summary = self._pipeline_stats()
+            self.pipeline = None
+            self.embeddings = None
+
+    def _maybe_finish(self):
+        # Chamado com self.lock
+        if self.unpacked and self.files_done + self.files_failed >= self.files_total:
+            self.status = "COMPLETED"
+            self.finished_at = datetime.utcnow()
+
+
+# Jobs do processo da API (handle de progresso; o estado durável fica em documents.status)
+_jobs: Dict[str, BulkJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def _evict_jobs(now: datetime):
+    """Remove jobs concluídos há mais de BULK_JOB_TTL_MINUTES e os mais antigos além de BULK_MAX_JOBS."""
+    expired = now - timedelta(minutes=BULK_JOB_TTL_MINUTES)
+    with _jobs_lock:
+        finished = sorted(
+            (job for job in _jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at
+        )
+        excess = len(finished) - BULK_MAX_JOBS
+        for position, job in enumerate(finished):
+            if position < excess or job.finished_at < expired:
+                del _jobs[job.id]
+
+
+def get_job(job_id: str, tenant_id: int) -> Optional[BulkJob]:
+    _evict_jobs(datetime.utcnow())
+    job = _jobs.get(job_id)
+    if job is None or job.tenant_id != tenant_id:
+        return None
+    return job
+
+
+def _iter_archive(archive_path: str) -> Iterator[Tuple[str, object]]:
+    """
+    Membros (nome, arquivo aberto) do zip/tar, sem extrair tudo de uma vez.
+    Tar é lido em modo stream ("r|*"); zip usa o diretório central do arquivo.
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path, mode="r|*") as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                member = archive.extractfile(info)
+                if member is not None:
+                    yield info.name, member
+    else:
+        raise ValueError("Formato de arquivo compactado não suportado (use zip ou tar)")
+
+
+def _is_supported(name: str) -> bool:
+    base = os.path.basename(name)
+    if not base or base.startswith(".") or "__MACOSX" in name:
+        return False
+    return base.lower().rsplit(".", 1)[-1] in SUPPORTED_EXTENSIONS
+
+
+def _on_file_done(job: BulkJob, filename: str, document_id: int, chunks: int, error: Optional[Exception]):
+    """Callback do estágio de gravação do pipeline."""
+    with job.lock:
+        if error is None:
+            job.files_done += 1
+            job.chunks += chunks
+        else:
+            job.files_failed += 1
+            job.failures.append({"filename": filename, "document_id": document_id, "error": str(error)[:300]})
+        job._maybe_finish()
+
+
+def _enqueue_file(job: BulkJob, storage_path: str, filename: str):
+    db = SessionLocal()
+    try:
+        document = Document(
+            tenant_id=job.tenant_id,
+            agent_id=job.agent_id,
+            filename=filename,
+            storage_path=storage_path,
+            size_bytes=os.path.getsize(storage_path),
+            tags=job.tags,
+            status="PENDING",
+            vector_status="PENDING" if job.lazy else None
+        )
+        db.add(document)
+        db.commit()
+        document_id = document.id
+    finally:
+        db.close()
+
+    with job.lock:
+        job.files_total += 1
+        job.document_ids.append(document_id)
+    # Bloqueia enquanto o estágio de parsing estiver cheio (backpressure até o unpack)
+    job.pipeline.submit(IngestTask(
+        document_id, storage_path, filename,
+        on_done=lambda doc_id, chunks, error: _on_file_done(job, filename, doc_id, chunks, error)
+    ))
+
+
+def _unpack(job: BulkJob, sources: List[Tuple[str, str]], storage_dir: str):
+    """
+    Lê cada fonte (arquivo compactado ou arquivo avulso) e enfileira um job por
+    arquivo suportado assim que ele termina de ser gravado.
+    """
+    max_bytes = BULK_MEMBER_MAX_MB * 1024 * 1024
+    try:
+        for path, name in sources:
+            if _is_supported(name):
+                _enqueue_file(job, path, os.path.basename(name))
+                continue
+            if not (zipfile.is_zipfile(path) or tarfile.is_tarfile(path)):
+                with job.lock:
+                    job.files_skipped += 1
+                os.remove(path)
+                continue
+
+            for member_name, member in _iter_archive(path):
+                if not _is_supported(member_name):
+                    with job.lock:
+                        job.files_skipped += 1
+                    continue
+                if job.files_total >= BULK_MAX_FILES:
+                    raise ValueError(f"Limite de {BULK_MAX_FILES} arquivos por lote")
+
+                # Nome achatado: evita path traversal e colisões entre pastas
+                filename = os.path.basename(member_name)
+                dest = os.path.join(storage_dir, f"{uuid.uuid4().hex[:8]}_{filename}")
+                try:
+                    store_stream(member, dest, max_bytes)
+                except ValueError as e:
+                    # Conta em files_total também: senão _maybe_finish fecha o job com arquivos ainda no pipeline
+                    with job.lock:
+                        job.files_total += 1
+                        job.files_failed += 1
+                        job.failures.append({"filename": member_name, "error": str(e)})
+                    continue
+                _enqueue_file(job, dest, filename)
+
+            os.remove(path)
+
+    except Exception as e:
+        logger.error(f"Bulk job {job.id}: falha ao descompactar: {e}")
+        with job.lock:
+            job.failures.append({"filename": None, "error": f"unpack_failed: {str(e)[:300]}"})
+    finally:
+        with job.lock:
+            job.unpacked = True
+            job.status = "PROCESSING"
+            job._maybe_finish()
+        # Espera o pipeline esvaziar; depois disso nenhum callback usa mais o job
+        job.pipeline.close()
+        job.release()
+
+
+def start_bulk_job(
+    tenant_id: int,
+    agent_id: int,
+    tags: Optional[str],
+    sources: List[Tuple[str, str]],
+    storage_dir: str,
+    lazy: bool = False
+) -> BulkJob:
+    """
+    Cria o job e começa a descompactar em background.
+
+    Args:
+        sources: (caminho em disco, nome original) de cada upload recebido
+        storage_dir: pasta onde os membros descompactados são gravados
+        lazy: só parsing/chunking/índice de texto; embeddings na primeira consulta ou no backfill
+    """
+    processor = DocumentProcessor()
+    db = SessionLocal()
+    try:
+        processor.use_embedding_model(active_embedding_model(db, tenant_id))
+    finally:
+        db.close()
+    embeddings = SharedEmbeddings(processor.generate_embeddings_batch)
+    job = BulkJob(
+        id=uuid.uuid4().hex,
+        tenant_id=tenant_id,
+        agent_id=agent_id,
+        tags=tags,
+        lazy=lazy,
+        embeddings=embeddings,
+        pipeline=IngestPipeline(embed_fn=embeddings)
+    )
+    _evict_jobs(job.created_at)
+    with _jobs_lock:
+        _jobs[job.id] = job
+
+    threading.Thread(
+        target=_unpack, args=(job, sources, storage_dir), name=f"bulk-unpack-{job.id[:8]}", daemon=True
+    ).start()
+    logger.info(f"Bulk job {job.id}: {len(sources)} upload(s) para o agente {agent_id}")
+    return job
@@ -0,0 +1,124 @@
+"""
+Atualização incremental de documentos v4.5
+- Diff por content_hash entre os chunks novos e as linhas de knowledge_chunks
+- Linhas inalteradas são mantidas (com seus vetores e entradas de índice)
+- Só chunks novos são embedados (via cache); removidos são apagados
+- Posições (chunk_index) reindexadas; tudo na transação do chamador (sem commit aqui)
+"""
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.models import Document, KnowledgeChunk
+from app.services.embedding_cache import content_hash, embed_with_cache
+from app.services.embedding_models import EmbeddingModelSpec, chunk_embedding_fields
+from app.services.tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def sync_document_chunks(
+    db: Session,
+    document_id: int,
+    chunk_texts: List[str],
+    spec: EmbeddingModelSpec,
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None
+) -> Dict:
+    """
+    Substitui os chunks do documento por `chunk_texts`, reaproveitando as linhas
+    cujo conteúdo não mudou.
+
+    Linhas sem vetor na coluna de `spec` não são reaproveitadas (são reembedadas
+    com `spec`); vale a coluna, não o rótulo embedding_model, que um re-embedding
+    em andamento não altera. A chamada ao provider acontece antes das escritas; as novas entradas
+    do cache de embeddings são gravadas na mesma transação. Não faz commit: o
+    chamador commita junto com as próprias alterações (ou faz rollback).
+
+    Returns:
+        {"kept", "inserted", "deleted", "reindexed", "embedding_cache"}
+    """
+    existing = db.query(
+        KnowledgeChunk.id,
+        KnowledgeChunk.chunk_index,
+        KnowledgeChunk.content_hash,
+        getattr(KnowledgeChunk, spec.column).isnot(None).label("has_vector")
+    ).filter(
+        KnowledgeChunk.document_id == document_id
+    ).order_by(KnowledgeChunk.chunk_index, KnowledgeChunk.id).all()
+
+    # Linhas antigas sem hash (antes da migração 0016)
+    missing_hash = [row.id for row in existing if row.content_hash is None]
+    hashes_by_id = {}
+    if missing_hash:
+        for row in db.query(KnowledgeChunk.id, KnowledgeChunk.content).filter(
+            KnowledgeChunk.id.in_(missing_hash)
+        ):
+            hashes_by_id[row.id] = content_hash(row.content)
+
+    # Hash -> ids reaproveitáveis (na ordem original; um chunk repetido usa uma linha por ocorrência)
+    reusable = defaultdict(list)
+    old_index = {}
+    stale_ids = []
+    for row in existing:
+        old_index[row.id] = row.chunk_index
+        if row.has_vector:
+            reusable[row.content_hash or hashes_by_id[row.id]].append(row.id)
+        else:
+            stale_ids.append(row.id)
+    for ids in reusable.values():
+        ids.reverse()
+
+    new_hashes = [content_hash(text) for text in chunk_texts]
+    positions = []  # (chunk_index, id reaproveitado ou None)
+    for idx, key in enumerate(new_hashes):
+        ids = reusable.get(key)
+        positions.append((idx, ids.pop() if ids else None))
+
+    removed_ids = stale_ids + [chunk_id for ids in reusable.values() for chunk_id in ids]
+    reindex = [
+        {"id": chunk_id, "chunk_index": idx, "content_hash": new_hashes[idx]}
+        for idx, chunk_id in positions
+        if chunk_id is not None and (old_index[chunk_id] != idx or chunk_id in hashes_by_id)
+    ]
+    to_insert = [idx for idx, chunk_id in positions if chunk_id is None]
+
+    # Embeddings primeiro: nada é alterado se o provider falhar
+    cache_stats = None
+    embeddings = []
+    if to_insert:
+        embeddings, cache_stats = embed_with_cache(
+            db, [chunk_texts[idx] for idx in to_insert], spec, embed_fn=embed_fn
+        )
+
+    if removed_ids:
+        db.query(KnowledgeChunk).filter(
+            KnowledgeChunk.id.in_(removed_ids)
+        ).delete(synchronize_session=False)
+    if reindex:
+        db.execute(update(KnowledgeChunk), reindex)
+    db.add_all([
+        KnowledgeChunk(
+            document_id=document_id,
+            content=chunk_texts[idx],
+            chunk_index=idx,
+            token_count=count_tokens(chunk_texts[idx]),
+            content_hash=new_hashes[idx],
+            **chunk_embedding_fields(spec, embedding)
+        )
+        for idx, embedding in zip(to_insert, embeddings)
+    ])
+    # Documento completo: checkpoint no fim
+    db.query(Document).filter(Document.id == document_id).update({"embedded_upto": len(chunk_texts)})
+    db.flush()
+
+    stats = {
+        "kept": len(chunk_texts) - len(to_insert),
+        "inserted": len(to_insert),
+        "deleted": len(removed_ids),
+        "reindexed": len(reindex),
+        "embedding_cache": cache_stats,
+    }
+    logger.info(f"Document {document_id}: chunks sincronizados {stats}")
+    return stats
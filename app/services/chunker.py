@@ -0,0 +1,218 @@
+"""
+Chunking por tokens em passada única v4.5
+- Texto tokenizado uma vez; offsets de byte por soma acumulada dos tamanhos
+  dos tokens (tabela por vocabulário, sem decode por janela)
+- Corte preferencial em parágrafo/sentença dentro de uma tolerância
+- Gerador: chunks são produzidos um a um, sem lista intermediária
+- Entrada em streaming (ex: páginas de PDF): memória limitada à janela, não ao documento
+"""
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from app.services.tokenizer import get_encoder
+
+DEFAULT_CHUNK_TOKENS = 800
+DEFAULT_OVERLAP_TOKENS = 200
+# Fração do chunk (a partir do fim) onde se procura um limite natural
+DEFAULT_BOUNDARY_TOLERANCE = 0.2
+# Tokens no fim do buffer que ainda podem mudar com o texto seguinte (BPE na emenda)
+STREAM_SAFETY_TOKENS = 16
+
+_PARAGRAPH_BREAK = re.compile(rb"\n[ \t\r]*\n")
+_SENTENCE_END = re.compile("(?:[.!?]|…)[\"')\\]]*\\s|\n".encode("utf-8"))
+
+
+@dataclass(frozen=True)
+class TextChunk:
+    text: str
+    start_char: int
+    end_char: int
+    start_token: int
+    end_token: int
+
+    @property
+    def token_count(self) -> int:
+        return self.end_token - self.start_token
+
+
+@lru_cache(maxsize=4)
+def _token_byte_lengths(encoding) -> np.ndarray:
+    """Tamanho em bytes de cada token do vocabulário (calculado uma vez por encoder)."""
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # ids sem token no vocabulário
+    return lengths
+
+
+def _boundary_end(data: bytes, window_start: int, window_end: int) -> Optional[int]:
+    """
+    Último limite natural em data[window_start:window_end]: parágrafo, senão sentença.
+    Retorna o offset (em bytes) logo após o separador.
+    """
+    for pattern in (_PARAGRAPH_BREAK, _SENTENCE_END):
+        last = None
+        for last in pattern.finditer(data, window_start, window_end):
+            pass
+        if last is not None:
+            return last.end()
+    return None
+
+
+def _char_boundary(data: bytes, offset: int) -> int:
+    """Recua o offset até o início de um caractere UTF-8 (tokens podem partir caracteres)."""
+    while 0 < offset < len(data) and (data[offset] & 0xC0) == 0x80:
+        offset -= 1
+    return offset
+
+
+def _iter_spans(
+    text: str,
+    chunk_tokens: int,
+    overlap_tokens: int,
+    tolerance: int,
+    encoding,
+    final: bool
+):
+    """
+    Gera os chunks de `text`. Com final=False, para antes do primeiro chunk cuja
+    janela ainda depende de texto que não chegou e retorna (token, caractere)
+    onde esse chunk começa.
+    """
+    tokens = encoding.encode_ordinary(text)
+    data = text.encode("utf-8")
+    ascii_only = len(data) == len(text)
+    # offsets[i] = byte onde o token i começa; offsets[total] = fim do texto
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(_token_byte_lengths(encoding)[np.asarray(tokens, dtype=np.int64)], out=offsets[1:])
+    offsets = offsets.tolist()
+    total = len(tokens)
+
+    # Offset de caractere conhecido (âncora) para converter bytes -> caracteres incrementalmente
+    anchor_byte = anchor_char = 0
+
+    def char_offset(byte_offset: int) -> int:
+        if ascii_only:
+            return byte_offset
+        return anchor_char + len(data[anchor_byte:byte_offset].decode("utf-8"))
+
+    start = 0
+    while start < total:
+        if not final and start + chunk_tokens + STREAM_SAFETY_TOKENS > total:
+            return start, char_offset(_char_boundary(data, offsets[start]))
+
+        end = min(start + chunk_tokens, total)
+
+        if end < total and tolerance > 0:
+            window_start = max(start + 1, end - tolerance)
+            boundary = _boundary_end(data, offsets[window_start], offsets[end])
+            if boundary is not None:
+                # Primeiro token que começa no limite (ou depois dele)
+                end = max(window_start, bisect_left(offsets, boundary, window_start, end))
+
+        start_byte = _char_boundary(data, offsets[start])
+        end_byte = _char_boundary(data, offsets[end])
+        start_char = char_offset(start_byte)
+        if ascii_only:
+            chunk = text[start_byte:end_byte]
+        else:
+            chunk = data[start_byte:end_byte].decode("utf-8")
+            anchor_byte, anchor_char = start_byte, start_char
+        end_char = start_char + len(chunk)
+
+        if chunk.strip():
+            yield TextChunk(chunk, start_char, end_char, start, end)
+
+        if end >= total:
+            break
+        start = max(end - overlap_tokens, start + 1)
+
+    return total, len(text)
+
+
+def _check_sizes(chunk_tokens: int, overlap_tokens: int, boundary_tolerance: float):
+    if chunk_tokens <= 0:
+        raise ValueError("chunk_tokens deve ser positivo")
+    overlap_tokens = max(0, min(overlap_tokens, chunk_tokens - 1))
+    return overlap_tokens, int(chunk_tokens * boundary_tolerance)
+
+
+def iter_chunks(
+    text: str,
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    boundary_tolerance: float = DEFAULT_BOUNDARY_TOLERANCE,
+    model: Optional[str] = None
+) -> Iterator[TextChunk]:
+    """
+    Divide `text` em chunks de até `chunk_tokens` tokens com `overlap_tokens` de overlap.
+
+    O fim de cada chunk recua até o último parágrafo/sentença nos últimos
+    `boundary_tolerance * chunk_tokens` tokens; sem limite natural, corta no token.
+    Chunks só com espaço em branco são ignorados.
+    """
+    overlap_tokens, tolerance = _check_sizes(chunk_tokens, overlap_tokens, boundary_tolerance)
+    if not text or not text.strip():
+        return
+    yield from _iter_spans(text, chunk_tokens, overlap_tokens, tolerance, get_encoder(model), final=True)
+
+
+def iter_chunks_stream(
+    pieces: Iterable[str],
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    boundary_tolerance: float = DEFAULT_BOUNDARY_TOLERANCE,
+    model: Optional[str] = None
+) -> Iterator[TextChunk]:
+    """
+    Igual a iter_chunks, mas consome o texto em partes (ex: uma por página).
+
+    Só o trecho ainda não emitido fica em memória (no máximo um chunk mais a
+    parte atual). Offsets de caractere/token são relativos ao texto concatenado;
+    offsets de token são aproximados, pois cada trecho é re-tokenizado.
+    """
+    overlap_tokens, tolerance = _check_sizes(chunk_tokens, overlap_tokens, boundary_tolerance)
+    encoding = get_encoder(model)
+    # Só re-tokeniza o buffer quando ele provavelmente contém mais que um chunk
+    flush_chars = chunk_tokens * 2
+
+    buffer = ""
+    char_base = token_base = 0
+
+    def shifted(chunk: TextChunk) -> TextChunk:
+        return TextChunk(
+            chunk.text,
+            chunk.start_char + char_base, chunk.end_char + char_base,
+            chunk.start_token + token_base, chunk.end_token + token_base
+        )
+
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer += piece
+        if len(buffer) < flush_chars:
+            continue
+
+        spans = _iter_spans(buffer, chunk_tokens, overlap_tokens, tolerance, encoding, final=False)
+        while True:
+            try:
+                chunk = next(spans)
+            except StopIteration as stop:
+                next_token, next_char = stop.value
+                break
+            yield shifted(chunk)
+
+        buffer = buffer[next_char:]
+        char_base += next_char
+        token_base += next_token
+
+    if buffer.strip():
+        for chunk in _iter_spans(buffer, chunk_tokens, overlap_tokens, tolerance, encoding, final=True):
+            yield shifted(chunk)
@@ -0,0 +1,190 @@
+"""
+Memória de conversas v4.5
+- Janela das últimas N trocas + resumo persistido das mensagens antigas
+- Resumo incremental gerado em background após cada resposta
+"""
+import os
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from openai import OpenAI
+
+from app.core.database import SessionLocal
+from app.models.models import Conversation, ConversationMessage
+from app.services.tokenizer import count_tokens, truncate_to_tokens, TOKENS_PER_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Trocas (pergunta + resposta) mantidas literalmente no prompt
+HISTORY_WINDOW_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", 10))
+# Mensagens fora da janela acumuladas antes de atualizar o resumo
+SUMMARY_BATCH_MESSAGES = int(os.getenv("CHAT_SUMMARY_BATCH", 6))
+SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 500))
+SUMMARY_INPUT_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_INPUT_MAX_TOKENS", 6000))
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Você mantém a memória de longo prazo de uma conversa entre um usuário e um assistente. "
+    "Atualize o resumo anterior incorporando as novas mensagens. Preserve fatos, decisões, "
+    "preferências do usuário e pendências; descarte saudações e repetições. "
+    "Responda apenas com o resumo atualizado, em texto corrido."
+)
+
+
+def window_size() -> int:
+    """Número de mensagens mantidas literalmente no prompt."""
+    return HISTORY_WINDOW_TURNS * 2
+
+
+def load_history_window(
+    db: Session,
+    conversation_id: int,
+    after_message_id: Optional[int] = None,
+    exclude_message_id: Optional[int] = None,
+    max_tokens: Optional[int] = None
+) -> List[Dict]:
+    """
+    Carrega as mensagens ainda não resumidas (no máximo janela + lote de resumo),
+    em ordem cronológica, usando o token_count gravado na inserção.
+
+    Uma única query no índice (conversation_id, id): a soma acumulada de tokens
+    (da mais recente para a mais antiga) corta a janela em `max_tokens` sem
+    re-tokenizar o histórico. Mensagens sem token_count (antes do backfill)
+    contam como 0 aqui e são contadas pelo PromptBuilder.
+    """
+    message_tokens = func.coalesce(ConversationMessage.token_count, 0) + TOKENS_PER_MESSAGE
+    query = db.query(
+        ConversationMessage.id,
+        ConversationMessage.role,
+        ConversationMessage.content,
+        ConversationMessage.token_count,
+        func.sum(message_tokens).over(order_by=ConversationMessage.id.desc()).label("running_tokens")
+    ).filter(
+        ConversationMessage.conversation_id == conversation_id
+    )
+    if after_message_id:
+        query = query.filter(ConversationMessage.id > after_message_id)
+    if exclude_message_id:
+        query = query.filter(ConversationMessage.id != exclude_message_id)
+
+    window = query.order_by(ConversationMessage.id.desc()).limit(
+        window_size() + SUMMARY_BATCH_MESSAGES
+    ).subquery()
+
+    rows_query = db.query(window)
+    if max_tokens is not None:
+        rows_query = rows_query.filter(window.c.running_tokens <= max_tokens)
+    rows = rows_query.order_by(window.c.id).all()
+
+    return [
+        {"role": row.role, "content": row.content, "token_count": row.token_count}
+        for row in rows
+    ]
+
+
+def _generate_summary(previous_summary: Optional[str], transcript: str, model: str) -> str:
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": (
+                f"Resumo anterior:\n{previous_summary or '(vazio)'}\n\n"
+                f"Novas mensagens:\n{transcript}"
+            )},
+        ],
+        temperature=0.2,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        timeout=30
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+def _fold_pass(messages: List[ConversationMessage], model: str) -> Tuple[str, int]:
+    """
+    Transcript do maior prefixo de `messages` que cabe em SUMMARY_INPUT_MAX_TOKENS
+    e quantas mensagens ele cobre. Uma mensagem sozinha maior que o limite é
+    truncada (entra no resumo pelo começo, em vez de travar a fila).
+    """
+    lines = []
+    used = 0
+    for msg in messages:
+        line = f"{msg.role}: {msg.content}"
+        tokens = (msg.token_count if msg.token_count is not None else count_tokens(msg.content, model)) + TOKENS_PER_MESSAGE
+        if used + tokens > SUMMARY_INPUT_MAX_TOKENS:
+            if not lines:
+                lines.append(truncate_to_tokens(line, SUMMARY_INPUT_MAX_TOKENS, model))
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(lines), len(lines)
+
+
+def summarize_conversation(conversation_id: int, model: str) -> None:
+    """
+    Incorpora ao resumo as mensagens que saíram da janela.
+
+    Executado em background (sessão própria) depois que a resposta foi enviada;
+    só chama o LLM quando há pelo menos SUMMARY_BATCH_MESSAGES mensagens novas
+    fora da janela. Se as mensagens não cabem em SUMMARY_INPUT_MAX_TOKENS,
+    o resumo é atualizado em várias passadas (o marcador só avança até a
+    última mensagem efetivamente resumida).
+    """
+    db = SessionLocal()
+    try:
+        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        if not conversation:
+            return
+
+        previous_upto = conversation.summary_upto_message_id
+        base_query = db.query(ConversationMessage).filter(
+            ConversationMessage.conversation_id == conversation_id
+        )
+        if previous_upto:
+            base_query = base_query.filter(ConversationMessage.id > previous_upto)
+
+        # Mensagem mais recente que já está fora da janela
+        fold_until_id = base_query.with_entities(ConversationMessage.id).order_by(
+            ConversationMessage.id.desc()
+        ).offset(window_size()).limit(1).scalar()
+        if not fold_until_id:
+            return
+
+        to_fold = base_query.filter(
+            ConversationMessage.id <= fold_until_id
+        ).order_by(ConversationMessage.id).all()
+        if len(to_fold) < SUMMARY_BATCH_MESSAGES:
+            return
+
+        summary = conversation.summary
+        while to_fold:
+            transcript, folded = _fold_pass(to_fold, model)
+            summary = _generate_summary(summary, transcript, model)
+            if not summary:
+                return
+            upto_id = to_fold[folded - 1].id
+
+            # Atualização otimista: outra execução concorrente pode ter avançado o resumo
+            updated = db.query(Conversation).filter(
+                Conversation.id == conversation_id,
+                Conversation.summary_upto_message_id == previous_upto
+                if previous_upto else Conversation.summary_upto_message_id.is_(None)
+            ).update({
+                "summary": summary,
+                "summary_upto_message_id": upto_id,
+                "summary_updated_at": datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            if not updated:
+                return
+
+            logger.info(f"Conversation {conversation_id}: resumo atualizado até mensagem {upto_id} ({folded} mensagens)")
+            previous_upto = upto_id
+            to_fold = to_fold[folded:]
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Falha ao resumir conversa {conversation_id}: {e}")
+    finally:
+        db.close()
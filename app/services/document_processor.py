@@ -1,16 +1,46 @@
 """
 Serviço de processamento de documentos para RAG
-- Extração de texto (PDF, TXT, DOCX)
-- Chunking com tiktoken (800 tokens, 200 overlap)
-- Embeddings OpenAI (text-embedding-3-small)
+- Extração de texto (PDF, TXT, DOCX); PDF página a página e DOCX por parágrafo, em streaming
+- CSV/XLSX em streaming, chunks de N linhas com cabeçalho (services: rag/utils/tabular_parser.py)
+- Parsing CPU-bound em processos separados (services/parsing_pool.py)
+- Chunking com tiktoken (800 tokens, 200 overlap, corte em parágrafo/sentença)
+- Embeddings pelo backend configurado (OpenAI text-embedding-3-small ou hashing local)
 - Armazenamento pgvector
 """
+import itertools
+import logging
 import os
-import tiktoken
-from typing import List, Tuple
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from openai import OpenAI
-import pypdf
-from docx import Document as DocxDocument
+from sqlalchemy.orm import Session
+
+from app.services.tokenizer import get_encoder, count_tokens
+from app.services.chunker import iter_chunks, iter_chunks_stream
+from app.services.embedding_models import active_embedding_model, get_embedding_model, chunk_embedding_fields, embed_texts, EmbeddingModelSpec
+from app.services.embedding_cache import content_hash, embed_with_cache, merge_cache_stats
+from app.services import parsing_pool
+from app.rag.utils.text_encoding import read_text
+from app.rag.utils.tabular_parser import (
+    TABULAR_CHUNK_MODE, TABULAR_EXTENSIONS, TABULAR_ROWS_PER_CHUNK,
+    is_tabular, iter_table_chunks, iter_table_rows
+)
+
+SUPPORTED_EXTENSIONS = {"pdf", "txt", "docx", "doc"} | TABULAR_EXTENSIONS
+
+# Chunks por lote de embedding no pipeline em streaming
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+
+logger = logging.getLogger(__name__)
+
+
+def _batched(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
 
 class DocumentProcessor:
@@ -18,7 +48,7 @@ class DocumentProcessor:
     Processa documentos para o sistema RAG:
     1. Extrai texto do arquivo
     2. Divide em chunks com overlap
-    3. Gera embeddings OpenAI
+    3. Gera embeddings (backend configurado)
     """
     
     def __init__(self):
@@ -27,24 +57,35 @@ class DocumentProcessor:
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_BASE_URL")
         )
-        # Cliente para embeddings (usa API OpenAI direta)
-        self.embedding_client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url="https://api.openai.com/v1"
-        )
-        self.encoding = tiktoken.get_encoding("cl100k_base")  # Encoding do GPT-4
+        self.encoding = get_encoder()  # cl100k_base (GPT-4), cacheado por processo
         self.chunk_size = 800  # tokens
         self.chunk_overlap = 200  # tokens
-        self.embedding_model = "text-embedding-3-small"
-        self.embedding_dimensions = 1536
+        self.embedding_spec = get_embedding_model()  # modelo ativo (EMBEDDINGS_MODEL)
+        self.cache_stats = None  # hits/misses do cache de embeddings da última execução
+        self.embed_fn = None  # substitui generate_embeddings_batch (ex: deduplicação num lote de documentos)
+        self.table_mode = TABULAR_CHUNK_MODE  # CSV/XLSX: "rows" (N linhas por chunk) ou "record"
+        self.table_rows_per_chunk = TABULAR_ROWS_PER_CHUNK
+        self.resumed_from = 0  # checkpoint de onde o último index_document retomou
+        self.lazy = False  # documento em modo lazy (vector_status PENDING): chunks sem embeddings
+        self.parse_info: Dict = {}  # última extração: parse_ms e, em TXT, encoding detectado/confiança
+        self.embedding_model = self.embedding_spec.name
+        self.embedding_dimensions = self.embedding_spec.dim
+    
+    def use_embedding_model(self, spec: EmbeddingModelSpec):
+        """Troca o modelo/coluna de embedding (ex: modelo ativo do tenant do documento)."""
+        self.embedding_spec = spec
+        self.embedding_model = spec.name
+        self.embedding_dimensions = spec.dim
     
     def extract_text(self, file_path: str, filename: str) -> str:
         """
-        Extrai texto de PDF, TXT ou DOCX.
+        Extrai texto de PDF, TXT, DOCX, CSV ou XLSX.
         """
         extension = filename.lower().split('.')[-1]
         
-        if extension == 'pdf':
+        if is_tabular(filename):
+            return "\n\n".join(self._iter_table_chunks(file_path, filename))
+        elif extension == 'pdf':
             return self._extract_from_pdf(file_path)
         elif extension == 'txt':
             return self._extract_from_txt(file_path)
@@ -54,135 +95,260 @@ class DocumentProcessor:
             raise ValueError(f"Formato não suportado: {extension}")
     
     def _extract_from_pdf(self, file_path: str) -> str:
-        """Extrai texto de PDF usando pypdf."""
-        text = ""
-        with open(file_path, 'rb') as f:
-            pdf_reader = pypdf.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
+        """Extrai texto de PDF (pypdf, fallback pdfminer) no pool de parsing."""
+        return "".join(parsing_pool.iter_pdf_pages(file_path)).strip()
+    
+    def iter_text(self, file_path: str, filename: str) -> Iterator[str]:
+        """
+        Texto do arquivo em partes: uma por página no PDF, um parágrafo/linha de
+        tabela no DOCX, o texto inteiro nos demais.
+        """
+        extension = filename.lower().split('.')[-1]
+        
+        if extension == 'pdf':
+            yield from parsing_pool.iter_pdf_pages(file_path)
+        elif extension in ['docx', 'doc']:
+            for block in parsing_pool.iter_docx_blocks(file_path):
+                yield block + "\n"
+        else:
+            yield self.extract_text(file_path, filename)
     
     def _extract_from_txt(self, file_path: str) -> str:
-        """Extrai texto de TXT."""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            return f.read().strip()
+        """Extrai texto de TXT (UTF-8 direto; senão encoding detectado por amostra)."""
+        decoded = read_text(file_path)
+        self.parse_info.update(decoded.info())
+        return decoded.text.strip()
     
     def _extract_from_docx(self, file_path: str) -> str:
-        """Extrai texto de DOCX."""
-        doc = DocxDocument(file_path)
-        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        return text.strip()
+        """Extrai texto de DOCX (parágrafos e tabelas) no pool de parsing."""
+        return parsing_pool.parse_docx(file_path).strip()
+    
+    def _iter_table_chunks(self, file_path: str, filename: str) -> Iterator[str]:
+        """CSV/XLSX linha a linha, em chunks com o cabeçalho repetido."""
+        return iter_table_chunks(
+            iter_table_rows(file_path, filename), self.table_rows_per_chunk, self.table_mode
+        )
     
     def chunk_text(self, text: str) -> List[Tuple[str, int, int]]:
         """
-        Divide texto em chunks com overlap.
+        Divide texto em chunks com overlap (ver services/chunker.py).
         
         Returns:
             List[(chunk_text, start_token, end_token)]
         """
-        if not text or not text.strip():
-            return []
+        return [
+            (chunk.text, chunk.start_token, chunk.end_token)
+            for chunk in iter_chunks(text, self.chunk_size, self.chunk_overlap)
+        ]
+    
+    def generate_embedding(self, text: str) -> List[float]:
+        """
+        Gera o embedding de um chunk de texto.
+        """
+        return self.generate_embeddings_batch([text])[0]
+    
+    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
+        """
+        Gera embeddings em batch para múltiplos textos, pelo backend configurado
+        (EMBEDDINGS_BACKEND: API do provider ou "hashing", local e sem rede).
+        """
+        return embed_texts(texts, self.embedding_spec, batch_size=batch_size)
+    
+    def iter_chunk_texts(self, file_path: str, filename: str) -> Iterator[str]:
+        """
+        Chunks do documento à medida que as páginas são extraídas.
+        Tempo de extração + chunking (sem o tempo do consumidor) e encoding
+        detectado ficam em self.parse_info.
+        
+        Raises:
+            ValueError: documento sem texto extraível
+        """
+        if is_tabular(filename):
+            # Planilhas: chunks por grupo de linhas, não por tokens
+            chunk_texts = self._iter_table_chunks(file_path, filename)
+        else:
+            chunk_texts = (
+                chunk.text
+                for chunk in iter_chunks_stream(self.iter_text(file_path, filename), self.chunk_size, self.chunk_overlap)
+            )
+        
+        self.parse_info = {}
+        has_chunks = False
+        elapsed = 0.0
+        started = time.perf_counter()
+        for chunk_text in chunk_texts:
+            elapsed += time.perf_counter() - started
+            has_chunks = True
+            yield chunk_text
+            started = time.perf_counter()
+        elapsed += time.perf_counter() - started
+        self.parse_info["parse_ms"] = round(elapsed * 1000, 1)
         
-        # Tokenizar texto completo
-        tokens = self.encoding.encode(text)
+        if not has_chunks:
+            raise ValueError("Documento vazio ou sem texto extraível")
+    
+    def extract_chunks(self, file_path: str, filename: str) -> List[str]:
+        """
+        Extrai o texto e divide em chunks (sem gerar embeddings).
         
-        chunks = []
-        start = 0
+        Returns:
+            chunk_texts
+        """
+        return list(self.iter_chunk_texts(file_path, filename))
+    
+    def iter_embedded_batches(
+        self,
+        file_path: str,
+        filename: str,
+        db: Optional[Session] = None,
+        batch_size: int = EMBED_BATCH_SIZE
+    ) -> Iterator[Tuple[List[str], List[List[float]]]]:
+        """
+        Pipeline em streaming: páginas -> chunks -> lotes de embeddings.
         
-        while start < len(tokens):
-            # Definir fim do chunk
-            end = start + self.chunk_size
-            
-            # Extrair tokens do chunk
-            chunk_tokens = tokens[start:end]
-            
-            # Decodificar para texto
-            chunk_text = self.encoding.decode(chunk_tokens)
-            
-            chunks.append((chunk_text, start, end))
-            
-            # Próximo chunk começa com overlap
-            start += (self.chunk_size - self.chunk_overlap)
+        Cada lote é embedado assim que fica completo, enquanto as páginas seguintes
+        ainda não foram lidas; a memória fica limitada a um lote, não ao documento.
+        Com `db`, só os chunks ausentes do cache vão ao provider (estatísticas
+        acumuladas em self.cache_stats).
         
-        return chunks
+        Yields:
+            (chunk_texts, chunk_embeddings) de cada lote
+        """
+        self.cache_stats = None
+        batch = []
+        for chunk_text in self.iter_chunk_texts(file_path, filename):
+            batch.append(chunk_text)
+            if len(batch) >= batch_size:
+                yield batch, self._embed_batch(batch, db)
+                batch = []
+        if batch:
+            yield batch, self._embed_batch(batch, db)
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def _embed_batch(self, texts: List[str], db: Optional[Session]) -> List[List[float]]:
+        embed_fn = self.embed_fn or self.generate_embeddings_batch
+        if db is None:
+            return embed_fn(texts)
+        embeddings, stats = embed_with_cache(db, texts, self.embedding_spec, embed_fn=embed_fn)
+        self.cache_stats = merge_cache_stats(self.cache_stats, stats)
+        return embeddings
+    
+    def index_document(self, db: Session, document_id: int, file_path: str, filename: str) -> int:
         """
-        Gera embedding OpenAI para um chunk de texto.
+        Grava os chunks do documento lote a lote, com checkpoint.
+        
+        Cada lote é commitado junto com documents.embedded_upto assim que os
+        embeddings voltam: se o processo cair ou o provider falhar no meio, os
+        lotes já gravados ficam, e a próxima chamada retoma do checkpoint
+        (sem pagar de novo pelos embeddings). Documento lazy (vector_status
+        PENDING): chunks gravados sem embeddings (ver services/lazy_vectorize.py).
+        Síncrono e CPU-bound: em rotas async, chamar via run_in_threadpool.
+        
+        Returns:
+            Número total de chunks do documento
         """
-        if not text or not text.strip():
-            # Retornar vetor zero se texto vazio
-            return [0.0] * self.embedding_dimensions
+        from app.models.models import Document
         
-        response = self.embedding_client.embeddings.create(
-            model=self.embedding_model,
-            input=text,
-            encoding_format="float"
-        )
+        self.cache_stats = None
+        chunks_count, chunk_texts = self.iter_pending_chunks(db, document_id, file_path, filename)
+        self.resumed_from = chunks_count
         
-        return response.data[0].embedding
+        for batch in _batched(chunk_texts, EMBED_BATCH_SIZE):
+            embeddings = None if self.lazy else self._embed_batch(batch, db)
+            db.add_all(self.chunk_rows(document_id, chunks_count, batch, embeddings))
+            chunks_count += len(batch)
+            db.query(Document).filter(Document.id == document_id).update({"embedded_upto": chunks_count})
+            db.commit()
+        return chunks_count
     
-    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
+    def iter_pending_chunks(self, db: Session, document_id: int, file_path: str, filename: str) -> Tuple[int, Iterator[str]]:
         """
-        Gera embeddings em batch para múltiplos textos.
-        TEMPORÁRIO: Usando embeddings fake (vetores aleatórios) até ter chave OpenAI válida.
+        Ponto de retomada do documento e os chunks que ainda faltam.
+        
+        Os chunks antes do checkpoint são re-gerados (chunking é determinístico),
+        mas não re-embedados. Se o último chunk gravado não bater com o
+        re-gerado (arquivo ou parâmetros de chunking mudaram), recomeça do zero.
+        
+        Returns:
+            (índice do primeiro chunk pendente, iterador dos chunks pendentes)
         """
-        import random
-        import hashlib
+        from app.models.models import Document, KnowledgeChunk
         
-        if not texts:
-            return []
+        document = db.query(Document).filter(Document.id == document_id).first()
+        upto = (document.embedded_upto or 0) if document else 0
+        if document is not None:
+            self.use_embedding_model(active_embedding_model(db, document.tenant_id))
+            self.lazy = document.vector_status == "PENDING"
         
-        embeddings = []
+        # Linhas além do checkpoint (lote sem commit do checkpoint) são descartadas
+        db.query(KnowledgeChunk).filter(
+            KnowledgeChunk.document_id == document_id,
+            KnowledgeChunk.chunk_index >= upto
+        ).delete(synchronize_session=False)
         
-        for text in texts:
-            # Gerar vetor determinístico baseado no hash do texto
-            text_hash = hashlib.md5(text.encode()).hexdigest()
-            random.seed(text_hash)
-            embedding = [random.uniform(-1, 1) for _ in range(self.embedding_dimensions)]
-            embeddings.append(embedding)
+        chunk_texts = self.iter_chunk_texts(file_path, filename)
+        if upto:
+            last = None
+            for last in itertools.islice(chunk_texts, upto):
+                pass
+            stored = db.query(KnowledgeChunk.content_hash).filter(
+                KnowledgeChunk.document_id == document_id,
+                KnowledgeChunk.chunk_index == upto - 1
+            ).scalar()
+            if last is None or stored != content_hash(last):
+                logger.info(f"Documento {document_id}: checkpoint {upto} não confere, reindexando do início")
+                db.query(KnowledgeChunk).filter(KnowledgeChunk.document_id == document_id).delete(synchronize_session=False)
+                upto = 0
+                chunk_texts = self.iter_chunk_texts(file_path, filename)
+            else:
+                logger.info(f"Documento {document_id}: retomando a partir do chunk {upto}")
         
-        return embeddings
+        if document is not None:
+            document.embedded_upto = upto
+        db.flush()
+        return upto, chunk_texts
+    
+    def chunk_rows(
+        self,
+        document_id: int,
+        start_index: int,
+        chunk_texts: List[str],
+        embeddings: Optional[List[List[float]]],
+        spec: Optional[EmbeddingModelSpec] = None
+    ) -> list:
+        """KnowledgeChunk de um lote, numerados a partir de `start_index` (embeddings=None: modo lazy)."""
+        from app.models.models import KnowledgeChunk
         
-        # TODO: Descomentar quando tiver chave OpenAI válida
-        # for i in range(0, len(texts), batch_size):
-        #     batch = texts[i:i + batch_size]
-        #     valid_batch = [t if t.strip() else " " for t in batch]
-        #     response = self.embedding_client.embeddings.create(
-        #         model=self.embedding_model,
-        #         input=valid_batch,
-        #         encoding_format="float"
-        #     )
-        #     batch_embeddings = [item.embedding for item in response.data]
-        #     embeddings.extend(batch_embeddings)
-        # return embeddings
-    
-    def process_document(self, file_path: str, filename: str) -> Tuple[List[str], List[List[float]]]:
+        spec = spec or self.embedding_spec
+        if embeddings is None:
+            embeddings = [None] * len(chunk_texts)
+        return [
+            KnowledgeChunk(
+                document_id=document_id,
+                content=chunk_text,
+                chunk_index=start_index + offset,
+                token_count=count_tokens(chunk_text),
+                content_hash=content_hash(chunk_text),
+                **(chunk_embedding_fields(spec, embedding) if embedding is not None else {})  # coluna do modelo
+            )
+            for offset, (chunk_text, embedding) in enumerate(zip(chunk_texts, embeddings))
+        ]
+    
+    def process_document(self, file_path: str, filename: str, db: Optional[Session] = None) -> Tuple[List[str], List[List[float]]]:
         """
         Pipeline completo de processamento:
         1. Extrai texto
         2. Cria chunks
-        3. Gera embeddings
+        3. Gera embeddings (com `db`, só os chunks ausentes do cache vão ao provider;
+           estatísticas em self.cache_stats)
+        
+        Prefira iter_embedded_batches para documentos grandes.
         
         Returns:
             (chunk_texts, chunk_embeddings)
         """
-        # 1. Extrair texto
-        text = self.extract_text(file_path, filename)
-        
-        if not text or not text.strip():
-            raise ValueError("Documento vazio ou sem texto extraível")
-        
-        # 2. Criar chunks
-        chunks_data = self.chunk_text(text)
-        
-        if not chunks_data:
-            raise ValueError("Falha ao criar chunks do documento")
-        
-        chunk_texts = [chunk[0] for chunk in chunks_data]
-        
-        # 3. Gerar embeddings em batch
-        embeddings = self.generate_embeddings_batch(chunk_texts)
+        chunk_texts, embeddings = [], []
+        for batch_texts, batch_embeddings in self.iter_embedded_batches(file_path, filename, db):
+            chunk_texts.extend(batch_texts)
+            embeddings.extend(batch_embeddings)
         
         return chunk_texts, embeddings
-
@@ -0,0 +1,168 @@
+"""
+Remoção de documentos em background (reaper) v4.5
+- DELETE só marca o documento (deleted_at, status DELETED) e responde na hora
+- Busca, listagens e re-embedding ignoram documentos marcados
+- Reaper apaga os chunks em lotes pequenos (uma transação curta por lote), o arquivo e a linha do documento
+- Também varre chunks órfãos (sem documento)
+- Depois de muitas remoções, agenda VACUUM ANALYZE de knowledge_chunks (índices vetoriais/GIN sem tuplas mortas)
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal, engine
+from app.models.models import Document, KnowledgeChunk
+
+logger = logging.getLogger(__name__)
+
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", 500))
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", 60))
+# Chunks removidos desde a última manutenção que disparam o VACUUM (0 = nunca)
+REAPER_VACUUM_THRESHOLD = int(os.getenv("REAPER_VACUUM_THRESHOLD", 20000))
+
+_wake = threading.Event()
+_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+_since_maintenance = 0
+
+
+def mark_deleted(db: Session, document: Document):
+    """Soft delete: some da busca imediatamente; o reaper remove o resto."""
+    document.deleted_at = datetime.utcnow()
+    document.status = "DELETED"
+    document.vector_status = None  # não vetorizar sob demanda
+    db.commit()
+    _wake.set()
+
+
+def _delete_chunks(db: Session, condition) -> int:
+    """Apaga os chunks que atendem `condition`, REAPER_BATCH_SIZE por transação."""
+    total = 0
+    while True:
+        ids = [chunk_id for chunk_id, in db.query(KnowledgeChunk.id).filter(condition).limit(REAPER_BATCH_SIZE).all()]
+        if not ids:
+            return total
+        db.query(KnowledgeChunk).filter(KnowledgeChunk.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        total += len(ids)
+
+
+def _remove_file(db: Session, document: Document):
+    """Remove o arquivo, a menos que um documento ativo use o mesmo caminho (reupload com o mesmo nome)."""
+    if not document.storage_path:
+        return
+    shared = db.query(Document.id).filter(
+        Document.storage_path == document.storage_path,
+        Document.id != document.id,
+        Document.deleted_at.is_(None)
+    ).first()
+    if shared:
+        return
+    try:
+        os.remove(document.storage_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Reaper: não foi possível remover {document.storage_path}: {e}")
+
+
+def purge_document(db: Session, document_id: int) -> int:
+    """Remove chunks, arquivo e linha de um documento marcado. Retorna os chunks removidos."""
+    chunks = _delete_chunks(db, KnowledgeChunk.document_id == document_id)
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.deleted_at.isnot(None)
+    ).first()
+    if document is None:
+        return chunks
+    _remove_file(db, document)
+    # Chunks gravados por uma ingestão que ainda terminava o lote
+    chunks += _delete_chunks(db, KnowledgeChunk.document_id == document_id)
+    db.delete(document)
+    db.commit()
+    return chunks
+
+
+def purge_orphan_chunks(db: Session) -> int:
+    """Chunks cujo documento não existe mais (bancos antigos / remoções fora da API)."""
+    orphan = ~db.query(Document.id).filter(Document.id == KnowledgeChunk.document_id).exists()
+    return _delete_chunks(db, orphan)
+
+
+def maintain_indexes():
+    """VACUUM ANALYZE de knowledge_chunks (fora de transação; só Postgres)."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM (ANALYZE) knowledge_chunks"))
+    logger.info("Reaper: VACUUM ANALYZE knowledge_chunks concluído")
+
+
+def run_once(vacuum: Optional[bool] = None) -> Dict[str, int]:
+    """
+    Uma varredura completa: documentos marcados (mais antigos primeiro) e
+    chunks órfãos. vacuum=None: manutenção só ao passar de REAPER_VACUUM_THRESHOLD.
+    """
+    global _since_maintenance
+    stats = {"documents": 0, "chunks": 0, "orphan_chunks": 0}
+    db = SessionLocal()
+    try:
+        failed = set()
+        while True:
+            query = db.query(Document.id).filter(Document.deleted_at.isnot(None))
+            if failed:
+                query = query.filter(Document.id.notin_(failed))
+            row = query.order_by(Document.deleted_at).first()
+            if row is None:
+                break
+            try:
+                stats["chunks"] += purge_document(db, row.id)
+                stats["documents"] += 1
+            except Exception as e:
+                db.rollback()
+                failed.add(row.id)  # tenta de novo na próxima varredura
+                logger.error(f"Reaper: falha ao remover documento {row.id}: {e}")
+        stats["orphan_chunks"] = purge_orphan_chunks(db)
+    finally:
+        db.close()
+
+    with _lock:
+        _since_maintenance += stats["chunks"] + stats["orphan_chunks"]
+        if vacuum is None:
+            vacuum = REAPER_VACUUM_THRESHOLD > 0 and _since_maintenance >= REAPER_VACUUM_THRESHOLD
+        if vacuum:
+            _since_maintenance = 0
+    if vacuum:
+        maintain_indexes()
+
+    if stats["documents"] or stats["orphan_chunks"]:
+        logger.info(
+            f"Reaper: {stats['documents']} documentos, {stats['chunks']} chunks, "
+            f"{stats['orphan_chunks']} chunks órfãos removidos"
+        )
+    return stats
+
+
+def _work():
+    while True:
+        _wake.wait(REAPER_INTERVAL_SECONDS)
+        _wake.clear()
+        try:
+            run_once()
+        except Exception as e:
+            logger.error(f"Reaper: varredura falhou: {e}")
+
+
+def start_reaper():
+    """Inicia o reaper do processo (idempotente)."""
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="document-reaper", daemon=True)
+            _worker.start()
+    _wake.set()  # primeira varredura já na subida (marcações de antes de um restart)
@@ -0,0 +1,175 @@
+"""
+Backends de embedding v4.5
+- Interface única: embed(spec, textos) -> vetores na dimensão do modelo
+- openai: API (via embedding_scheduler: rate limit, prioridade, retry)
+- hashing: local, determinístico e sem rede (feature hashing de n-gramas com NumPy)
+- onnx: modelo local em CPU (services/local_embeddings.py, carregado sob demanda)
+- EMBEDDINGS_BACKEND escolhe o backend de todos os modelos (vazio = provider do modelo)
+"""
+import importlib
+import os
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+from openai import OpenAI
+
+from app.services.embedding_scheduler import PRIORITY_BULK, call_with_limits
+from app.services.tokenizer import count_tokens
+
+if TYPE_CHECKING:
+    from app.services.embedding_models import EmbeddingModelSpec
+
+# Ex: "hashing" para rodar ingestão e busca inteiras sem serviços externos
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "").strip().lower()
+# Tamanhos de n-grama de caracteres do backend hashing
+HASHING_NGRAMS = tuple(int(n) for n in os.getenv("HASHING_NGRAMS", "3,4").split(","))
+
+_POLY = np.uint64(1099511628211)  # primo FNV-64
+_MIX = np.uint64(0x9E3779B97F4A7C15)  # 2^64 / razão áurea
+_SHIFT = np.uint64(32)
+
+
+class EmbeddingBackend:
+    """Gera os vetores de um modelo do registro (EmbeddingModelSpec)."""
+
+    name = "base"
+
+    def embed(
+        self,
+        spec: "EmbeddingModelSpec",
+        texts: List[str],
+        batch_size: int = 100,
+        priority: int = PRIORITY_BULK
+    ) -> List[List[float]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Métricas do backend (ex: chunks/s de inferência local)."""
+        return {}
+
+
+class OpenAIBackend(EmbeddingBackend):
+    """Embeddings da API OpenAI, lote a lote pelo embedding_scheduler."""
+
+    name = "openai"
+
+    def __init__(self):
+        self._client = None
+
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url="https://api.openai.com/v1",
+                max_retries=0  # retries ficam com o embedding_scheduler (um único backoff)
+            )
+        return self._client
+
+    def _request(self, spec: "EmbeddingModelSpec", batch: List[str]):
+        """Uma requisição; devolve (vetores, headers) para o scheduler ler os limites."""
+        raw = self.client().embeddings.with_raw_response.create(
+            model=spec.name,
+            input=batch,
+            encoding_format="float"
+        )
+        return [item.embedding for item in raw.parse().data], raw.headers
+
+    def embed(self, spec, texts, batch_size=100, priority=PRIORITY_BULK):
+        api_key = os.getenv("OPENAI_API_KEY")
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            batch = [t if t.strip() else " " for t in texts[i:i + batch_size]]
+            tokens = sum(count_tokens(t) for t in batch)
+            embeddings.extend(call_with_limits(
+                self.name, api_key, tokens,
+                lambda: self._request(spec, batch),
+                priority=priority
+            ))
+        return embeddings
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Vetores locais por feature hashing de n-gramas de caracteres (com os
+    espaços, então palavras curtas viram features inteiras), com sinal, escala
+    log e norma 1. O lote inteiro é processado de uma vez em NumPy.
+    Mesmo texto -> mesmo vetor em qualquer processo e em qualquer lote; textos
+    com vocabulário em comum ficam próximos (serve para testes de carga e de
+    pipeline, não para medir qualidade de retrieval).
+    """
+
+    name = "hashing"
+
+    def __init__(self, ngrams=HASHING_NGRAMS):
+        self.ngrams = tuple(sorted(ngrams))
+
+    def embed_matrix(self, dim: int, texts: List[str]) -> np.ndarray:
+        # Cada texto seguido de n-1 bytes nulos: n-gramas que começam nele não
+        # enxergam o próximo; os que começam no preenchimento vão para uma linha descartada
+        pad = b"\0" * (self.ngrams[-1] - 1)
+        pieces = [f" {text.lower()} ".encode("utf-8") + pad for text in texts]
+        lengths = np.fromiter((len(piece) for piece in pieces), dtype=np.int64, count=len(pieces))
+        data = np.frombuffer(b"".join(pieces), dtype=np.uint8).astype(np.uint64)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        if pad:
+            rows[(np.cumsum(lengths)[:, None] - np.arange(1, len(pad) + 1)).ravel()] = len(texts)
+
+        # 2 * dim contadores por texto: metade positiva e metade negativa (sinal do hash)
+        base = rows * (2 * dim)
+        counts = np.zeros((len(texts) + 1) * 2 * dim, dtype=np.int64)
+        buckets = np.uint64(2 * dim)
+        h = data
+        with np.errstate(over="ignore"):
+            for n in range(2, self.ngrams[-1] + 1):
+                size = len(data) - n + 1
+                if size <= 0:
+                    break
+                h = h[:size] * _POLY + data[n - 1:]  # hash do n-grama a partir do (n-1)-grama
+                if n in self.ngrams:
+                    # Multiplicativo + redução por multiplicação (sem módulo)
+                    cells = ((h * _MIX) >> _SHIFT) * buckets >> _SHIFT
+                    counts += np.bincount(base[:size] + cells.astype(np.int64), minlength=len(counts))
+
+        halves = counts.reshape(len(texts) + 1, 2, dim)[:-1]
+        matrix = (halves[:, 0] - halves[:, 1]).astype(np.float32)
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        # Texto sem n-gramas: vetor unitário fixo (vetor nulo não tem distância de cosseno)
+        matrix[norms[:, 0] == 0, 0] = 1.0
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed(self, spec, texts, batch_size=100, priority=PRIORITY_BULK):
+        return self.embed_matrix(spec.dim, texts).tolist()
+
+
+_BACKENDS: Dict[str, EmbeddingBackend] = {
+    "openai": OpenAIBackend(),
+    "hashing": HashingBackend(),
+}
+# Backends com dependências opcionais: módulo importado no primeiro uso (ele se registra)
+_LAZY_BACKENDS = {
+    "onnx": "app.services.local_embeddings",
+}
+
+
+def register_backend(backend: EmbeddingBackend):
+    _BACKENDS[backend.name] = backend
+
+
+def backend_name(spec: "EmbeddingModelSpec") -> str:
+    return EMBEDDINGS_BACKEND or spec.provider
+
+
+def get_backend(spec: "EmbeddingModelSpec") -> EmbeddingBackend:
+    name = backend_name(spec)
+    if name not in _BACKENDS and name in _LAZY_BACKENDS:
+        importlib.import_module(_LAZY_BACKENDS[name])
+    if name not in _BACKENDS:
+        raise ValueError(f"Backend de embedding não suportado: {name}")
+    return _BACKENDS[name]
+
+
+def backend_stats() -> Dict[str, Dict]:
+    """Métricas dos backends já carregados."""
+    return {name: backend.stats() for name, backend in list(_BACKENDS.items())}
@@ -0,0 +1,109 @@
+"""
+Cache de embeddings endereçado por conteúdo v4.5
+- Chave: (modelo, sha256 do texto do chunk)
+- Lookup em lote antes de chamar o provider; só os misses são embedados
+- Estatísticas de hit ratio para os eventos de ingestão
+"""
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models.models import EmbeddingCache
+from app.services.embedding_models import EmbeddingModelSpec, get_embedding_model, embed_texts
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_BATCH_SIZE = 1000
+
+
+def content_hash(text: str) -> str:
+    """sha256 hex do texto do chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def lookup_cached(db: Session, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+    """Busca em lote os embeddings já calculados para os hashes informados."""
+    found = {}
+    for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        batch = hashes[i:i + LOOKUP_BATCH_SIZE]
+        rows = db.query(EmbeddingCache.content_hash, EmbeddingCache.embedding).filter(
+            EmbeddingCache.model == model,
+            EmbeddingCache.content_hash.in_(batch)
+        ).all()
+        for row in rows:
+            found[row.content_hash] = list(row.embedding)
+    return found
+
+
+def store_cached(db: Session, model: str, entries: Dict[str, List[float]]) -> None:
+    """
+    Grava novos embeddings no cache (ignora chaves já existentes).
+    Não faz commit: as entradas entram na transação do chamador.
+    """
+    if not entries:
+        return
+    stmt = pg_insert(EmbeddingCache).values([
+        {"model": model, "content_hash": key, "embedding": vector}
+        for key, vector in entries.items()
+    ]).on_conflict_do_nothing(index_elements=["model", "content_hash"])
+    db.execute(stmt)
+
+
+def embed_with_cache(
+    db: Session,
+    texts: List[str],
+    spec: Optional[EmbeddingModelSpec] = None,
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None
+) -> Tuple[List[List[float]], Dict]:
+    """
+    Gera embeddings consultando o cache primeiro.
+
+    Textos repetidos no mesmo lote são embedados uma única vez.
+
+    Returns:
+        (embeddings na ordem de `texts`, stats {"total", "hits", "misses", "hit_ratio"})
+        `misses` é o número de textos enviados ao provider.
+    """
+    spec = spec or get_embedding_model()
+    if embed_fn is None:
+        embed_fn = lambda batch: embed_texts(batch, spec)
+
+    hashes = [content_hash(text) for text in texts]
+    unique = list(dict.fromkeys(hashes))
+    cached = lookup_cached(db, spec.cache_key, unique)
+
+    misses = [key for key in unique if key not in cached]
+    if misses:
+        text_by_hash = dict(zip(hashes, texts))
+        vectors = embed_fn([text_by_hash[key] for key in misses])
+        new_entries = dict(zip(misses, vectors))
+        store_cached(db, spec.cache_key, new_entries)
+        cached.update(new_entries)
+
+    # Hit = texto que não precisou ir ao provider (cache ou repetido no lote)
+    hits = len(texts) - len(misses)
+    stats = {
+        "total": len(texts),
+        "hits": hits,
+        "misses": len(texts) - hits,
+        "hit_ratio": round(hits / len(texts), 4) if texts else 0.0,
+    }
+    logger.info(f"Embedding cache ({spec.cache_key}): {hits}/{len(texts)} hits")
+
+    return [cached[key] for key in hashes], stats
+
+
+def merge_cache_stats(total: Optional[Dict], stats: Dict) -> Dict:
+    """Acumula as estatísticas de vários lotes de embed_with_cache."""
+    if total is None:
+        return dict(stats)
+    hits = total["hits"] + stats["hits"]
+    count = total["total"] + stats["total"]
+    return {
+        "total": count,
+        "hits": hits,
+        "misses": count - hits,
+        "hit_ratio": round(hits / count, 4) if count else 0.0,
+    }
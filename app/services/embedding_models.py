@@ -0,0 +1,130 @@
+"""
+Registro de modelos de embedding v4.5
+- Nome, dimensão, provider e normalização de cada modelo
+- Uma coluna vetorial (e um índice) por modelo em knowledge_chunks
+- Consulta e ingestão usam sempre o mesmo modelo/coluna (por tenant, ver active_embedding_model)
+- Vetores gerados pelo backend configurado (embedding_backends)
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.embedding_backends import backend_name, get_backend
+from app.services.embedding_scheduler import PRIORITY_BULK
+
+
+@dataclass(frozen=True)
+class EmbeddingModelSpec:
+    name: str  # ID do modelo no provider
+    dim: int
+    provider: str  # backend: openai, onnx, ...
+    normalize: bool  # normalizar para norma 1 antes de gravar/consultar
+    column: str  # coluna vetorial em knowledge_chunks
+    index_cast: Optional[str] = None  # cast usado pelo índice (ex: halfvec para > 2000 dims)
+    usd_per_million_tokens: float = 0.0  # preço do provider (estimativa de custo de re-embedding)
+
+    @property
+    def search_column(self) -> str:
+        """Expressão SQL da coluna, igual à do índice (para o planner usar o índice)."""
+        if self.index_cast:
+            return f"(kc.{self.column})::{self.index_cast}"
+        return f"kc.{self.column}"
+
+    @property
+    def query_cast(self) -> str:
+        return self.index_cast or f"vector({self.dim})"
+
+    @property
+    def cache_key(self) -> str:
+        """Modelo no cache de embeddings; backends locais não se misturam com o provider."""
+        backend = backend_name(self)
+        return self.name if backend == self.provider else f"{self.name}@{backend}"
+
+
+EMBEDDING_MODELS: Dict[str, EmbeddingModelSpec] = {
+    "text-embedding-3-small": EmbeddingModelSpec(
+        name="text-embedding-3-small", dim=1536, provider="openai",
+        normalize=False, column="embedding", usd_per_million_tokens=0.02
+    ),
+    "text-embedding-3-large": EmbeddingModelSpec(
+        name="text-embedding-3-large", dim=3072, provider="openai",
+        normalize=False, column="embedding_large", index_cast="halfvec(3072)",
+        usd_per_million_tokens=0.13
+    ),
+    # Local (ONNX em CPU): nada sai do servidor; sem prefixos de consulta/passagem
+    "paraphrase-multilingual-MiniLM-L12-v2": EmbeddingModelSpec(
+        name="paraphrase-multilingual-MiniLM-L12-v2", dim=384, provider="onnx",
+        normalize=True, column="embedding_local"
+    ),
+}
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+
+
+def get_embedding_model(name: Optional[str] = None) -> EmbeddingModelSpec:
+    """Retorna a especificação do modelo (ou do modelo ativo se `name` for None)."""
+    name = name or DEFAULT_EMBEDDING_MODEL
+    if name not in EMBEDDING_MODELS:
+        raise ValueError(f"Modelo de embedding não registrado: {name}")
+    return EMBEDDING_MODELS[name]
+
+
+def active_embedding_model(db, tenant_id: Optional[int]) -> EmbeddingModelSpec:
+    """
+    Modelo usado pelo tenant na busca e na ingestão: tenants.embedding_model
+    (gravado pela troca ao fim de um re-embedding), senão EMBEDDINGS_MODEL.
+    """
+    if tenant_id is not None:
+        from app.models.models import Tenant
+        name = db.query(Tenant.embedding_model).filter(Tenant.id == tenant_id).scalar()
+        if name:
+            return get_embedding_model(name)
+    return get_embedding_model()
+
+
+def normalize_vectors(vectors: List[List[float]]) -> List[List[float]]:
+    """Normaliza cada vetor para norma 1 (vetores nulos ficam inalterados)."""
+    if not vectors:
+        return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).tolist()
+
+
+def vector_literal(vector: List[float]) -> str:
+    """Formato texto do pgvector: [1.0,2.0,3.0]"""
+    return "[" + ",".join(map(str, vector)) + "]"
+
+
+def chunk_embedding_fields(spec: EmbeddingModelSpec, vector: List[float]) -> dict:
+    """Campos de KnowledgeChunk para gravar um vetor do modelo na coluna correta."""
+    return {spec.column: vector, "embedding_model": spec.name}
+
+
+def embed_texts(
+    texts: List[str],
+    spec: Optional[EmbeddingModelSpec] = None,
+    batch_size: int = 100,
+    priority: int = PRIORITY_BULK
+) -> List[List[float]]:
+    """
+    Gera embeddings com o modelo informado, em lotes.
+    Backend da API: cada lote passa pelo embedding_scheduler (limites por API
+    key, prioridade, retry com backoff). Falhas do provider são propagadas
+    (nunca retorna vetores falsos). EMBEDDINGS_BACKEND=hashing gera localmente.
+    
+    Args:
+        priority: PRIORITY_INTERACTIVE para consultas, PRIORITY_BULK para ingestão
+    """
+    spec = spec or get_embedding_model()
+    if not texts:
+        return []
+
+    embeddings = get_backend(spec).embed(spec, texts, batch_size=batch_size, priority=priority)
+
+    if spec.normalize:
+        embeddings = normalize_vectors(embeddings)
+    return embeddings
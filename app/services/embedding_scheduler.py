@@ -0,0 +1,253 @@
+"""
+Agendador de chamadas de embedding v4.5
+- Token buckets de requisições/min e tokens/min por (provider, API key)
+- Limites ajustados pelos headers x-ratelimit-* de cada resposta
+- Fila por prioridade: embeddings de consulta (interativos), depois ingestão em lote, depois backfill
+- 429/5xx/erros de conexão: retry com backoff exponencial e jitter (respeita retry-after)
+- Falha definitiva é propagada: nunca devolve vetores zerados
+"""
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Estimativas iniciais (substituídas pelos headers do provider na primeira resposta)
+EMBED_RPM = int(os.getenv("EMBED_RPM", 3000))
+EMBED_TPM = int(os.getenv("EMBED_TPM", 1_000_000))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 6))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", 0.5))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", 30))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+PRIORITY_BACKFILL = 20  # vetorização lazy em segundo plano: só usa a folga
+
+T = TypeVar("T")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Durações dos headers da OpenAI: "1s", "6m0s", "20ms", "0.5s"."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Bucket com capacidade por minuto e reposição contínua."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos até `amount` estar disponível (0 se já estiver)."""
+        self._refill(now)
+        # Pedidos maiores que a capacidade passam com o bucket cheio
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        self.available -= amount
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], reset: Optional[float], now: float):
+        """Ajusta pelo estado informado pelo provider."""
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.available = min(self.available, float(remaining))
+        if reset is not None and remaining == 0:
+            # Vazio até o reset informado
+            self.available = -reset * self.capacity / 60.0
+
+    def pause(self, seconds: float, now: float):
+        """Esvazia o bucket por `seconds` (após um 429)."""
+        self._refill(now)
+        self.available = min(self.available, -seconds * self.capacity / 60.0)
+
+
+class RateLimiter:
+    """Orçamento de uma (provider, API key), compartilhado pelas threads do processo."""
+
+    def __init__(self, rpm: int = EMBED_RPM, tpm: int = EMBED_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting = []  # heap (prioridade, ordem)
+        self._order = itertools.count()
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_BULK):
+        """
+        Bloqueia até haver orçamento para 1 requisição com `tokens` tokens.
+        Quem tem prioridade menor passa na frente; mesma prioridade, por ordem de chegada.
+        """
+        ticket = (priority, next(self._order))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        now = time.monotonic()
+                        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            return
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait(timeout=1.0)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def update(self, headers: Mapping[str, str]):
+        """Aplica os headers x-ratelimit-* da resposta."""
+        def number(name: str) -> Optional[int]:
+            value = headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._cond:
+            now = time.monotonic()
+            self.requests.sync(
+                number("x-ratelimit-limit-requests"),
+                number("x-ratelimit-remaining-requests"),
+                _parse_duration(headers.get("x-ratelimit-reset-requests")),
+                now
+            )
+            self.tokens.sync(
+                number("x-ratelimit-limit-tokens"),
+                number("x-ratelimit-remaining-tokens"),
+                _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+                now
+            )
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Suspende todas as chamadas desta key por `seconds` (429 recebido)."""
+        with self._cond:
+            now = time.monotonic()
+            self.requests.pause(seconds, now)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "rpm": int(self.requests.capacity),
+                "tpm": int(self.tokens.capacity),
+                "requests_available": int(self.requests.available),
+                "tokens_available": int(self.tokens.available),
+                "waiting": len(self._waiting),
+            }
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, api_key: Optional[str]) -> RateLimiter:
+    """Limiter da (provider, API key); a key é identificada só pelo hash."""
+    key = (provider, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16])
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter()
+        return _limiters[key]
+
+
+def limiter_stats() -> Dict[str, Dict]:
+    with _limiters_lock:
+        items = list(_limiters.items())
+    return {f"{provider}:{key_hash}": limiter.snapshot() for (provider, key_hash), limiter in items}
+
+
+def _error_headers(error: Exception) -> Mapping[str, str]:
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = _error_headers(error)
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    return _parse_duration(headers.get("retry-after")) or _parse_duration(headers.get("x-ratelimit-reset-requests"))
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Sem status HTTP: timeout/erro de conexão
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout")
+
+
+def call_with_limits(
+    provider: str,
+    api_key: Optional[str],
+    tokens: int,
+    request: Callable[[], Tuple[T, Mapping[str, str]]],
+    priority: int = PRIORITY_BULK
+) -> T:
+    """
+    Executa `request` dentro do orçamento da (provider, API key).
+
+    `request` devolve (resultado, headers da resposta). Erros 429/5xx e de
+    conexão são repetidos até EMBED_MAX_RETRIES vezes com backoff exponencial
+    com jitter; um 429 pausa a key inteira pelo retry-after informado.
+    """
+    limiter = get_limiter(provider, api_key)
+    attempt = 0
+    while True:
+        limiter.acquire(tokens, priority)
+        try:
+            result, headers = request()
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= EMBED_MAX_RETRIES:
+                raise
+            backoff = random.uniform(0, min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * (2 ** attempt)))
+            retry_after = _retry_after(e)
+            if getattr(e, "status_code", None) == 429:
+                limiter.update(_error_headers(e))
+                limiter.pause(retry_after or backoff)
+            delay = max(backoff, retry_after or 0.0)
+            attempt += 1
+            logger.warning(
+                f"Embedding {provider}: {type(e).__name__}, retry {attempt}/{EMBED_MAX_RETRIES} em {delay:.2f}s"
+            )
+            time.sleep(delay)
+            continue
+
+        limiter.update(headers)
+        return result
@@ -0,0 +1,394 @@
+"""
+Pipeline de ingestão em estágios v4.5
+- parse/chunk -> embed -> insert em threads separadas, ligadas por filas limitadas
+- Parsing do documento N+1, embeddings do N e gravação do N-1 acontecem ao mesmo tempo
+- Backpressure: fila cheia bloqueia o estágio anterior (ex: provider com rate limit)
+- Profundidade de fila e throughput por estágio em stats()
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from app.core.database import SessionLocal
+from app.models.models import Document, KnowledgeChunk
+from app.services.document_processor import DocumentProcessor, EMBED_BATCH_SIZE
+from app.services.embedding_cache import embed_with_cache, merge_cache_stats
+from app.services.embedding_models import EmbeddingModelSpec
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_PARSE_WORKERS = int(os.getenv("PIPELINE_PARSE_WORKERS", 2))
+PIPELINE_EMBED_WORKERS = int(os.getenv("PIPELINE_EMBED_WORKERS", 2))
+# Lotes de chunks em espera entre dois estágios
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 8))
+
+_STOP = object()
+
+
+@dataclass
+class IngestTask:
+    """Documento já criado no banco, a ser indexado."""
+    document_id: int
+    file_path: str
+    filename: str
+    # on_done(document_id, chunks, error): chamado pelo estágio de gravação
+    on_done: Optional[Callable[[int, int, Optional[Exception]], None]] = None
+    table_mode: Optional[str] = None
+
+
+@dataclass
+class _Batch:
+    task: IngestTask
+    start_index: int
+    texts: List[str]
+    spec: EmbeddingModelSpec  # modelo ativo do tenant no início do documento
+    lazy: bool = False  # documento lazy: passa pelo estágio de embeddings sem embedar
+    embeddings: Optional[List[List[float]]] = None
+    error: Optional[Exception] = None
+
+
+@dataclass
+class _End:
+    """Fim do documento no estágio de parsing (com o total de lotes emitidos)."""
+    task: IngestTask
+    batches: int
+    error: Optional[Exception] = None
+
+
+@dataclass
+class _DocumentState:
+    upto: int  # checkpoint: prefixo contíguo de chunks gravados
+    batches_written: int = 0
+    batches_total: Optional[int] = None
+    chunks: int = 0
+    error: Optional[Exception] = None
+    written: Dict[int, int] = field(default_factory=dict)  # lotes gravados além do checkpoint
+
+    def advance(self, start_index: int, count: int) -> int:
+        self.written[start_index] = count
+        while self.upto in self.written:
+            self.upto += self.written.pop(self.upto)
+        return self.upto
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    input: Optional[queue.Queue] = field(default=None, repr=False)
+    items: int = 0
+    chunks: int = 0
+    busy_seconds: float = 0.0
+    max_depth: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, chunks: int, seconds: float):
+        with self.lock:
+            self.items += 1
+            self.chunks += chunks
+            self.busy_seconds += seconds
+            if self.input is not None:
+                self.max_depth = max(self.max_depth, self.input.qsize())
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            # Throughput do estágio: chunks por segundo de trabalho (sem tempo bloqueado em fila)
+            capacity = self.chunks / self.busy_seconds * self.workers if self.busy_seconds else None
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "chunks": self.chunks,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "chunks_per_second": round(capacity, 1) if capacity else None,
+                "queue_depth": self.input.qsize() if self.input is not None else None,
+                "queue_max_depth": self.max_depth,
+            }
+
+
+class IngestPipeline:
+    """
+    Indexa documentos em três estágios concorrentes:
+
+    1. parse: extrai e chunka (DocumentProcessor.iter_chunk_texts), em lotes
+    2. embed: embeddings com cache (sessão própria; só entradas de cache são commitadas);
+       lotes de documentos lazy passam sem embeddings
+    3. write: grava KnowledgeChunk lote a lote e marca o documento READY/ERROR
+
+    Os chunks recebem chunk_index no parsing, então os lotes podem ser embedados
+    fora de ordem. Gravação em uma única thread; cada lote é commitado com o
+    checkpoint (documents.embedded_upto = maior prefixo contíguo gravado), e um
+    documento reenviado retoma desse ponto. Os chunks só aparecem na busca
+    quando o documento fica READY (ou com RAG_SEARCH_PARTIAL).
+    """
+
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        parse_workers: int = PIPELINE_PARSE_WORKERS,
+        embed_workers: int = PIPELINE_EMBED_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        batch_size: int = EMBED_BATCH_SIZE
+    ):
+        self.processor = DocumentProcessor()
+        self.embed_fn = embed_fn or self.processor.generate_embeddings_batch
+        self.batch_size = batch_size
+        self.cache_stats: Optional[Dict] = None
+
+        self._tasks: queue.Queue = queue.Queue(maxsize=max(parse_workers * 2, 1))
+        self._to_embed: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._to_write: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stages = {
+            "parse": StageStats("parse", parse_workers, self._tasks),
+            "embed": StageStats("embed", embed_workers, self._to_embed),
+            "write": StageStats("write", 1, self._to_write),
+        }
+        self._lock = threading.Lock()
+        self._embed_workers_left = embed_workers
+        self._parse_workers_left = parse_workers
+
+        self._threads = (
+            [threading.Thread(target=self._parse_worker, name=f"ingest-parse-{i}", daemon=True) for i in range(parse_workers)]
+            + [threading.Thread(target=self._embed_worker, name=f"ingest-embed-{i}", daemon=True) for i in range(embed_workers)]
+            + [threading.Thread(target=self._write_worker, name="ingest-write", daemon=True)]
+        )
+        for thread in self._threads:
+            thread.start()
+
+    # -- API -----------------------------------------------------------------
+
+    def submit(self, task: IngestTask):
+        """Enfileira um documento (bloqueia se o estágio de parsing estiver cheio)."""
+        self._tasks.put(task)
+
+    def close(self, wait: bool = True):
+        """Sem novos documentos: os estágios terminam depois de esvaziar as filas."""
+        for _ in range(self._stages["parse"].workers):
+            self._tasks.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> Dict:
+        return {name: stage.snapshot() for name, stage in self._stages.items()}
+
+    # -- Estágios ------------------------------------------------------------
+
+    def _parse_worker(self):
+        stage = self._stages["parse"]
+        while True:
+            task = self._tasks.get()
+            if task is _STOP:
+                break
+
+            batches = 0
+            error = None
+            try:
+                processor = DocumentProcessor()
+                if task.table_mode:
+                    processor.table_mode = task.table_mode
+                started_document = self._start_document(processor, task)
+                if started_document is None:
+                    # Removido enquanto esperava na fila: nada a parsear nem gravar
+                    self._skip(task)
+                    continue
+                start_index, chunk_texts = started_document
+
+                texts: List[str] = []
+                started = time.perf_counter()
+                for text in chunk_texts:
+                    texts.append(text)
+                    if len(texts) >= self.batch_size:
+                        stage.record(len(texts), time.perf_counter() - started)
+                        self._to_embed.put(_Batch(task, start_index, texts, processor.embedding_spec, processor.lazy))
+                        batches += 1
+                        start_index += len(texts)
+                        texts = []
+                        started = time.perf_counter()
+                if texts:
+                    stage.record(len(texts), time.perf_counter() - started)
+                    self._to_embed.put(_Batch(task, start_index, texts, processor.embedding_spec, processor.lazy))
+                    batches += 1
+            except Exception as e:
+                logger.error(f"Ingestão: falha no parsing de {task.filename}: {e}")
+                error = e
+            self._to_embed.put(_End(task, batches, error))
+
+        with self._lock:
+            self._parse_workers_left -= 1
+            last = self._parse_workers_left == 0
+        if last:
+            for _ in range(self._stages["embed"].workers):
+                self._to_embed.put(_STOP)
+
+    def _embed_worker(self):
+        stage = self._stages["embed"]
+        db = SessionLocal()
+        failed = set()
+        try:
+            while True:
+                item = self._to_embed.get()
+                if item is _STOP:
+                    break
+                if isinstance(item, _Batch) and item.lazy:
+                    pass  # embeddings sob demanda (lazy_vectorize)
+                elif isinstance(item, _Batch) and item.task.document_id not in failed:
+                    started = time.perf_counter()
+                    try:
+                        item.embeddings, stats = embed_with_cache(db, item.texts, item.spec, embed_fn=self.embed_fn)
+                        db.commit()  # só entradas do cache (endereçadas por conteúdo)
+                        with self._lock:
+                            self.cache_stats = merge_cache_stats(self.cache_stats, stats)
+                    except Exception as e:
+                        db.rollback()
+                        logger.error(f"Ingestão: falha nos embeddings de {item.task.filename}: {e}")
+                        item.error = e
+                        failed.add(item.task.document_id)
+                    stage.record(len(item.texts), time.perf_counter() - started)
+                elif isinstance(item, _Batch):
+                    item.error = RuntimeError("lote anterior do documento falhou")
+                self._to_write.put(item)
+        finally:
+            db.close()
+            with self._lock:
+                self._embed_workers_left -= 1
+                last = self._embed_workers_left == 0
+            if last:
+                self._to_write.put(_STOP)
+
+    def _write_worker(self):
+        documents: Dict[int, _DocumentState] = {}
+        aborted = set()  # documentos já finalizados com erro inesperado (lotes restantes descartados)
+        db = SessionLocal()
+        try:
+            while True:
+                item = self._to_write.get()
+                if item is _STOP:
+                    break
+                if item.task.document_id in aborted:
+                    continue
+                # Um item com erro não pode derrubar o estágio: os embed workers
+                # ficariam bloqueados na fila cheia e o lote inteiro travaria
+                try:
+                    self._write_item(db, documents, item)
+                except Exception as e:
+                    logger.error(f"Ingestão: falha inesperada na gravação de {item.task.filename}: {e}")
+                    documents.pop(item.task.document_id, None)
+                    aborted.add(item.task.document_id)
+                    db.close()
+                    db = SessionLocal()  # a sessão pode ter ficado inutilizável
+                    self._abort(item.task, e)
+        finally:
+            db.close()
+
+    def _write_item(self, db, documents: Dict[int, "_DocumentState"], item):
+        stage = self._stages["write"]
+        task = item.task
+        state = documents.get(task.document_id)
+        if state is None:
+            upto = db.query(Document.embedded_upto).filter(Document.id == task.document_id).scalar()
+            state = documents[task.document_id] = _DocumentState(upto=upto or 0)
+
+        if isinstance(item, _End):
+            state.batches_total = item.batches
+            state.error = state.error or item.error
+        elif item.error is not None:
+            state.error = state.error or item.error
+            state.batches_written += 1
+        else:
+            started = time.perf_counter()
+            if state.error is None:
+                try:
+                    db.add_all(self.processor.chunk_rows(
+                        task.document_id, item.start_index, item.texts, item.embeddings, item.spec
+                    ))
+                    db.query(Document).filter(Document.id == task.document_id).update(
+                        {"embedded_upto": state.advance(item.start_index, len(item.texts))}
+                    )
+                    db.commit()
+                    state.chunks += len(item.texts)
+                except Exception as e:
+                    db.rollback()
+                    state.written.pop(item.start_index, None)
+                    logger.error(f"Ingestão: falha ao gravar chunks de {task.filename}: {e}")
+                    state.error = e
+            state.batches_written += 1
+            stage.record(len(item.texts), time.perf_counter() - started)
+
+        if state.batches_total is not None and state.batches_written >= state.batches_total:
+            del documents[task.document_id]
+            self._finish(db, task, state)
+
+    def _abort(self, task: IngestTask, error: Exception):
+        """Marca ERROR (sessão nova) e avisa o chamador; chunks gravados ficam até o checkpoint."""
+        db = SessionLocal()
+        try:
+            db.query(Document).filter(
+                Document.id == task.document_id, Document.deleted_at.is_(None)
+            ).update({"status": "ERROR"})
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ingestão: não foi possível marcar {task.filename} como ERROR: {e}")
+        finally:
+            db.close()
+        if task.on_done:
+            try:
+                task.on_done(task.document_id, 0, error)
+            except Exception as e:
+                logger.error(f"Ingestão: callback de {task.filename} falhou: {e}")
+
+    def _finish(self, db, task: IngestTask, state: _DocumentState):
+        error = state.error
+        if error is None and state.upto == 0:
+            error = ValueError("Documento vazio ou sem texto extraível")
+        try:
+            if error is not None:
+                # Mantém o checkpoint (prefixo contíguo); descarta lotes gravados depois de um buraco
+                db.query(KnowledgeChunk).filter(
+                    KnowledgeChunk.document_id == task.document_id,
+                    KnowledgeChunk.chunk_index >= state.upto
+                ).delete(synchronize_session=False)
+            # Documento removido durante a ingestão continua DELETED (o reaper limpa)
+            db.query(Document).filter(
+                Document.id == task.document_id, Document.deleted_at.is_(None)
+            ).update({"status": "ERROR" if error is not None else "READY"})
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ingestão: falha ao finalizar {task.filename}: {e}")
+            error = error or e
+        if task.on_done:
+            try:
+                task.on_done(task.document_id, state.upto if error is None else 0, error)
+            except Exception as e:
+                logger.error(f"Ingestão: callback de {task.filename} falhou: {e}")
+
+    def _start_document(self, processor: DocumentProcessor, task: IngestTask):
+        """Marca PROCESSING e devolve (checkpoint, chunks pendentes); None se o documento foi removido."""
+        db = SessionLocal()
+        try:
+            started = db.query(Document).filter(
+                Document.id == task.document_id, Document.deleted_at.is_(None)
+            ).update({"status": "PROCESSING"})
+            db.commit()
+            if not started:
+                return None
+            start_index, chunk_texts = processor.iter_pending_chunks(
+                db, task.document_id, task.file_path, task.filename
+            )
+            db.commit()
+            return start_index, chunk_texts
+        finally:
+            db.close()
+
+    def _skip(self, task: IngestTask):
+        logger.info(f"Ingestão: {task.filename} removido antes do parsing, ignorado")
+        if task.on_done:
+            try:
+                task.on_done(task.document_id, 0, None)
+            except Exception as e:
+                logger.error(f"Ingestão: callback de {task.filename} falhou: {e}")
@@ -5,46 +5,50 @@ from pydantic import BaseModel
 from typing import List
 import io, time
 
-def _read_txt(raw: bytes) -> str:
-    return raw.decode("utf-8", errors="ignore")
+def _read_txt(source) -> str:
+    # decodifica direto do arquivo (sem cópia dos bytes em memória)
+    return io.TextIOWrapper(source, encoding="utf-8", errors="ignore").read()
 
-def _read_pdf(raw: bytes) -> str:
+def _read_pdf(source) -> str:
     # tenta pypdf, fallback pdfminer
     try:
         import pypdf
-        pdf = pypdf.PdfReader(io.BytesIO(raw))
+        pdf = pypdf.PdfReader(source)
         return "\n".join(page.extract_text() or "" for page in pdf.pages)
     except Exception:
         from pdfminer.high_level import extract_text
-        return extract_text(io.BytesIO(raw))
+        source.seek(0)
+        return extract_text(source)
 
-def _read_docx(raw: bytes) -> str:
-    import docx
-    bio = io.BytesIO(raw)
-    doc = docx.Document(bio)
-    return "\n".join(p.text for p in doc.paragraphs)
+def _read_docx(source) -> str:
+    # parágrafos e tabelas, lidos em streaming do XML
+    from app.rag.utils.parsers import iter_docx_blocks
+    return "\n".join(iter_docx_blocks(source))
 
-def extract_text(file: UploadFile, raw: bytes) -> str:
-    """Extrai texto de TXT, PDF, DOCX"""
-    name = file.filename.lower()
+def _extract(filename: str, source) -> str:
+    name = (filename or "").lower()
     if name.endswith(".txt") or name.endswith(".md"):
-        return _read_txt(raw)
+        return _read_txt(source)
     if name.endswith(".pdf"):
-        return _read_pdf(raw)
+        return _read_pdf(source)
     if name.endswith(".docx"):
-        return _read_docx(raw)
+        return _read_docx(source)
     # fallback binário – trata como txt
-    return _read_txt(raw)
+    return _read_txt(source)
+
+def extract_text(file: UploadFile, raw: bytes) -> str:
+    """Extrai texto de TXT, PDF, DOCX"""
+    return _extract(file.filename, io.BytesIO(raw))
+
+def extract_text_from_path(path: str, filename: str) -> str:
+    """Extrai texto de um upload já gravado em disco, lendo do arquivo (sem carregar os bytes)"""
+    with open(path, "rb") as source:
+        return _extract(filename, source)
 
 def chunk_text(text: str, max_tokens: int = 700) -> List[str]:
-    """Split simples por tamanho de caractere ~2 tokens/char (aprox)"""
-    sz = max_tokens * 2
-    blocks = []
-    i = 0
-    while i < len(text):
-        blocks.append(text[i:i+sz])
-        i += sz
-    return blocks
+    """Chunks de até max_tokens tokens, cortados em parágrafo/sentença"""
+    from app.services.chunker import iter_chunks
+    return [chunk.text for chunk in iter_chunks(text, max_tokens, 0)]
 
 class VectorizeResult(BaseModel):
     chunks: int
@@ -54,10 +58,14 @@ def vectorize_document(session, tenant_id: int, document_id: str, text: str) ->
     """Vetoriza documento e salva chunks no banco"""
     from app.services.llm import embed_texts
     from app.models.models import KnowledgeItem, KnowledgeChunk
+    from app.services.embedding_cache import embed_with_cache
+    from app.services.embedding_models import get_embedding_model, chunk_embedding_fields
     
     start = time.time()
+    spec = get_embedding_model()
     chunks = chunk_text(text)
-    embeddings = embed_texts(chunks)  # retorna list[list[float]]
+    # só chunks ausentes do cache vão para a API
+    embeddings, _ = embed_with_cache(session, chunks, spec, embed_fn=lambda batch: embed_texts(batch, spec.name))
 
     # Salvar chunks
     for idx, (content, emb) in enumerate(zip(chunks, embeddings)):
@@ -65,7 +73,7 @@ def vectorize_document(session, tenant_id: int, document_id: str, text: str) ->
             item_id=document_id,
             idx=idx,
             text=content,
-            embedding=emb
+            **chunk_embedding_fields(spec, emb)
         ))
     
     # Atualizar status do documento
@@ -0,0 +1,216 @@
+"""
+Vetorização sob demanda (modo lazy) v4.5
+- Documentos lazy são parseados, chunkados e indexados por texto na ingestão, sem embeddings
+- Primeira consulta a um agente com documentos pendentes enfileira a vetorização deles
+- Backfill de baixa prioridade (tools/lazy_backfill.py) vetoriza o restante na folga do rate limit
+- Enquanto isso, a busca por palavra-chave (content_tsv) cobre os chunks sem vetor
+- documents.vector_status: PENDING -> RUNNING -> READY (claim atômico; claim expirado é retomado)
+- Pendências por agente em cache curto (LAZY_PENDING_CACHE_SECONDS): sem consultas extras a cada chat
+"""
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.models import Document, KnowledgeChunk
+from app.services.embedding_cache import embed_with_cache
+from app.services.embedding_models import active_embedding_model, embed_texts
+from app.services.embedding_scheduler import PRIORITY_BACKFILL, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+LAZY_BATCH_SIZE = int(os.getenv("LAZY_BATCH_SIZE", 64))
+# RUNNING há mais tempo que isso = worker morreu; outro pode assumir
+LAZY_CLAIM_TIMEOUT_MINUTES = int(os.getenv("LAZY_CLAIM_TIMEOUT_MINUTES", 30))
+# Validade do cache de pendências por agente (0 = consulta o banco sempre)
+LAZY_PENDING_CACHE_SECONDS = float(os.getenv("LAZY_PENDING_CACHE_SECONDS", 30))
+
+_pending_cache: Dict[Tuple[int, Optional[int]], Tuple[float, List[int]]] = {}
+_pending_lock = threading.Lock()
+
+
+def _claimable(now: datetime):
+    expired = now - timedelta(minutes=LAZY_CLAIM_TIMEOUT_MINUTES)
+    return or_(
+        Document.vector_status == "PENDING",
+        (Document.vector_status == "RUNNING") & (Document.vector_requested_at < expired)
+    )
+
+
+def pending_documents(db: Session, tenant_id: int, agent_id: Optional[int] = None) -> List[int]:
+    """
+    Documentos lazy do agente (ou do tenant) ainda sem vetores. Chamado a cada
+    consulta RAG: o resultado fica em cache por LAZY_PENDING_CACHE_SECONDS (um
+    documento lazy novo aparece na busca por palavra-chave com esse atraso).
+    """
+    key = (tenant_id, agent_id)
+    now = time.monotonic()
+    with _pending_lock:
+        cached = _pending_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    query = db.query(Document.id).filter(
+        Document.tenant_id == tenant_id,
+        Document.status == "READY",
+        Document.deleted_at.is_(None),
+        Document.vector_status.in_(["PENDING", "RUNNING"])
+    )
+    if agent_id is not None:
+        query = query.filter(Document.agent_id == agent_id)
+    document_ids = [document_id for document_id, in query.all()]
+    with _pending_lock:
+        _pending_cache[key] = (now + LAZY_PENDING_CACHE_SECONDS, document_ids)
+    return document_ids
+
+
+def _claim(db: Session, document_id: int) -> bool:
+    """PENDING (ou RUNNING expirado) -> RUNNING; False se outro worker já pegou."""
+    now = datetime.utcnow()
+    claimed = db.query(Document).filter(
+        Document.id == document_id,
+        Document.status == "READY",
+        Document.deleted_at.is_(None),
+        _claimable(now)
+    ).update({"vector_status": "RUNNING", "vector_requested_at": now}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def vectorize_document(document_id: int, priority: int = PRIORITY_BULK) -> int:
+    """
+    Gera os embeddings dos chunks do documento que ainda não têm vetor no
+    modelo ativo do tenant, em lotes commitados (retomável). Retorna o número
+    de chunks vetorizados (0 se o documento não estava pendente).
+    """
+    db = SessionLocal()
+    try:
+        if not _claim(db, document_id):
+            return 0
+        document = db.query(Document).filter(Document.id == document_id).first()
+        spec = active_embedding_model(db, document.tenant_id)
+        column = getattr(KnowledgeChunk, spec.column)
+
+        done = 0
+        last_index = -1
+        while True:
+            rows = db.query(KnowledgeChunk.id, KnowledgeChunk.chunk_index, KnowledgeChunk.content).filter(
+                KnowledgeChunk.document_id == document_id,
+                KnowledgeChunk.chunk_index > last_index,
+                column.is_(None)
+            ).order_by(KnowledgeChunk.chunk_index).limit(LAZY_BATCH_SIZE).all()
+            if not rows:
+                break
+            vectors, _ = embed_with_cache(
+                db, [row.content for row in rows], spec,
+                embed_fn=lambda batch: embed_texts(batch, spec, priority=priority)
+            )
+            db.execute(update(KnowledgeChunk), [
+                {"id": row.id, spec.column: vector, "embedding_model": spec.name}
+                for row, vector in zip(rows, vectors)
+            ])
+            # Renova o claim a cada lote (documentos grandes não expiram no meio)
+            renewed = db.query(Document).filter(
+                Document.id == document_id, Document.deleted_at.is_(None)
+            ).update({"vector_requested_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            done += len(rows)
+            last_index = rows[-1].chunk_index
+            if not renewed:
+                logger.info(f"Documento {document_id}: removido durante a vetorização lazy")
+                return done
+
+        # Documento removido no meio do caminho continua DELETED (o reaper cuida dele)
+        db.query(Document).filter(
+            Document.id == document_id, Document.deleted_at.is_(None)
+        ).update({"vector_status": "READY", "vector_requested_at": None}, synchronize_session=False)
+        db.commit()
+        logger.info(f"Documento {document_id}: {done} chunks vetorizados sob demanda ({spec.name})")
+        return done
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Documento {document_id}: falha na vetorização lazy: {e}")
+        # Lotes já gravados ficam; volta para a fila
+        db.query(Document).filter(
+            Document.id == document_id, Document.deleted_at.is_(None)
+        ).update(
+            {"vector_status": "PENDING", "vector_requested_at": None}, synchronize_session=False
+        )
+        db.commit()
+        raise
+    finally:
+        db.close()
+
+
+def backfill(limit: Optional[int] = None, tenant_id: Optional[int] = None, priority: int = PRIORITY_BACKFILL) -> int:
+    """Vetoriza documentos lazy pendentes, mais antigos primeiro. Retorna quantos foram concluídos."""
+    completed = 0
+    skipped = set()
+    while limit is None or completed < limit:
+        db = SessionLocal()
+        try:
+            query = db.query(Document.id).filter(
+                Document.status == "READY",
+                Document.deleted_at.is_(None),
+                _claimable(datetime.utcnow())
+            )
+            if tenant_id is not None:
+                query = query.filter(Document.tenant_id == tenant_id)
+            if skipped:
+                query = query.filter(Document.id.notin_(skipped))
+            row = query.order_by(Document.id).first()
+        finally:
+            db.close()
+        if row is None:
+            break
+        try:
+            vectorize_document(row.id, priority)
+            completed += 1
+        except Exception:
+            skipped.add(row.id)  # falhou nesta execução; o próximo backfill tenta de novo
+    return completed
+
+
+# ---------------------------------------------------------------------------
+# Fila em memória para os pedidos disparados por consultas
+# ---------------------------------------------------------------------------
+
+_queue: "queue.PriorityQueue" = queue.PriorityQueue()
+_queued = set()
+_order = itertools.count()
+_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+
+
+def _work():
+    while True:
+        priority, _, document_id = _queue.get()
+        try:
+            vectorize_document(document_id, priority)
+        except Exception:
+            pass  # já logado; documento voltou para PENDING
+        finally:
+            with _lock:
+                _queued.discard(document_id)
+
+
+def request_vectorization(document_ids: List[int], priority: int = PRIORITY_BULK):
+    """Enfileira documentos para vetorizar em segundo plano (sem bloquear a consulta)."""
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="lazy-vectorize", daemon=True)
+            _worker.start()
+        for document_id in document_ids:
+            if document_id not in _queued:
+                _queued.add(document_id)
+                _queue.put((priority, next(_order), document_id))
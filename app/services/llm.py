@@ -119,6 +119,8 @@ def chat_completion(
 def embed_texts(texts: List[str], model: str = "text-embedding-3-small") -> List[List[float]]:
     """
     Gera embeddings para lista de textos usando OpenAI API.
+    v4.5: Via embedding_scheduler (limites por API key, retry com backoff);
+    erros são propagados em vez de vetores zerados.
     
     Args:
         texts: Lista de textos para embedar
@@ -127,29 +129,10 @@ def embed_texts(texts: List[str], model: str = "text-embedding-3-small") -> List
     Returns:
         Lista de embeddings (list[list[float]])
     """
-    import requests
-    
-    OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+    from app.services.embedding_models import embed_texts as embed_with_model, get_embedding_model
     
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY not configured")
     
-    url = f"{OPENAI_API_BASE}/embeddings"
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    try:
-        resp = requests.post(url, headers=headers, json={
-            "model": model,
-            "input": texts
-        }, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-        return [d["embedding"] for d in data["data"]]
-    except Exception as e:
-        logger.error(f"Embedding API error: {e}")
-        # Retorna embeddings vazios para não quebrar o fluxo
-        return [[0.0] * 1536 for _ in texts]  # 1536 dims para text-embedding-3-small
+    return embed_with_model(texts, get_embedding_model(model))
 
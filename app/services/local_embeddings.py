@@ -0,0 +1,172 @@
+"""
+Embeddings locais em CPU (ONNX Runtime) v4.5
+- Modelo sentence-transformers exportado para ONNX (model.onnx + tokenizer.json), carregado uma vez por processo
+- Nenhum texto sai do servidor (tenants com restrição de residência de dados) e sem latência de rede na consulta
+- Inferência em lotes ordenados por tamanho (menos padding), mean pooling e norma 1
+- Threads do ONNX Runtime configuráveis; pool de processos dedicado opcional
+- Throughput (chunks/s) em stats()
+- Dependências opcionais: pip install onnxruntime tokenizers
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.embedding_backends import EmbeddingBackend, register_backend
+from app.services.embedding_scheduler import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "/models/paraphrase-multilingual-MiniLM-L12-v2")
+# Processos dedicados à inferência (0 = no próprio processo, serializado)
+LOCAL_EMBEDDING_PROCESSES = int(os.getenv("LOCAL_EMBEDDING_PROCESSES", 0))
+# Threads intra-op do ONNX Runtime por processo (0 = núcleos / processos)
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", 0)) or max(
+    (os.cpu_count() or 1) // max(LOCAL_EMBEDDING_PROCESSES, 1), 1
+)
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", 32))
+LOCAL_EMBEDDING_MAX_TOKENS = int(os.getenv("LOCAL_EMBEDDING_MAX_TOKENS", 256))
+
+
+class LocalModel:
+    """Sessão ONNX + tokenizer de um diretório de modelo."""
+
+    def __init__(self, model_dir: str, threads: int, max_tokens: int):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ValueError("Embeddings locais requerem onnxruntime e tokenizers")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+        logger.info(f"Modelo de embedding local carregado: {model_dir} ({threads} threads, pid {os.getpid()})")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Um lote -> matriz (len(texts), dim) com norma 1."""
+        encodings = self.tokenizer.encode_batch([text if text.strip() else " " for text in texts])
+        mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        output = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+
+        if output.ndim == 3:
+            # Mean pooling sobre os tokens reais (sem padding)
+            weights = mask[:, :, None].astype(np.float32)
+            output = (output * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        output = output.astype(np.float32)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return output / norms
+
+
+# Um modelo por processo (API ou worker do pool)
+_model: Optional[LocalModel] = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> LocalModel:
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = LocalModel(LOCAL_EMBEDDING_MODEL_DIR, LOCAL_EMBEDDING_THREADS, LOCAL_EMBEDDING_MAX_TOKENS)
+        return _model
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    """Tarefa do pool: o worker carrega o modelo na primeira chamada e o reaproveita."""
+    return get_model().encode(texts)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    Backend "onnx" do registro: inferência local em CPU.
+
+    Sem pool, as chamadas são serializadas (cada inferência já usa todas as
+    threads configuradas; rodar várias ao mesmo tempo só disputaria os núcleos).
+    Com LOCAL_EMBEDDING_PROCESSES > 0, os lotes são distribuídos entre os processos.
+    """
+
+    name = "onnx"
+
+    def __init__(self, processes: int = LOCAL_EMBEDDING_PROCESSES, batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE):
+        self.processes = processes
+        self.batch_size = batch_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._run_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._chunks = 0
+        self._batches = 0
+        self._seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._stats_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+            return self._executor
+
+    def embed(self, spec, texts, batch_size=100, priority=PRIORITY_BULK):
+        if not texts:
+            return []
+        started = time.perf_counter()
+        # Textos de tamanho parecido no mesmo lote: menos padding
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        batches = [
+            [texts[index] for index in order[i:i + self.batch_size]]
+            for i in range(0, len(order), self.batch_size)
+        ]
+
+        if self.processes > 0:
+            matrices = list(self._get_executor().map(_encode_batch, batches))
+        else:
+            with self._run_lock:
+                model = get_model()
+                matrices = [model.encode(batch) for batch in batches]
+
+        vectors = np.empty((len(texts), matrices[0].shape[1]), dtype=np.float32)
+        vectors[order] = np.concatenate(matrices)
+        if vectors.shape[1] != spec.dim:
+            raise ValueError(
+                f"Modelo local gera vetores de {vectors.shape[1]} dims; {spec.name} espera {spec.dim}"
+            )
+
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._chunks += len(texts)
+            self._batches += len(batches)
+            self._seconds += elapsed
+        logger.debug(f"Embeddings locais: {len(texts)} chunks em {elapsed * 1000:.0f}ms")
+        return vectors.tolist()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "model_dir": LOCAL_EMBEDDING_MODEL_DIR,
+                "processes": self.processes,
+                "threads_per_process": LOCAL_EMBEDDING_THREADS,
+                "batch_size": self.batch_size,
+                "chunks": self._chunks,
+                "batches": self._batches,
+                "seconds": round(self._seconds, 3),
+                "chunks_per_second": round(self._chunks / self._seconds, 1) if self._seconds else None,
+            }
+
+
+register_backend(OnnxBackend())
@@ -0,0 +1,346 @@
+"""
+Parsing em paralelo (ProcessPoolExecutor) v4.5
+- PDFs divididos em faixas de páginas, imagens de OCR uma por tarefa
+- DOCX lido em streaming no worker (sem DOM), incluindo tabelas
+- OCR só para páginas de PDF sem camada de texto, uma tarefa por página
+- Resultados reunidos na ordem original, mesmo terminando fora de ordem
+- Limites por tarefa: tempo de CPU (RLIMIT_CPU), memória (RLIMIT_AS) e timeout
+- Timeout recicla o pool: o worker travado é encerrado (não segura uma vaga para sempre)
+- Nada de parsing CPU-bound na thread da requisição ou no event loop
+"""
+import logging
+import os
+import resource
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 0)) or os.cpu_count() or 1
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 10))
+# Faixas de páginas cujo OCR pode ficar pendente enquanto as próximas são extraídas
+OCR_LOOKAHEAD_RANGES = int(os.getenv("OCR_LOOKAHEAD_RANGES", 4))
+# Limites por tarefa (0 = sem limite)
+PARSE_CPU_SECONDS = int(os.getenv("PARSE_CPU_SECONDS", 120))
+PARSE_MEMORY_MB = int(os.getenv("PARSE_MEMORY_MB", 1024))
+PARSE_TIMEOUT_SECONDS = int(os.getenv("PARSE_TIMEOUT_SECONDS", 300))
+
+
+class ParseLimitExceeded(RuntimeError):
+    """Tarefa de parsing excedeu o limite de CPU, memória ou tempo."""
+
+
+# ---------------------------------------------------------------------------
+# Lado do worker
+# ---------------------------------------------------------------------------
+
+def _on_cpu_limit(signum, frame):
+    raise ParseLimitExceeded(f"Limite de CPU excedido ({PARSE_CPU_SECONDS}s)")
+
+
+def _init_worker():
+    """Limite de memória do processo e handler do SIGXCPU (limite de CPU por tarefa)."""
+    if PARSE_MEMORY_MB:
+        limit = PARSE_MEMORY_MB * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+
+def _run_limited(fn: Callable, *args):
+    """
+    Executa a tarefa com orçamento de CPU próprio.
+
+    RLIMIT_CPU é cumulativo por processo: o limite soft é reposicionado para
+    CPU já usada + PARSE_CPU_SECONDS antes de cada tarefa. Ao estourar, o kernel
+    envia SIGXCPU, convertido em ParseLimitExceeded (o worker continua vivo).
+    """
+    if PARSE_CPU_SECONDS:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = used + PARSE_CPU_SECONDS
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        return fn(*args)
+    except MemoryError:
+        raise ParseLimitExceeded(f"Limite de memória excedido ({PARSE_MEMORY_MB}MB)")
+
+
+def _pdf_page_count(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def _pdf_pages(file_path: str, start: int, end: int) -> List[Optional[str]]:
+    """
+    Texto das páginas [start, end) do PDF. Páginas sem camada de texto voltam
+    como None (candidatas a OCR) quando o OCR está habilitado.
+    """
+    from pypdf import PdfReader
+    from app.rag.utils.ocr_parser import ALLOW_OCR
+
+    reader = PdfReader(file_path)
+    pages = []
+    for number in range(start, min(end, len(reader.pages))):
+        try:
+            page_text = reader.pages[number].extract_text() or ""
+        except ParseLimitExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"pypdf failed on page {number + 1}: {e}")
+            page_text = ""
+        if not page_text.strip() and ALLOW_OCR:
+            pages.append(None)
+        else:
+            pages.append(page_text + "\n")
+    return pages
+
+
+def _pdf_page_ocr(file_path: str, page_index: int) -> str:
+    from app.rag.utils.ocr_parser import ocr_pdf_page
+    try:
+        return ocr_pdf_page(file_path, page_index) + "\n"
+    except ValueError as e:
+        # OCR indisponível/falhou: página fica vazia, o restante do documento segue
+        logger.warning(str(e))
+        return "\n"
+
+
+def _pdfminer_pages(file_path: str) -> List[str]:
+    """Fallback: texto de todas as páginas via pdfminer."""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    return [
+        "".join(
+            element.get_text() for element in page_layout
+            if isinstance(element, LTTextContainer)
+        ) + "\n"
+        for page_layout in extract_pages(file_path)
+    ]
+
+
+def _docx_blocks(file_path: str) -> List[str]:
+    """Parágrafos e linhas de tabela do DOCX (só o texto volta do worker, nunca o XML)."""
+    from app.rag.utils.parsers import iter_docx_blocks
+    return list(iter_docx_blocks(file_path))
+
+
+def _image_text(file_path: str) -> str:
+    from app.rag.utils.ocr_parser import parse_image_ocr
+    return parse_image_ocr(file_path)
+
+
+# ---------------------------------------------------------------------------
+# Lado do servidor
+# ---------------------------------------------------------------------------
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Pool compartilhado pelo processo da API (criado sob demanda)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, initializer=_init_worker)
+        return _executor
+
+
+def _reset_executor():
+    """Descarta um pool quebrado (worker morto por limite de memória/kill)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _workers(executor: ProcessPoolExecutor) -> List:
+    """Processos do pool (capturar antes do shutdown, que limpa a referência)."""
+    # ProcessPoolExecutor não expõe os workers; _processes é o dict pid -> Process
+    return list((getattr(executor, "_processes", None) or {}).values())
+
+
+def _terminate_workers(processes: List):
+    """Encerra os processos que ainda restam num pool aposentado."""
+    for process in processes:
+        if process.is_alive():
+            logger.info(f"Parsing: encerrando worker (pid {process.pid})")
+            process.terminate()
+
+
+def _retire_executor(executor: ProcessPoolExecutor):
+    """
+    Recicla o pool depois de um timeout.
+
+    Tarefas novas vão para um pool novo; as que já estavam no antigo (de outros
+    documentos) têm mais PARSE_TIMEOUT_SECONDS para terminar. Depois disso, os
+    processos que sobraram (entre eles o worker travado) são encerrados.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return  # já reciclado por outra requisição
+        _executor = None
+    processes = _workers(executor)
+    executor.shutdown(wait=False, cancel_futures=False)
+    timer = threading.Timer(PARSE_TIMEOUT_SECONDS, _terminate_workers, args=(processes,))
+    timer.daemon = True
+    timer.start()
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        processes = _workers(executor)
+        executor.shutdown(wait=False, cancel_futures=True)
+        _terminate_workers(processes)
+
+
+@contextmanager
+def _pool_errors(executor: Optional[ProcessPoolExecutor] = None):
+    """Converte timeout e pool quebrado em ParseLimitExceeded (timeout recicla o pool)."""
+    try:
+        yield
+    except FutureTimeoutError:
+        if executor is not None:
+            _retire_executor(executor)
+        raise ParseLimitExceeded(f"Timeout de parsing excedido ({PARSE_TIMEOUT_SECONDS}s)")
+    except BrokenProcessPool:
+        _reset_executor()
+        raise ParseLimitExceeded("Worker de parsing encerrado (limite de memória ou sinal)")
+
+
+def _submit(fn: Callable, *args) -> Future:
+    executor = get_executor()
+    future = executor.submit(_run_limited, fn, *args)
+    future.executor = executor  # pool a reciclar se a tarefa estourar o timeout
+    return future
+
+
+def _result(future: Future):
+    with _pool_errors(getattr(future, "executor", None)):
+        return future.result(timeout=PARSE_TIMEOUT_SECONDS or None)
+
+
+def _run_all(calls: Iterable[Tuple[Callable, tuple]]) -> Iterator:
+    """
+    Executa as tarefas no pool e entrega os resultados na ordem de `calls`.
+
+    No máximo PARSE_WORKERS * 2 tarefas ficam em voo: resultados prontos não se
+    acumulam em memória se o consumidor (chunking/embeddings) for mais lento.
+    O timeout vale por tarefa, contado a partir do momento em que se começa a
+    esperar por ela. Em erro, as tarefas pendentes são canceladas.
+    """
+    pending = deque()
+    calls = iter(calls)
+
+    def submit_next() -> bool:
+        call = next(calls, None)
+        if call is None:
+            return False
+        fn, args = call
+        with _pool_errors():
+            pending.append(_submit(fn, *args))
+        return True
+
+    try:
+        while len(pending) < PARSE_WORKERS * 2 and submit_next():
+            pass
+        while pending:
+            result = _result(pending.popleft())
+            submit_next()
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def run(fn: Callable, *args):
+    """Executa uma tarefa isolada no pool, com os mesmos limites."""
+    return next(_run_all([(fn, args)]))
+
+
+def iter_pdf_pages(file_path: str, pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[str]:
+    """
+    Texto do PDF página a página, com as faixas de páginas extraídas em paralelo.
+
+    Páginas com camada de texto usam o pypdf; só as páginas sem texto são
+    rasterizadas e passam por OCR, uma tarefa por página (em paralelo com as
+    faixas seguintes). As páginas saem em ordem.
+    """
+    try:
+        total = run(_pdf_page_count, file_path)
+    except ParseLimitExceeded:
+        raise
+    except Exception as e:
+        logger.warning(f"pypdf failed, trying pdfminer: {e}")
+        yield from run(_pdfminer_pages, file_path)
+        return
+
+    ranges = (
+        (_pdf_pages, (file_path, start, start + pages_per_task))
+        for start in range(0, total, pages_per_task)
+    )
+    # Faixas já extraídas aguardando o OCR das suas páginas sem texto
+    window = deque()
+    ocr_pages = 0
+
+    def drain(limit: int) -> Iterator[str]:
+        while len(window) > limit:
+            for page in window.popleft():
+                yield _result(page) if isinstance(page, Future) else page
+
+    try:
+        start = 0
+        for pages in _run_all(ranges):
+            entries = []
+            for offset, page_text in enumerate(pages):
+                if page_text is None:
+                    with _pool_errors():
+                        entries.append(_submit(_pdf_page_ocr, file_path, start + offset))
+                    ocr_pages += 1
+                else:
+                    entries.append(page_text)
+            window.append(entries)
+            start += len(pages)
+            yield from drain(OCR_LOOKAHEAD_RANGES)
+        yield from drain(0)
+    finally:
+        for entries in window:
+            for page in entries:
+                if isinstance(page, Future):
+                    page.cancel()
+
+    if ocr_pages:
+        logger.info(f"PDF {file_path}: {ocr_pages}/{total} páginas via OCR")
+
+
+def iter_docx_blocks(file_path: str) -> Iterator[str]:
+    """Blocos de texto do DOCX (parágrafos e linhas de tabela) em ordem de leitura."""
+    yield from run(_docx_blocks, file_path)
+
+
+def parse_docx(file_path: str) -> str:
+    return "\n".join(iter_docx_blocks(file_path))
+
+
+def parse_image(file_path: str) -> str:
+    return run(_image_text, file_path)
+
+
+def ocr_images(file_paths: Sequence[str]) -> List[str]:
+    """OCR de várias imagens em paralelo (uma por tarefa), na ordem recebida."""
+    return list(_run_all((_image_text, (path,)) for path in file_paths))
@@ -0,0 +1,162 @@
+"""
+Montagem de prompt com orçamento de tokens v4.5
+- Orçamento por modelo (LLMModel.max_tokens ou registro local)
+- Prioridade: system prompt > mensagem atual > contexto RAG > resumo > histórico
+- Prompts acima do orçamento nunca são enviados ao LLM
+"""
+import os
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+
+from app.models.models import LLMModel
+from app.services.tokenizer import count_tokens, truncate_to_tokens, TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+
+# Janela de contexto (tokens) por modelo, usada quando llm_models não informa max_tokens
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "claude-3.5-haiku": 200000,
+    "claude-3.5-sonnet": 200000,
+    "gemini-1.5-pro": 2097152,
+    "gemini-1.5-flash": 1048576,
+    "gemini-2.5-flash": 1048576,
+    "mixtral-8x7b-32768": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Teto de tokens de prompt independente da janela do modelo (custo e latência)
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", 16000))
+# Tokens reservados para a resposta
+COMPLETION_RESERVE_TOKENS = int(os.getenv("COMPLETION_RESERVE_TOKENS", 1024))
+# Fração do espaço livre destinada ao contexto RAG
+RAG_BUDGET_SHARE = float(os.getenv("RAG_BUDGET_SHARE", 0.5))
+RAG_MAX_TOKENS = int(os.getenv("RAG_MAX_TOKENS", 4000))
+
+
+class PromptTooLargeError(ValueError):
+    """Partes obrigatórias do prompt não cabem no orçamento do modelo."""
+
+
+def get_context_window(db: Optional[Session], model: str) -> int:
+    """Janela de contexto do modelo: llm_models.max_tokens, senão o registro local."""
+    if db is not None:
+        row = db.query(LLMModel.max_tokens).filter(
+            LLMModel.model_id == model,
+            LLMModel.is_active == True,
+            LLMModel.max_tokens.isnot(None)
+        ).first()
+        if row and row[0]:
+            return row[0]
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def get_prompt_budget(db: Optional[Session], model: str) -> int:
+    """Orçamento de tokens de prompt para o modelo."""
+    available = get_context_window(db, model) - COMPLETION_RESERVE_TOKENS
+    return max(0, min(available, PROMPT_MAX_TOKENS))
+
+
+class PromptBuilder:
+    """
+    Empacota system prompt, contexto RAG e histórico dentro do orçamento do modelo.
+
+    Usage:
+        builder = PromptBuilder.for_model(db, "gpt-4.1-mini")
+        builder.require(system_prompt, user_message)      # levanta PromptTooLargeError
+        rag_context = rag.build_rag_context(hits, max_tokens=builder.rag_budget())
+        messages = builder.pack(system_prompt_com_rag, history, user_message)
+    """
+
+    def __init__(self, model: str, max_prompt_tokens: int):
+        self.model = model
+        self.max_prompt_tokens = max_prompt_tokens
+        self.required_tokens = 0
+        self.prompt_tokens = 0
+        self.history_used = 0
+        self.history_dropped = 0
+
+    @classmethod
+    def for_model(cls, db: Optional[Session], model: str) -> "PromptBuilder":
+        return cls(model, get_prompt_budget(db, model))
+
+    def _message_tokens(self, content: str, token_count: Optional[int] = None) -> int:
+        if token_count is None:
+            token_count = count_tokens(content, self.model)
+        return TOKENS_PER_MESSAGE + token_count
+
+    def require(self, system_prompt: str, user_message: str) -> int:
+        """
+        Reserva as partes obrigatórias do prompt.
+
+        Returns:
+            Tokens livres para contexto RAG e histórico.
+        """
+        self.required_tokens = (
+            TOKENS_PER_REPLY
+            + self._message_tokens(system_prompt)
+            + self._message_tokens(user_message)
+        )
+        if self.required_tokens > self.max_prompt_tokens:
+            raise PromptTooLargeError(
+                f"Prompt requer {self.required_tokens} tokens, limite do modelo {self.model} é {self.max_prompt_tokens}"
+            )
+        return self.max_prompt_tokens - self.required_tokens
+
+    def rag_budget(self) -> int:
+        """Tokens disponíveis para o bloco de contexto RAG."""
+        free = self.max_prompt_tokens - self.required_tokens
+        return max(0, min(int(free * RAG_BUDGET_SHARE), RAG_MAX_TOKENS))
+
+    def pack(
+        self,
+        system_prompt: str,
+        history: List[Dict[str, str]],
+        user_message: str,
+        summary: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Monta a lista final de mensagens. O resumo da conversa (se houver) entra logo
+        após o system prompt; o histórico entra do mais recente para o mais antigo
+        até esgotar o orçamento. Itens do histórico com `token_count` (gravado na
+        inserção) não são re-tokenizados.
+        """
+        used = TOKENS_PER_REPLY + self._message_tokens(system_prompt) + self._message_tokens(user_message)
+        if used > self.max_prompt_tokens:
+            raise PromptTooLargeError(
+                f"Prompt requer {used} tokens, limite do modelo {self.model} é {self.max_prompt_tokens}"
+            )
+
+        prefix = [{"role": "system", "content": system_prompt}]
+        if summary:
+            summary_content = truncate_to_tokens(
+                f"Resumo da conversa até aqui:\n{summary}",
+                self.max_prompt_tokens - used - TOKENS_PER_MESSAGE,
+                self.model
+            )
+            if summary_content:
+                prefix.append({"role": "system", "content": summary_content})
+                used += self._message_tokens(summary_content)
+
+        kept = []
+        for message in reversed(history):
+            tokens = self._message_tokens(message["content"], message.get("token_count"))
+            if used + tokens > self.max_prompt_tokens:
+                break
+            kept.append({"role": message["role"], "content": message["content"]})
+            used += tokens
+        kept.reverse()
+
+        self.history_used = len(kept)
+        self.history_dropped = len(history) - len(kept)
+        self.prompt_tokens = used
+
+        return (
+            prefix
+            + kept
+            + [{"role": "user", "content": user_message}]
+        )
@@ -7,6 +7,8 @@ from sqlalchemy import text
 
 from app.models.models import KnowledgeChunk, Document
 from app.services.document_processor import DocumentProcessor
+from app.services.embedding_models import active_embedding_model, embed_texts, vector_literal
+from app.services.embedding_scheduler import PRIORITY_INTERACTIVE
 
 
 class RAGSearchService:
@@ -36,12 +38,16 @@ class RAGSearchService:
         Returns:
             Lista de dicts com chunks relevantes e metadados
         """
+        # Modelo ativo do tenant (mesma coluna/índice da ingestão)
+        self.processor.use_embedding_model(active_embedding_model(db, tenant_id))
+        
         # Gerar embedding da query
-        query_embedding = self.processor.generate_embeddings_batch([query])[0]
+        query_embedding = embed_texts([query], self.processor.embedding_spec, priority=PRIORITY_INTERACTIVE)[0]
         
         # Buscar chunks similares usando SQL direto (mais simples)
-        # Usamos CAST para converter lista Python em vector
-        sql = text("""
+        # Coluna/cast do modelo de embedding do tenant
+        spec = self.processor.embedding_spec
+        sql = text(f"""
             SELECT 
                 kc.id,
                 kc.document_id,
@@ -49,16 +55,16 @@ class RAGSearchService:
                 kc.chunk_index,
                 d.filename,
                 d.tenant_id,
-                (kc.embedding <=> CAST(:query_embedding AS vector)) AS distance
+                ({spec.search_column} <=> CAST(:query_embedding AS {spec.query_cast})) AS distance
             FROM knowledge_chunks kc
             JOIN documents d ON kc.document_id = d.id
-            WHERE d.tenant_id = :tenant_id
+            WHERE d.tenant_id = :tenant_id AND kc.{spec.column} IS NOT NULL
             ORDER BY distance
             LIMIT :top_k
         """)
         
         # Converter embedding para string no formato pgvector: [1.0,2.0,3.0]
-        embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
+        embedding_str = vector_literal(query_embedding)
         
         results = db.execute(
             sql,
@@ -2,7 +2,11 @@
 """
 Serviço RAG (Retrieval-Augmented Generation) v4.5
 - Busca vetorial com pgvector e filtro por tenant
-- Injeção de contexto no prompt
+- Consulta na coluna/índice do modelo de embedding (registro de modelos)
+- Documentos lazy ainda sem vetores: busca por palavra-chave (content_tsv) com cota própria e vetorização enfileirada
+- Fusão de chunks vizinhos (remove o overlap do chunking)
+- Injeção de contexto no prompt com orçamento de tokens
+- Documentos removidos (soft delete) nunca entram na busca, mesmo antes do reaper
 - Logging de eventos RAG com tenant_id
 """
 import os
@@ -10,33 +14,60 @@ from typing import List, Tuple, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.models.models import KnowledgeChunk, Document, RAGEvent
-from openai import OpenAI
+from app.services.tokenizer import get_encoder
+from app.services.embedding_models import active_embedding_model, get_embedding_model, embed_texts, vector_literal
+from app.services.embedding_scheduler import PRIORITY_INTERACTIVE
+from app.services import lazy_vectorize
+
+# Incluir na busca documentos ainda em indexação (ou interrompidos) com chunks já gravados
+RAG_SEARCH_PARTIAL = os.getenv("RAG_SEARCH_PARTIAL", "false").lower() == "true"
+# Configuração de texto do content_tsv (tem que ser a mesma da migration 0020)
+FTS_CONFIG = "portuguese"
+
+
+def _strip_overlap(previous: str, current: str, max_overlap_chars: int = 4000, probe_chars: int = 64) -> str:
+    """
+    Remove de `current` o prefixo que já aparece no final de `previous`.
+
+    Chunks consecutivos compartilham ~200 tokens (overlap do chunking); aqui
+    procuramos o maior sufixo de `previous` que é prefixo de `current`.
+    """
+    tail = previous[-max_overlap_chars:]
+    probe = current[:probe_chars]
+    if not probe:
+        return current
+
+    pos = tail.find(probe)
+    while pos != -1:
+        if current.startswith(tail[pos:]):
+            return current[len(tail) - pos:]
+        pos = tail.find(probe, pos + 1)
+
+    return current
 
 class RAGService:
     """
     Serviço para busca vetorial e recuperação de contexto com isolamento por tenant.
     """
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, embedding_model: Optional[str] = None, tenant_id: Optional[int] = None):
         self.db = db
-        self._client = None
-        self.embedding_model = "text-embedding-3-small"
+        # Modelo explícito, senão o ativo do tenant (troca atômica ao fim de um re-embedding)
+        self.embedding_spec = (
+            get_embedding_model(embedding_model) if embedding_model
+            else active_embedding_model(db, tenant_id)
+        )
+        self.embedding_model = self.embedding_spec.name
         self.top_k = 5
         self.similarity_threshold = 0.6
-    
-    @property
-    def client(self):
-        if self._client is None:
-            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        return self._client
+        self.keyword_top_k = 2  # cota da busca por palavra-chave (documentos lazy)
+        self.keyword_min_rank = 0.05  # ts_rank_cd normalizado (escala diferente da similaridade)
+        self.context_max_tokens = 2000  # orçamento de tokens do bloco de contexto
+        self.min_passage_tokens = 50  # abaixo disso não vale truncar uma passagem
+        self.encoding = get_encoder()
     
     def generate_query_embedding(self, query: str) -> List[float]:
-        response = self.client.embeddings.create(
-            model=self.embedding_model,
-            input=query,
-            encoding_format="float"
-        )
-        return response.data[0].embedding
+        return embed_texts([query], self.embedding_spec, priority=PRIORITY_INTERACTIVE)[0]
     
     def search_similar_chunks(
         self,
@@ -48,24 +79,30 @@ class RAGService:
         if top_k is None:
             top_k = self.top_k
         
-        query = text("""
+        # Coluna e cast vêm do registro de modelos (nunca de input do usuário)
+        vector_column = self.embedding_spec.search_column
+        query_vector = f"CAST(:query_embedding AS {self.embedding_spec.query_cast})"
+        query = text(f"""
             SELECT 
-                kc.id, kc.document_id, kc.content, kc.chunk_index, kc.embedding, kc.created_at,
-                1 - (kc.embedding <=> :query_embedding::vector) as similarity
+                kc.id, kc.document_id, kc.content, kc.chunk_index, kc.created_at,
+                1 - ({vector_column} <=> {query_vector}) as similarity
             FROM knowledge_chunks kc
             JOIN documents d ON kc.document_id = d.id
             WHERE d.tenant_id = :tenant_id AND d.agent_id = :agent_id
-                AND d.status = 'READY' AND kc.embedding IS NOT NULL
-            ORDER BY kc.embedding <=> :query_embedding::vector
+                AND (d.status = 'READY' OR (:include_partial AND d.embedded_upto > 0))
+                AND d.deleted_at IS NULL
+                AND kc.{self.embedding_spec.column} IS NOT NULL
+            ORDER BY {vector_column} <=> {query_vector}
             LIMIT :top_k
         """)
         
         result = self.db.execute(
             query,
             {
-                "query_embedding": str(query_embedding), # Cast to string for psycopg3
+                "query_embedding": vector_literal(query_embedding),
                 "tenant_id": tenant_id,
                 "agent_id": agent_id,
+                "include_partial": RAG_SEARCH_PARTIAL,
                 "top_k": top_k
             }
         )
@@ -74,7 +111,7 @@ class RAGService:
         for row in result:
             chunk = KnowledgeChunk(
                 id=row.id, document_id=row.document_id, content=row.content,
-                chunk_index=row.chunk_index, embedding=row.embedding, created_at=row.created_at
+                chunk_index=row.chunk_index, created_at=row.created_at
             )
             similarity = float(row.similarity)
             
@@ -83,20 +120,154 @@ class RAGService:
         
         return chunks_with_scores
     
-    def build_rag_context(self, chunks_with_scores: List[Tuple[KnowledgeChunk, float]]) -> str:
-        if not chunks_with_scores:
-            return ""
+    def search_keyword_chunks(
+        self,
+        query_text: str,
+        tenant_id: int,
+        agent_id: int,
+        top_k: Optional[int] = None
+    ) -> List[Tuple[KnowledgeChunk, float]]:
+        """
+        Busca por palavra-chave (índice GIN de content_tsv) nos chunks ainda sem
+        vetor no modelo ativo, i.e. de documentos lazy não vetorizados.
+        Score = ts_rank_cd normalizado (0..1), filtrado por keyword_min_rank.
+        """
+        if top_k is None:
+            top_k = self.keyword_top_k
         
-        context_parts = ["=== Base de Conhecimento Relevante ===\n"]
-        MAX_CHUNK_LENGTH = 500
+        query = text(f"""
+            SELECT 
+                kc.id, kc.document_id, kc.content, kc.chunk_index, kc.created_at,
+                ts_rank_cd(kc.content_tsv, q, 32) as rank
+            FROM knowledge_chunks kc
+            JOIN documents d ON kc.document_id = d.id,
+                websearch_to_tsquery('{FTS_CONFIG}', :query) q
+            WHERE d.tenant_id = :tenant_id AND d.agent_id = :agent_id
+                AND d.status = 'READY' AND d.deleted_at IS NULL
+                AND kc.{self.embedding_spec.column} IS NULL
+                AND kc.content_tsv @@ q
+            ORDER BY rank DESC
+            LIMIT :top_k
+        """)
         
-        for idx, (chunk, score) in enumerate(chunks_with_scores, 1):
-            chunk_content = chunk.content[:MAX_CHUNK_LENGTH] + ("..." if len(chunk.content) > MAX_CHUNK_LENGTH else "")
-            context_parts.append(f"[Fonte {idx} | Relevância: {score:.2f}]")
-            context_parts.append(chunk_content)
-            context_parts.append("")
+        result = self.db.execute(
+            query,
+            {"query": query_text, "tenant_id": tenant_id, "agent_id": agent_id, "top_k": top_k}
+        )
+        
+        return [
+            (
+                KnowledgeChunk(
+                    id=row.id, document_id=row.document_id, content=row.content,
+                    chunk_index=row.chunk_index, created_at=row.created_at
+                ),
+                float(row.rank)
+            )
+            for row in result
+            if float(row.rank) >= self.keyword_min_rank
+        ]
+    
+    def retrieve(self, query: str, tenant_id: int, agent_id: int) -> List[Tuple[KnowledgeChunk, float]]:
+        """
+        Busca vetorial; se o agente tem documentos lazy sem vetores, enfileira a
+        vetorização deles e completa o resultado com a busca por palavra-chave.
+
+        Cosseno e ts_rank_cd não são comparáveis: cada busca tem seu próprio
+        limiar e a palavra-chave ocupa no máximo keyword_top_k das top_k
+        posições, sempre depois dos hits vetoriais (a ordem da lista é a ordem
+        de relevância).
+        """
+        chunks_with_scores = self.search_similar_chunks(
+            self.generate_query_embedding(query), tenant_id, agent_id
+        )
         
-        context_parts.append("=== Fim da Base de Conhecimento ===\n")
+        pending = lazy_vectorize.pending_documents(self.db, tenant_id, agent_id)
+        if pending:
+            lazy_vectorize.request_vectorization(pending)
+            keyword_hits = self.search_keyword_chunks(query, tenant_id, agent_id)
+            if keyword_hits:
+                chunks_with_scores = chunks_with_scores[:self.top_k - len(keyword_hits)] + keyword_hits
+        
+        return chunks_with_scores
+    
+    def merge_adjacent_chunks(self, chunks_with_scores: List[Tuple[KnowledgeChunk, float]]) -> List[dict]:
+        """
+        Agrupa chunks vizinhos (mesmo documento, chunk_index consecutivo) em uma
+        única passagem, sem repetir o texto do overlap.
+
+        Returns:
+            Lista de passagens na ordem de relevância da entrada (posição do
+            melhor chunk do grupo); os scores podem vir de buscas diferentes.
+        """
+        by_document = {}
+        for position, (chunk, score) in enumerate(chunks_with_scores):
+            by_document.setdefault(chunk.document_id, []).append((chunk, score, position))
+
+        passages = []
+        for document_id, hits in by_document.items():
+            hits.sort(key=lambda hit: hit[0].chunk_index)
+            current = None
+            for chunk, score, position in hits:
+                if current and chunk.chunk_index == current["end_index"] + 1:
+                    current["content"] += _strip_overlap(current["content"], chunk.content)
+                    current["end_index"] = chunk.chunk_index
+                    current["chunk_ids"].append(chunk.id)
+                    current["score"] = max(current["score"], score)
+                    current["position"] = min(current["position"], position)
+                    continue
+                if current and chunk.chunk_index == current["end_index"]:
+                    continue  # chunk duplicado no resultado
+                current = {
+                    "document_id": document_id,
+                    "chunk_ids": [chunk.id],
+                    "start_index": chunk.chunk_index,
+                    "end_index": chunk.chunk_index,
+                    "content": chunk.content,
+                    "score": score,
+                    "position": position,
+                }
+                passages.append(current)
+
+        passages.sort(key=lambda passage: passage["position"])
+        return passages
+
+    def build_rag_context(
+        self,
+        chunks_with_scores: List[Tuple[KnowledgeChunk, float]],
+        max_tokens: Optional[int] = None
+    ) -> str:
+        if not chunks_with_scores:
+            return ""
+        if max_tokens is None:
+            max_tokens = self.context_max_tokens
+
+        header = "=== Base de Conhecimento Relevante ===\n"
+        footer = "=== Fim da Base de Conhecimento ===\n"
+        remaining = max_tokens - len(self.encoding.encode_ordinary(header + footer))
+
+        context_parts = [header]
+        for idx, passage in enumerate(self.merge_adjacent_chunks(chunks_with_scores), 1):
+            label = f"[Fonte {idx} | Relevância: {passage['score']:.2f}]"
+            remaining -= len(self.encoding.encode_ordinary(label)) + 2  # quebras de linha
+            if remaining < self.min_passage_tokens:
+                break
+
+            tokens = self.encoding.encode_ordinary(passage["content"])
+            if len(tokens) <= remaining:
+                content = passage["content"]
+                remaining -= len(tokens)
+            else:
+                content = self.encoding.decode(tokens[:remaining]) + "..."
+                remaining = 0
+
+            context_parts.append(label)
+            context_parts.append(content)
+            context_parts.append("")
+
+        if len(context_parts) == 1:
+            return ""
+
+        context_parts.append(footer)
         return "\n".join(context_parts)
     
     def inject_context_into_system_prompt(self, original_system_prompt: str, rag_context: str) -> str:
@@ -119,11 +290,10 @@ class RAGService:
     
     def retrieve_and_augment(
         self, query: str, tenant_id: int, agent_id: int, conversation_id: int, 
-        message_id: int, original_system_prompt: str
+        message_id: int, original_system_prompt: str, max_context_tokens: Optional[int] = None
     ) -> Tuple[str, int, List[dict]]:
-        query_embedding = self.generate_query_embedding(query)
-        chunks_with_scores = self.search_similar_chunks(query_embedding, tenant_id, agent_id)
-        rag_context = self.build_rag_context(chunks_with_scores)
+        chunks_with_scores = self.retrieve(query, tenant_id, agent_id)
+        rag_context = self.build_rag_context(chunks_with_scores, max_tokens=max_context_tokens)
         augmented_prompt = self.inject_context_into_system_prompt(original_system_prompt, rag_context)
         
         rag_sources = []
@@ -143,9 +313,8 @@ class RAGService:
 
 # Helper function to be called from routes
 def search(db: Session, tenant_id: int, agent_id: int, query: str) -> Tuple[List[str], int]:
-    service = RAGService(db)
-    query_embedding = service.generate_query_embedding(query)
-    chunks_with_scores = service.search_similar_chunks(query_embedding, tenant_id, agent_id)
+    service = RAGService(db, tenant_id=tenant_id)
+    chunks_with_scores = service.retrieve(query, tenant_id, agent_id)
     
-    context_blocks = [chunk.content for chunk, score in chunks_with_scores]
+    context_blocks = [passage["content"] for passage in service.merge_adjacent_chunks(chunks_with_scores)]
     return context_blocks, len(context_blocks)
@@ -10,6 +10,7 @@ import numpy as np
 
 from app.models.models import Agent, KnowledgeItem, KnowledgeChunk, AgentDocument, RagEvent
 from app.services.llm import embed_texts
+from app.services.embedding_models import get_embedding_model
 
 # --- RAG Events (usar SQL direto para compatibilidade) ---
 def log_rag_event(db: Session, *, tenant_id: int, agent_id: int, document_id: Optional[str],
@@ -59,8 +60,9 @@ def retrieve_context(db: Session, *, tenant_id: int, agent_id: int,
     """
     start_time = datetime.utcnow()
     
-    # 1. Embed query (usar mesmo modelo dos documentos)
-    q_embedding = embed_texts([query], model="text-embedding-3-small")
+    # 1. Embed query (usar mesmo modelo dos documentos, via registro)
+    spec = get_embedding_model()
+    q_embedding = embed_texts([query], model=spec.name)
     if not q_embedding or not q_embedding[0]:
         # Fallback: sem embedding, retorna vazio
         latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
@@ -82,9 +84,11 @@ def retrieve_context(db: Session, *, tenant_id: int, agent_id: int,
                      query=query, hit_count=0, latency_ms=latency_ms, reason="Nenhum documento vinculado")
         return [], 0
     
-    # 3. Buscar chunks dos documentos vinculados
+    # 3. Buscar chunks dos documentos vinculados (apenas os que têm vetor do modelo)
+    vector_column = getattr(KnowledgeChunk, spec.column)
     chunks = db.query(KnowledgeChunk).filter(
-        KnowledgeChunk.item_id.in_(doc_ids)
+        KnowledgeChunk.item_id.in_(doc_ids),
+        vector_column.isnot(None)
     ).all()
     
     if not chunks:
@@ -96,22 +100,17 @@ def retrieve_context(db: Session, *, tenant_id: int, agent_id: int,
     # 4. Calcular similaridade para cada chunk
     scored_chunks = []
     for chunk in chunks:
-        if not chunk.embedding:
-            continue
+        embedding = getattr(chunk, spec.column)
         
         # Parse embedding (pode ser JSON string ou lista)
         try:
-            if isinstance(chunk.embedding, str):
-                emb = json.loads(chunk.embedding)
+            if isinstance(embedding, str):
+                emb = json.loads(embedding)
             else:
-                emb = chunk.embedding
+                emb = embedding
         except:
             continue
         
-        # Filtrar apenas chunks com dimensão compatível
-        if len(emb) != len(q_emb):
-            continue
-        
         score = cosine_similarity(q_emb, emb)
         scored_chunks.append((score, chunk.text, chunk.item_id))
     
@@ -0,0 +1,326 @@
+"""
+Re-embedding do corpus para outro modelo v4.5
+- Chunks de um tenant (ou de todos) embedados na coluna do novo modelo, em segundo plano
+- Lotes concorrentes pelo embedding_scheduler (prioridade bulk: consultas passam na frente)
+- Checkpoint por id (keyset) e pela própria coluna nula: retomável após queda
+- Heartbeat a cada lote: migração PENDING/RUNNING sem heartbeat recente é considerada interrompida
+- Estimativa de custo/tempo antes de começar e ETA durante a execução
+- Troca atômica do modelo ativo do tenant no fim (busca e ingestão passam para a nova coluna)
+"""
+import logging
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.models import Document, EmbeddingMigration, KnowledgeChunk, Tenant
+from app.services.embedding_cache import embed_with_cache
+from app.services.embedding_backends import get_backend
+from app.services.embedding_models import EmbeddingModelSpec, embed_texts, get_embedding_model
+from app.services.embedding_scheduler import EMBED_RPM, EMBED_TPM
+
+logger = logging.getLogger(__name__)
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", 256))
+REEMBED_WORKERS = int(os.getenv("REEMBED_WORKERS", 4))
+# Passadas extras para chunks gravados no modelo antigo durante a migração
+REEMBED_CATCHUP_PASSES = 3
+# PENDING/RUNNING sem heartbeat há mais que isso = processo morreu (pode ser retomada)
+REEMBED_STALE_MINUTES = int(os.getenv("REEMBED_STALE_MINUTES", 15))
+
+
+def _pending(db: Session, spec: EmbeddingModelSpec, tenant_id: Optional[int]):
+    """
+    Chunks do escopo ainda sem vetor na coluna do modelo de destino.
+    Documentos lazy ainda não vetorizados ficam de fora: serão vetorizados
+    no modelo ativo do tenant quando forem consultados (lazy_vectorize).
+    Documentos removidos também (o reaper vai apagar os chunks).
+    """
+    query = db.query(KnowledgeChunk).join(Document, KnowledgeChunk.document_id == Document.id).filter(
+        getattr(KnowledgeChunk, spec.column).is_(None),
+        Document.deleted_at.is_(None),
+        or_(Document.vector_status.is_(None), Document.vector_status == "READY")
+    )
+    if tenant_id is not None:
+        query = query.filter(Document.tenant_id == tenant_id)
+    return query
+
+
+def estimate(db: Session, target_model: str, tenant_id: Optional[int] = None, batch_size: int = REEMBED_BATCH_SIZE) -> Dict:
+    """
+    Chunks, tokens, custo (USD) e tempo mínimo estimados para o re-embedding.
+    Tempo: o maior entre tokens/TPM e requisições/RPM (limites do scheduler);
+    em backends locais, pelo throughput já medido (chunks/s), se houver.
+    """
+    spec = get_embedding_model(target_model)
+    # token_count pode faltar em chunks antigos: ~4 caracteres por token
+    tokens_expr = func.coalesce(KnowledgeChunk.token_count, func.length(KnowledgeChunk.content) / 4)
+    chunks, tokens = _pending(db, spec, tenant_id).with_entities(
+        func.count(KnowledgeChunk.id), func.coalesce(func.sum(tokens_expr), 0)
+    ).one()
+    tokens = int(tokens)
+    requests = math.ceil(chunks / batch_size) if chunks else 0
+    minutes = max(tokens / EMBED_TPM, requests / EMBED_RPM) if chunks else 0.0
+    measured = get_backend(spec).stats().get("chunks_per_second")
+    if measured:
+        minutes = chunks / measured / 60
+    return {
+        "target_model": spec.name,
+        "chunks": chunks,
+        "tokens": tokens,
+        "estimated_cost_usd": round(tokens / 1_000_000 * spec.usd_per_million_tokens, 4),
+        "estimated_seconds": round(minutes * 60, 1),
+    }
+
+
+def _stale(now: datetime):
+    """PENDING/RUNNING cujo processo parou de dar sinal de vida."""
+    expired = now - timedelta(minutes=REEMBED_STALE_MINUTES)
+    return EmbeddingMigration.status.in_(["PENDING", "RUNNING"]) & (
+        func.coalesce(EmbeddingMigration.heartbeat_at, EmbeddingMigration.created_at) < expired
+    )
+
+
+def claim_resume(db: Session, migration_id: int) -> bool:
+    """
+    ERROR/CANCELLED, ou PENDING/RUNNING interrompida -> PENDING (atômico).
+    False se a migração está ativa (ou concluída) ou outra requisição já retomou.
+    """
+    now = datetime.utcnow()
+    claimed = db.query(EmbeddingMigration).filter(
+        EmbeddingMigration.id == migration_id,
+        EmbeddingMigration.status.in_(["ERROR", "CANCELLED"]) | _stale(now)
+    ).update({"status": "PENDING", "heartbeat_at": now}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def create_migration(db: Session, target_model: str, tenant_id: Optional[int] = None) -> EmbeddingMigration:
+    """
+    Registra um re-embedding (PENDING) com as estimativas.
+
+    Raises:
+        ValueError: modelo não registrado ou já existe migração em andamento no escopo
+    """
+    get_embedding_model(target_model)
+    now = datetime.utcnow()
+    # Migrações interrompidas (sem heartbeat) não bloqueiam: viram ERROR, retomáveis
+    db.query(EmbeddingMigration).filter(_stale(now)).update(
+        {"status": "ERROR", "error": "Interrompida (sem heartbeat)"}, synchronize_session=False
+    )
+    db.commit()
+    running = db.query(EmbeddingMigration).filter(EmbeddingMigration.status.in_(["PENDING", "RUNNING"]))
+    if tenant_id is not None:
+        running = running.filter(
+            (EmbeddingMigration.tenant_id == tenant_id) | EmbeddingMigration.tenant_id.is_(None)
+        )
+    running = running.first()
+    if running:
+        raise ValueError(f"Já existe um re-embedding em andamento (id {running.id})")
+
+    stats = estimate(db, target_model, tenant_id)
+    migration = EmbeddingMigration(
+        tenant_id=tenant_id,
+        target_model=target_model,
+        status="PENDING",
+        heartbeat_at=now,
+        chunks_total=stats["chunks"],
+        tokens_total=stats["tokens"],
+        estimated_cost_usd=stats["estimated_cost_usd"],
+    )
+    db.add(migration)
+    db.commit()
+    db.refresh(migration)
+    return migration
+
+
+def progress(migration: EmbeddingMigration) -> Dict:
+    """Progresso, throughput e ETA (a partir do ritmo observado)."""
+    spec = get_embedding_model(migration.target_model)
+    elapsed = None
+    eta = None
+    rate = None
+    if migration.started_at:
+        end = migration.finished_at or datetime.utcnow()
+        elapsed = max((end - migration.started_at).total_seconds(), 0.0)
+        if elapsed and migration.chunks_done:
+            rate = migration.chunks_done / elapsed
+            if migration.status == "RUNNING":
+                eta = max(migration.chunks_total - migration.chunks_done, 0) / rate
+    return {
+        "id": migration.id,
+        "tenant_id": migration.tenant_id,
+        "target_model": migration.target_model,
+        "status": migration.status,
+        "chunks_total": migration.chunks_total,
+        "chunks_done": migration.chunks_done,
+        "percent": round(100.0 * migration.chunks_done / migration.chunks_total, 1) if migration.chunks_total else 100.0,
+        "tokens_done": migration.tokens_done,
+        "estimated_cost_usd": migration.estimated_cost_usd,
+        "cost_so_far_usd": round(migration.tokens_done / 1_000_000 * spec.usd_per_million_tokens, 4),
+        "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+        "chunks_per_second": round(rate, 1) if rate else None,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "heartbeat_at": migration.heartbeat_at.isoformat() if migration.heartbeat_at else None,
+        "error": migration.error,
+    }
+
+
+def _embed_rows(spec: EmbeddingModelSpec, rows: List[Tuple[int, str, Optional[int]]]) -> Tuple[int, int]:
+    """Embeda um lote e grava na coluna do modelo (sessão própria). Retorna (chunks, tokens)."""
+    db = SessionLocal()
+    try:
+        texts = [content for _, content, _ in rows]
+        vectors, _ = embed_with_cache(db, texts, spec, embed_fn=lambda batch: embed_texts(batch, spec))
+        # embedding_model fica como está: até a troca, o vetor em uso é o do modelo antigo
+        db.execute(update(KnowledgeChunk), [
+            {"id": chunk_id, spec.column: vector}
+            for (chunk_id, _, _), vector in zip(rows, vectors)
+        ])
+        db.commit()
+        tokens = sum(count if count is not None else len(content) // 4 for _, content, count in rows)
+        return len(rows), tokens
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _run_pass(
+    db: Session,
+    migration: EmbeddingMigration,
+    spec: EmbeddingModelSpec,
+    workers: int,
+    batch_size: int,
+    start_after: int
+) -> int:
+    """
+    Uma passada pelos chunks pendentes com id > start_after. Até workers * 2
+    lotes em voo; o checkpoint avança só até o último lote contíguo concluído.
+    Retorna o número de chunks processados (interrompe se a migração for cancelada).
+    """
+    processed = 0
+    last_seen = start_after
+    in_flight: deque = deque()  # (future, maior id do lote), na ordem de envio
+
+    def collect(block: bool):
+        nonlocal processed
+        while in_flight and (block or in_flight[0][0].done()):
+            future, max_id = in_flight.popleft()
+            chunks, tokens = future.result()
+            processed += chunks
+            migration.chunks_done += chunks
+            migration.tokens_done += tokens
+            migration.last_chunk_id = max_id
+            migration.heartbeat_at = datetime.utcnow()
+            db.commit()
+            block = False
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reembed") as executor:
+        try:
+            while True:
+                db.refresh(migration)
+                if migration.status == "CANCELLED":
+                    break
+                migration.heartbeat_at = datetime.utcnow()
+                db.commit()
+                rows = _pending(db, spec, migration.tenant_id).filter(
+                    KnowledgeChunk.id > last_seen
+                ).order_by(KnowledgeChunk.id).with_entities(
+                    KnowledgeChunk.id, KnowledgeChunk.content, KnowledgeChunk.token_count
+                ).limit(batch_size).all()
+                if not rows:
+                    break
+                last_seen = rows[-1][0]
+                in_flight.append((executor.submit(_embed_rows, spec, [tuple(row) for row in rows]), last_seen))
+                while len(in_flight) >= workers * 2:
+                    collect(block=True)
+                collect(block=False)
+            while in_flight:
+                collect(block=True)
+        finally:
+            for future, _ in in_flight:
+                future.cancel()
+    return processed
+
+
+def run_migration(migration_id: int, workers: int = REEMBED_WORKERS, batch_size: int = REEMBED_BATCH_SIZE, switch: bool = True):
+    """
+    Executa (ou retoma) o re-embedding e, ao terminar, troca o modelo ativo.
+
+    Ordem: passada principal (a partir do checkpoint) -> passadas de catch-up
+    para chunks ingeridos no modelo antigo nesse meio-tempo -> troca atômica de
+    tenants.embedding_model + status COMPLETED na mesma transação -> catch-up
+    final dos chunks gravados durante a troca.
+    """
+    db = SessionLocal()
+    migration = db.query(EmbeddingMigration).filter(EmbeddingMigration.id == migration_id).first()
+    if migration is None:
+        db.close()
+        raise ValueError(f"Re-embedding {migration_id} não encontrado")
+
+    if migration.status in ("CANCELLED", "COMPLETED"):
+        db.close()
+        return
+
+    spec = get_embedding_model(migration.target_model)
+    try:
+        migration.status = "RUNNING"
+        migration.heartbeat_at = datetime.utcnow()
+        migration.started_at = migration.started_at or datetime.utcnow()
+        migration.error = None
+        db.commit()
+        logger.info(f"Re-embedding {migration.id}: {migration.chunks_total} chunks -> {spec.name}")
+
+        _run_pass(db, migration, spec, workers, batch_size, migration.last_chunk_id)
+        for _ in range(REEMBED_CATCHUP_PASSES):
+            if migration.status == "CANCELLED" or not _run_pass(db, migration, spec, workers, batch_size, 0):
+                break
+        if migration.status == "CANCELLED":
+            logger.info(f"Re-embedding {migration.id} cancelado")
+            return
+
+        if switch:
+            tenants = db.query(Tenant)
+            if migration.tenant_id is not None:
+                tenants = tenants.filter(Tenant.id == migration.tenant_id)
+            tenants.update({"embedding_model": spec.name}, synchronize_session=False)
+        migration.status = "COMPLETED"
+        migration.finished_at = datetime.utcnow()
+        db.commit()
+
+        if switch:
+            # Ingestões que ainda usavam o modelo antigo no momento da troca
+            _run_pass(db, migration, spec, workers, batch_size, 0)
+        logger.info(f"Re-embedding {migration.id} concluído: {migration.chunks_done} chunks")
+
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"Re-embedding {migration.id} falhou: {e}")
+        migration.status = "ERROR"
+        migration.error = str(e)[:500]
+        db.commit()
+        raise
+    finally:
+        db.close()
+
+
+def start_migration(migration_id: int, **kwargs) -> threading.Thread:
+    """Executa run_migration numa thread em segundo plano."""
+    def target():
+        try:
+            run_migration(migration_id, **kwargs)
+        except Exception:
+            pass  # status ERROR já gravado
+
+    thread = threading.Thread(target=target, name=f"reembed-{migration_id}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,56 @@
+"""
+Contagem de tokens v4.5
+- Encoders tiktoken cacheados por processo (um por modelo)
+- Contagem de texto e de mensagens no formato chat
+- Truncamento por tokens
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Overhead aproximado do formato chat (ver OpenAI cookbook)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: Optional[str] = None) -> tiktoken.Encoding:
+    """
+    Retorna o encoder do modelo, carregado uma única vez por processo.
+    Modelos desconhecidos (Anthropic, Google, etc.) usam cl100k_base como aproximação.
+    """
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Conta tokens de um texto (tokens especiais são tratados como texto comum)."""
+    if not text:
+        return 0
+    return len(get_encoder(model).encode_ordinary(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """Conta tokens de uma lista de mensagens chat, incluindo o overhead por mensagem."""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "", model)
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Corta o texto no limite de tokens informado."""
+    if max_tokens <= 0 or not text:
+        return ""
+    encoder = get_encoder(model)
+    tokens = encoder.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens])
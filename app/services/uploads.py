@@ -0,0 +1,77 @@
+"""
+Recebimento de uploads v4.5
+- Corpo copiado para o disco em blocos fixos (memória por upload ~ um bloco)
+- sha256 calculado durante a cópia
+- 413 assim que o limite é ultrapassado; arquivo parcial removido
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", 256)) * 1024
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", 50))
+
+
+class UploadTooLarge(ValueError):
+    """O upload ultrapassou o tamanho máximo."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Arquivo muito grande. O máximo é {max_bytes // (1024 * 1024)}MB.")
+        self.max_bytes = max_bytes
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: str
+    sha256: str
+    size_bytes: int
+
+
+def store_stream(source: BinaryIO, dest_path: str, max_bytes: int) -> StoredUpload:
+    """
+    Copia `source` para `dest_path` em blocos de UPLOAD_CHUNK_SIZE.
+
+    Grava em `dest_path.part` e renomeia no fim: um upload rejeitado ou com
+    erro nunca deixa arquivo parcial (nem sobrescreve o arquivo anterior).
+
+    Raises:
+        UploadTooLarge: assim que o total passa de `max_bytes`
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    partial_path = f"{dest_path}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, "wb") as out:
+            while True:
+                block = source.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(block)
+                out.write(block)
+        os.replace(partial_path, dest_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return StoredUpload(dest_path, digest.hexdigest(), size)
+
+
+async def save_upload(file: UploadFile, dest_path: str, max_bytes: int = UPLOAD_MAX_MB * 1024 * 1024) -> StoredUpload:
+    """
+    Grava o UploadFile em disco fora do event loop.
+
+    Raises:
+        HTTPException 413: upload acima de `max_bytes`
+    """
+    try:
+        return await run_in_threadpool(store_stream, file.file, dest_path, max_bytes)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
@@ -5,10 +5,22 @@ Suporte completo: TXT, PDF, DOCX, Imagens (OCR), Áudio, Vídeo
 
 import os
 import logging
-from typing import List, Dict, Optional
+import itertools
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models.models import KnowledgeItem, KnowledgeChunk
 from app.services.rag_monitor import log_event
+from app.services.chunker import iter_chunks
+from app.rag.utils.parsers import iter_docx_blocks, iter_pdf_pages
+from app.services import parsing_pool
+from app.rag.utils import audio_parser
+from app.rag.utils.text_encoding import read_text
+from app.rag.utils.tabular_parser import iter_csv_rows, iter_table_chunks, iter_xlsx_rows
+from app.services.embedding_models import get_embedding_model, chunk_embedding_fields, embed_texts
+from app.services.embedding_scheduler import PRIORITY_INTERACTIVE
+from app.services.embedding_cache import embed_with_cache, merge_cache_stats
+from app.services.document_processor import EMBED_BATCH_SIZE
 from openai import OpenAI
 import mimetypes
 
@@ -20,7 +32,9 @@ client = OpenAI(
     base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
 )
 
-EMBEDDING_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-large")
+# Modelo ativo do registro (EMBEDDINGS_MODEL): define dimensão e coluna de destino
+EMBEDDING_SPEC = get_embedding_model()
+EMBEDDING_MODEL = EMBEDDING_SPEC.name
 FILE_MAX_MB = int(os.getenv("FILE_MAX_MB", 25))
 ALLOW_OCR = os.getenv("ALLOW_OCR", "true").lower() == "true"
 ALLOW_AUDIO = os.getenv("ALLOW_AUDIO", "true").lower() == "true"
@@ -32,6 +46,8 @@ SUPPORTED_TYPES = [
     "text/markdown",
     "application/pdf",
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "text/csv",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
 ]
 
 if ALLOW_OCR:
@@ -44,64 +60,28 @@ if ALLOW_VIDEO:
     SUPPORTED_TYPES.extend(["video/mp4", "video/quicktime", "video/mov"])
 
 
+# Tabular MIME types: row readers for iter_table_chunks
+TABLE_ROW_READERS = {
+    "text/csv": iter_csv_rows,
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": iter_xlsx_rows,
+}
+
+
 def parse_txt(file_path: str) -> str:
-    """Parse TXT/Markdown with auto-encoding detection"""
-    import chardet
-    
-    with open(file_path, "rb") as f:
-        raw = f.read()
-    
-    detected = chardet.detect(raw)
-    encoding = detected.get("encoding", "utf-8") or "utf-8"
-    logger.info(f"Detected encoding: {encoding} (confidence: {detected.get('confidence', 0):.2f})")
-    
-    try:
-        content = raw.decode(encoding, errors="ignore")
-    except Exception as e:
-        logger.warning(f"Failed to decode with {encoding}, falling back to utf-8: {e}")
-        content = raw.decode("utf-8", errors="ignore")
-    
-    return content
+    """Parse TXT/Markdown with auto-encoding detection (UTF-8 fast path, sampled detection)"""
+    return read_text(file_path).text
 
 
 def parse_pdf(file_path: str) -> str:
-    """Parse PDF with pypdf, fallback to pdfminer"""
-    try:
-        # Try pypdf first (faster)
-        from pypdf import PdfReader
-        
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        
-        if text.strip():
-            logger.info(f"PDF parsed with pypdf: {len(text)} chars")
-            return text
-    
-    except Exception as e:
-        logger.warning(f"pypdf failed, trying pdfminer: {e}")
-    
-    # Fallback to pdfminer
-    try:
-        from pdfminer.high_level import extract_text
-        
-        text = extract_text(file_path)
-        logger.info(f"PDF parsed with pdfminer: {len(text)} chars")
-        return text
-    
-    except Exception as e:
-        logger.error(f"pdfminer also failed: {e}")
-        raise ValueError(f"PDF parsing failed: {e}")
+    """Parse PDF page by page (pypdf, fallback to pdfminer)"""
+    text = "".join(iter_pdf_pages(file_path))
+    logger.info(f"PDF parsed: {len(text)} chars")
+    return text
 
 
 def parse_docx(file_path: str) -> str:
-    """Parse DOCX with python-docx"""
-    from docx import Document
-    
-    doc = Document(file_path)
-    paragraphs = [para.text for para in doc.paragraphs]
-    text = "\n".join(paragraphs)
+    """Parse DOCX (paragraphs and tables, streamed from word/document.xml)"""
+    text = "\n".join(iter_docx_blocks(file_path))
     
     logger.info(f"DOCX parsed: {len(text)} chars")
     return text
@@ -128,62 +108,19 @@ def parse_image_ocr(file_path: str) -> str:
 
 
 def transcribe_audio(file_path: str) -> str:
-    """Transcribe audio with OpenAI Whisper API"""
+    """Transcribe audio with OpenAI Whisper API (silence-split segments, concurrent)"""
     if not ALLOW_AUDIO:
         raise ValueError("Audio transcription not enabled")
     
-    try:
-        with open(file_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        
-        text = transcript.text
-        logger.info(f"Audio transcribed: {len(text)} chars")
-        return text
-    
-    except Exception as e:
-        logger.error(f"Audio transcription failed: {e}")
-        raise ValueError(f"Audio transcription failed: {e}")
+    return audio_parser.transcribe_audio(file_path)
 
 
 def transcribe_video(file_path: str) -> str:
-    """Transcribe video by extracting audio and transcribing"""
+    """Transcribe video; audio segments are piped from ffmpeg (no full temp file)"""
     if not ALLOW_VIDEO:
         raise ValueError("Video transcription not enabled")
     
-    try:
-        import subprocess
-        import tempfile
-        
-        # Extract audio with ffmpeg
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_audio:
-            audio_path = tmp_audio.name
-        
-        cmd = [
-            "ffmpeg",
-            "-i", file_path,
-            "-vn",  # No video
-            "-acodec", "libmp3lame",
-            "-y",  # Overwrite
-            audio_path
-        ]
-        
-        subprocess.run(cmd, check=True, capture_output=True)
-        
-        # Transcribe audio
-        text = transcribe_audio(audio_path)
-        
-        # Cleanup
-        os.remove(audio_path)
-        
-        logger.info(f"Video transcribed: {len(text)} chars")
-        return text
-    
-    except Exception as e:
-        logger.error(f"Video transcription failed: {e}")
-        raise ValueError(f"Video transcription failed: {e}")
+    return audio_parser.transcribe_video(file_path)
 
 
 def parse_file(file_path: str, mime_type: str) -> str:
@@ -194,14 +131,19 @@ def parse_file(file_path: str, mime_type: str) -> str:
     if mime_type in ["text/plain", "text/markdown"]:
         return parse_txt(file_path)
     
+    # CPU-bound parsers run in the parsing process pool
     elif mime_type == "application/pdf":
-        return parse_pdf(file_path)
+        return "".join(parsing_pool.iter_pdf_pages(file_path))
     
     elif mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        return parse_docx(file_path)
+        return parsing_pool.parse_docx(file_path)
+    
+    # Tabular (CSV/XLSX) is not parsed to text: see iter_table_doc_chunks
+    elif mime_type in TABLE_ROW_READERS:
+        raise ValueError(f"Tabular MIME type {mime_type}: use iter_table_doc_chunks")
     
     elif mime_type in ["image/jpeg", "image/png", "image/jpg"]:
-        return parse_image_ocr(file_path)
+        return parsing_pool.parse_image(file_path)
     
     elif mime_type in ["audio/mpeg", "audio/wav", "audio/mp3"]:
         return transcribe_audio(file_path)
@@ -213,47 +155,60 @@ def parse_file(file_path: str, mime_type: str) -> str:
         raise ValueError(f"Unsupported MIME type: {mime_type}")
 
 
-def split_into_chunks(text: str, chunk_size: int = 1500, overlap: int = 200) -> List[str]:
+def parse_file_with_info(file_path: str, mime_type: str) -> Tuple[str, Dict]:
+    """
+    Parse file and return parse metadata for the rag.parsed event
+    (parse time; detected encoding for text files)
+    """
+    started = time.perf_counter()
+    info = {}
+    if mime_type in ["text/plain", "text/markdown"]:
+        decoded = read_text(file_path)
+        content = decoded.text
+        info.update(decoded.info())
+    else:
+        content = parse_file(file_path, mime_type)
+    info["parse_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return content, info
+
+
+def iter_table_doc_chunks(file_path: str, mime_type: str) -> Iterator[str]:
+    """
+    CSV/XLSX chunks streamed row by row, each with its header (or one record
+    per chunk in "record" mode) and within the token limit. Used as-is: not
+    joined and re-chunked as plain text.
+    """
+    return iter_table_chunks(TABLE_ROW_READERS[mime_type](file_path))
+
+
+def split_into_chunks(text: str, chunk_size: int = 400, overlap: int = 50) -> List[str]:
     """
     Split text into overlapping chunks
-    v3.6.0: Increased chunk size to 1.5k tokens (~2k chars)
+    v4.5: Sizes in tokens (~1.5k chars), cut at paragraph/sentence boundaries
     """
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        
-        start = end - overlap
-    
-    return chunks
+    return [chunk.text.strip() for chunk in iter_chunks(text, chunk_size, overlap)]
 
 
 def get_embedding(text: str) -> List[float]:
     """
-    Get embedding vector from OpenAI
-    v3.6.0: Using text-embedding-3-large (3072 dimensions)
+    Get query embedding vector from OpenAI
+    v3.6.0: Model/dimensions from the embedding registry
+    v4.5: Interactive priority in the embedding scheduler; errors propagate (no zero vectors)
     """
-    try:
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text
-        )
-        return response.data[0].embedding
-    
-    except Exception as e:
-        logger.error(f"Embedding API error: {e}")
-        # Return stub vector (3072 dimensions for text-embedding-3-large)
-        return [0.0] * 3072
+    return embed_texts([text], EMBEDDING_SPEC, priority=PRIORITY_INTERACTIVE)[0]
 
 
-def vectorize_text_doc(item_id: str, content: str, db: Session, tenant_id: int, trace_id: Optional[str] = None) -> Dict:
+def vectorize_text_doc(
+    item_id: str,
+    content: str,
+    db: Session,
+    tenant_id: int,
+    trace_id: Optional[str] = None,
+    parse_info: Optional[Dict] = None
+) -> Dict:
     """
     Vectorize text content
+    parse_info: parse metadata (encoding, timings) added to the rag.parsed event
     Returns: {"status": "ok"|"error", "chunks": int, "reason": str}
     """
     try:
@@ -268,7 +223,7 @@ def vectorize_text_doc(item_id: str, content: str, db: Session, tenant_id: int,
         
         # Log parsing success
         if trace_id:
-            log_event(db, tenant_id, "rag.parsed", trace_id=trace_id, doc_id=item_id, status="success", payload={"content_length": len(content)})
+            log_event(db, tenant_id, "rag.parsed", trace_id=trace_id, doc_id=item_id, status="success", payload={"content_length": len(content), **(parse_info or {})})
         
         # Chunk text
         chunks = split_into_chunks(content)
@@ -283,55 +238,100 @@ def vectorize_text_doc(item_id: str, content: str, db: Session, tenant_id: int,
         if trace_id:
             log_event(db, tenant_id, "rag.chunked", trace_id=trace_id, doc_id=item_id, status="success", payload={"chunks_count": len(chunks)})
         
-        # Vectorize each chunk
-        saved_chunks = 0
-        for idx, chunk_text in enumerate(chunks):
-            try:
-                # Get embedding
-                embedding = get_embedding(chunk_text)
-                
-                # Save chunk
-                chunk = KnowledgeChunk(
-                    item_id=item_id,
-                    idx=idx,
-                    text=chunk_text,
-                    embedding=embedding
-                )
-                db.add(chunk)
-                saved_chunks += 1
-            
-            except Exception as chunk_error:
-                logger.error(f"Failed to vectorize chunk {idx} of {item_id}: {chunk_error}")
-                continue
-        
-        db.commit()
-        
-        if saved_chunks == 0:
-            logger.error(f"No chunks saved for {item_id}")
-            
-            if trace_id:
-                log_event(db, tenant_id, "rag.embedding_failed", trace_id=trace_id, doc_id=item_id, status="failed", payload={"reason": "no_chunks_saved"})
-            
-            return {"status": "error", "chunks": 0, "reason": "vectorization_failed"}
+        return _store_chunks(item_id, chunks, db, tenant_id, trace_id)
+    
+    except Exception as e:
+        return _vectorize_failed(item_id, e, db, tenant_id, trace_id)
+
+
+def vectorize_table_doc(
+    item_id: str,
+    file_path: str,
+    mime_type: str,
+    db: Session,
+    tenant_id: int,
+    trace_id: Optional[str] = None
+) -> Dict:
+    """
+    Vectorize CSV/XLSX: table chunks are embedded as they are read, one batch
+    at a time (the table is never held in memory as a whole)
+    Returns: {"status": "ok"|"error", "chunks": int, "reason": str}
+    """
+    try:
+        started = time.perf_counter()
+        result = _store_chunks(item_id, iter_table_doc_chunks(file_path, mime_type), db, tenant_id, trace_id)
         
-        # Log embedding success
-        if trace_id:
-            log_event(db, tenant_id, "rag.embedded", trace_id=trace_id, doc_id=item_id, status="success", payload={
-                "chunks_count": saved_chunks,
-                "embedding_model": EMBEDDING_MODEL,
-                "embedding_dim": 3072
+        if trace_id and result["status"] == "ok":
+            log_event(db, tenant_id, "rag.chunked", trace_id=trace_id, doc_id=item_id, status="success", payload={
+                "chunks_count": result["chunks"],
+                "parse_embed_ms": round((time.perf_counter() - started) * 1000, 1)
             })
         
-        logger.info(f"Vectorization complete for {item_id}: {saved_chunks} chunks")
-        return {"status": "ok", "chunks": saved_chunks}
+        return result
     
     except Exception as e:
-        logger.exception(f"Vectorization failed for {item_id}: {e}")
+        return _vectorize_failed(item_id, e, db, tenant_id, trace_id)
+
+
+def _store_chunks(item_id: str, chunks: Iterable[str], db: Session, tenant_id: int, trace_id: Optional[str]) -> Dict:
+    """
+    Embed and save chunks in batches of EMBED_BATCH_SIZE (accepts an iterator);
+    only cache misses hit the provider. Each batch is committed together with
+    the embedding cache, so a retry after a provider failure does not pay again
+    for the batches already embedded.
+    """
+    chunk_iter = iter(chunks)
+    saved_chunks, cache_stats = 0, None
+    while True:
+        batch = list(itertools.islice(chunk_iter, EMBED_BATCH_SIZE))
+        if not batch:
+            break
+        embeddings, stats = embed_with_cache(db, batch, EMBEDDING_SPEC)
+        cache_stats = merge_cache_stats(cache_stats, stats)
+        for offset, (chunk_text, embedding) in enumerate(zip(batch, embeddings)):
+            db.add(KnowledgeChunk(
+                item_id=item_id,
+                idx=saved_chunks + offset,
+                text=chunk_text,
+                **chunk_embedding_fields(EMBEDDING_SPEC, embedding)
+            ))
+        db.commit()
+        saved_chunks += len(batch)
+    
+    if saved_chunks == 0:
+        logger.error(f"No chunks saved for {item_id}")
         
         if trace_id:
-            log_event(db, tenant_id, "rag.embedding_failed", trace_id=trace_id, doc_id=item_id, status="failed", payload={"error": str(e)[:200]})
+            log_event(db, tenant_id, "rag.embedding_failed", trace_id=trace_id, doc_id=item_id, status="failed", payload={"reason": "no_chunks_saved"})
         
-        return {"status": "error", "chunks": 0, "reason": f"vectorization_failed: {str(e)[:100]}"}
+        return {"status": "error", "chunks": 0, "reason": "vectorization_failed"}
+    
+    # Log embedding success
+    if trace_id:
+        log_event(db, tenant_id, "rag.embedded", trace_id=trace_id, doc_id=item_id, status="success", payload={
+            "chunks_count": saved_chunks,
+            "embedding_model": EMBEDDING_MODEL,
+            "embedding_dim": EMBEDDING_SPEC.dim,
+            "cache_hits": cache_stats["hits"],
+            "cache_misses": cache_stats["misses"],
+            "cache_hit_ratio": cache_stats["hit_ratio"]
+        })
+    
+    logger.info(f"Vectorization complete for {item_id}: {saved_chunks} chunks")
+    return {"status": "ok", "chunks": saved_chunks}
+
+
+def _vectorize_failed(item_id: str, error: Exception, db: Session, tenant_id: int, trace_id: Optional[str]) -> Dict:
+    """Drop the batches already saved (the item is marked error; a retry starts over)"""
+    logger.exception(f"Vectorization failed for {item_id}: {error}")
+    db.rollback()
+    db.query(KnowledgeChunk).filter(KnowledgeChunk.item_id == item_id).delete(synchronize_session=False)
+    db.commit()
+    
+    if trace_id:
+        log_event(db, tenant_id, "rag.embedding_failed", trace_id=trace_id, doc_id=item_id, status="failed", payload={"error": str(error)[:200]})
+    
+    return {"status": "error", "chunks": 0, "reason": f"vectorization_failed: {str(error)[:100]}"}
 
 
 def vectorize_knowledge_item(item_id: str, db: Session, trace_id: Optional[str] = None):
@@ -380,9 +380,17 @@ def vectorize_knowledge_item(item_id: str, db: Session, trace_id: Optional[str]
         raise ValueError(f"Unsupported MIME type: {item.mime}")
     
     try:
+        if item.mime in TABLE_ROW_READERS:
+            # Tabular: chunks straight from the row reader (no full-text pass)
+            logger.info(f"Streaming {item.mime} file: {item.filename}")
+            result = vectorize_table_doc(item_id, storage_path, item.mime, db, tenant_id, trace_id)
+            _apply_result(item, result)
+            db.commit()
+            return
+        
         # Parse file
         logger.info(f"Parsing {item.mime} file: {item.filename}")
-        content = parse_file(storage_path, item.mime)
+        content, parse_info = parse_file_with_info(storage_path, item.mime)
         
         if not content or not content.strip():
             logger.warning(f"Empty content after parsing: {item_id}")
@@ -392,17 +400,8 @@ def vectorize_knowledge_item(item_id: str, db: Session, trace_id: Optional[str]
             return
         
         # Vectorize
-        result = vectorize_text_doc(item_id, content, db, tenant_id, trace_id)
-        
-        if result["status"] == "ok":
-            item.status = "vectorized"
-            item.chunks_count = result["chunks"]
-            item.error_reason = None
-        else:
-            item.status = "error"
-            item.chunks_count = 0
-            item.error_reason = result["reason"]
-        
+        result = vectorize_text_doc(item_id, content, db, tenant_id, trace_id, parse_info)
+        _apply_result(item, result)
         db.commit()
     
     except Exception as e:
@@ -417,6 +416,17 @@ def vectorize_knowledge_item(item_id: str, db: Session, trace_id: Optional[str]
         raise
 
 
+def _apply_result(item: KnowledgeItem, result: Dict):
+    if result["status"] == "ok":
+        item.status = "vectorized"
+        item.chunks_count = result["chunks"]
+        item.error_reason = None
+    else:
+        item.status = "error"
+        item.chunks_count = 0
+        item.error_reason = result["reason"]
+
+
 def is_mime_supported(mime_type: str) -> bool:
     """Check if MIME type is supported"""
     return mime_type in SUPPORTED_TYPES
@@ -424,7 +434,7 @@ def is_mime_supported(mime_type: str) -> bool:
 
 def get_supported_extensions() -> List[str]:
     """Get list of supported file extensions"""
-    extensions = [".txt", ".md", ".pdf", ".docx"]
+    extensions = [".txt", ".md", ".pdf", ".docx", ".csv", ".xlsx"]
     
     if ALLOW_OCR:
         extensions.extend([".jpg", ".jpeg", ".png"])
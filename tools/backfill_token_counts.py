@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Backfill de token_count para conversation_messages e knowledge_chunks.
+
+Linhas novas já recebem token_count na inserção; este script preenche as linhas
+antigas (token_count IS NULL) em lotes pequenos, com um commit por lote.
+
+Uso:
+    DATABASE_URL=... python tools/backfill_token_counts.py [--batch-size 500]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    print("❌ ERROR: DATABASE_URL environment variable not set")
+    sys.exit(1)
+
+from sqlalchemy import update
+
+from app.core.database import SessionLocal
+from app.models.models import ConversationMessage, KnowledgeChunk
+from app.services.tokenizer import count_tokens
+
+
+def backfill(db, model, batch_size: int) -> int:
+    """Preenche token_count de um modelo com paginação por id (keyset)."""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(model.id, model.content).filter(
+            model.token_count.is_(None),
+            model.id > last_id
+        ).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        db.execute(
+            update(model),
+            [{"id": row.id, "token_count": count_tokens(row.content)} for row in rows]
+        )
+        db.commit()
+
+        last_id = rows[-1].id
+        total += len(rows)
+        print(f"   {model.__tablename__}: {total} linhas (até id {last_id})")
+
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de token_count")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for model in (ConversationMessage, KnowledgeChunk):
+            print(f"\n🔧 Backfill {model.__tablename__}...")
+            count = backfill(db, model, args.batch_size)
+            print(f"✅ {model.__tablename__}: {count} linhas atualizadas")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Erro: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Microbenchmark do chunking de documentos.
+
+Compara o chunker de passada única (app/services/chunker.py) com as
+implementações anteriores:
+- decode por janela (antigo DocumentProcessor.chunk_text)
+- janela fixa de caracteres (antigos split_into_chunks / knowledge.chunk_text)
+
+Uso:
+    python tools/bench_chunker.py [--size-kb 2000] [--repeat 3] [--file documento.txt]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.chunker import iter_chunks
+from app.services.tokenizer import get_encoder
+
+CHUNK_TOKENS = 800
+OVERLAP_TOKENS = 200
+
+
+def decode_per_window(text: str):
+    """Implementação anterior: encode completo + decode de cada janela."""
+    encoding = get_encoder()
+    tokens = encoding.encode(text)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = start + CHUNK_TOKENS
+        chunks.append(encoding.decode(tokens[start:end]))
+        start += CHUNK_TOKENS - OVERLAP_TOKENS
+    return chunks
+
+
+def char_window(text: str, chunk_size: int = 1500, overlap: int = 200):
+    """Implementação anterior: janela fixa de caracteres (corta palavras)."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        chunk = text[start:start + chunk_size]
+        if chunk.strip():
+            chunks.append(chunk.strip())
+        start += chunk_size - overlap
+    return chunks
+
+
+def single_pass(text: str):
+    return [chunk.text for chunk in iter_chunks(text, CHUNK_TOKENS, OVERLAP_TOKENS)]
+
+
+def synthetic_text(size_kb: int) -> str:
+    random.seed(42)
+    words = (
+        "contrato cliente prazo entrega pagamento cláusula multa rescisão serviço "
+        "sistema usuário relatório análise dados processo equipe projeto resultado"
+    ).split()
+    paragraphs = []
+    size = 0
+    while size < size_kb * 1024:
+        sentences = [
+            " ".join(random.choice(words) for _ in range(random.randint(6, 25))).capitalize() + "."
+            for _ in range(random.randint(2, 8))
+        ]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def bench(name: str, fn, text: str, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = fn(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    mid_word = sum(1 for chunk in chunks if chunk and chunk[-1].isalnum())
+    print(f"   {name:<20} {best * 1000:9.1f} ms  {len(chunks):6d} chunks  {mid_word:6d} cortados no meio da palavra")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de chunking")
+    parser.add_argument("--size-kb", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--file", help="Arquivo de texto (em vez de texto sintético)")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    else:
+        text = synthetic_text(args.size_kb)
+
+    get_encoder()  # carregar o encoder fora da medição
+    print(f"\n📄 Texto: {len(text) / 1024:.0f} KB, melhor de {args.repeat}")
+    bench("decode por janela", decode_per_window, text, args.repeat)
+    bench("janela de chars", char_window, text, args.repeat)
+    bench("passada única", single_pass, text, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Throughput de um backend de embedding (chunks/s), para dimensionar máquinas.
+
+Gera chunks sintéticos do tamanho dos chunks de ingestão (~800 tokens) e mede
+o backend escolhido depois de um aquecimento (carga do modelo local etc.).
+
+Uso:
+    python tools/bench_embeddings.py --model paraphrase-multilingual-MiniLM-L12-v2 [--chunks 512]
+    EMBEDDINGS_BACKEND=hashing python tools/bench_embeddings.py [--chunk-words 600] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.embedding_backends import backend_name, get_backend
+from app.services.embedding_models import get_embedding_model
+
+WORDS = (
+    "contrato prestação serviços cláusula pagamento fatura mensal multa rescisão prazo "
+    "entrega cliente fornecedor produto garantia suporte técnico relatório trimestral "
+    "receita despesa orçamento projeto equipe reunião cronograma meta indicador"
+).split()
+
+
+def make_chunks(count: int, words: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de embedding")
+    parser.add_argument("--model", default=None, help="Modelo do registro (padrão: EMBEDDINGS_MODEL)")
+    parser.add_argument("--chunks", type=int, default=256)
+    parser.add_argument("--chunk-words", type=int, default=600, help="~800 tokens em português")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks por chamada (como EMBED_BATCH_SIZE)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    spec = get_embedding_model(args.model)
+    backend = get_backend(spec)
+    chunks = make_chunks(args.chunks, args.chunk_words)
+    print(f"\n📊 {spec.name} ({spec.dim} dims) via backend {backend_name(spec)}")
+    print(f"   {args.chunks} chunks de {args.chunk_words} palavras, lotes de {args.batch_size}")
+
+    backend.embed(spec, chunks[:args.batch_size], batch_size=args.batch_size)  # aquecimento
+
+    best = None
+    for run in range(args.repeat):
+        started = time.perf_counter()
+        for i in range(0, len(chunks), args.batch_size):
+            backend.embed(spec, chunks[i:i + args.batch_size], batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        rate = len(chunks) / elapsed
+        best = max(best or 0.0, rate)
+        print(f"   execução {run + 1}: {elapsed:.2f}s ({rate:.1f} chunks/s)")
+
+    print(f"✅ Melhor: {best:.1f} chunks/s ({best * 3600:.0f} chunks/hora)")
+    stats = backend.stats()
+    if stats:
+        print(f"   Métricas do backend: {stats}")
+
+
+if __name__ == "__main__":
+    main()
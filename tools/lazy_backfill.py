@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+Backfill dos documentos ingeridos em modo lazy (ainda sem embeddings).
+
+Vetoriza os documentos pendentes, mais antigos primeiro, com a prioridade mais
+baixa do embedding_scheduler: consultas e ingestões normais passam na frente e
+o backfill usa só a folga do rate limit. Pode rodar em cron; documentos que
+falharem voltam para a fila e são tentados na próxima execução.
+
+Uso:
+    DATABASE_URL=... python tools/lazy_backfill.py [--limit 100] [--tenant 1]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    print("❌ ERROR: DATABASE_URL environment variable not set")
+    sys.exit(1)
+
+from app.services import lazy_vectorize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de documentos lazy")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de documentos (padrão: todos)")
+    parser.add_argument("--tenant", type=int, default=None, help="Só este tenant (padrão: todos)")
+    args = parser.parse_args()
+
+    print("\n🔧 Vetorizando documentos lazy pendentes...")
+    completed = lazy_vectorize.backfill(limit=args.limit, tenant_id=args.tenant)
+    print(f"✅ {completed} documentos vetorizados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+Remove documentos deletados (soft delete) e chunks órfãos.
+
+Faz a mesma varredura do reaper da API (chunks em lotes pequenos, arquivo e
+linha do documento), útil quando a API roda com o reaper desligado ou para
+limpar de uma vez depois de uma remoção em massa. Com --vacuum, roda
+VACUUM ANALYZE em knowledge_chunks ao final.
+
+Uso:
+    DATABASE_URL=... python tools/purge_deleted.py [--batch-size 500] [--vacuum]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    print("❌ ERROR: DATABASE_URL environment variable not set")
+    sys.exit(1)
+
+from app.services import document_reaper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remoção de documentos deletados e chunks órfãos")
+    parser.add_argument("--batch-size", type=int, default=document_reaper.REAPER_BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM ANALYZE de knowledge_chunks ao final")
+    args = parser.parse_args()
+
+    document_reaper.REAPER_BATCH_SIZE = args.batch_size
+    print("\n🔧 Removendo documentos deletados...")
+    stats = document_reaper.run_once(vacuum=args.vacuum or None)
+    print(
+        f"✅ {stats['documents']} documentos, {stats['chunks']} chunks, "
+        f"{stats['orphan_chunks']} chunks órfãos removidos"
+    )
+
+
+if __name__ == "__main__":
+    main()
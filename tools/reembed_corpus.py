@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Re-embedding do corpus (de um tenant ou de todos) para outro modelo de embedding.
+
+Grava os vetores na coluna do novo modelo em lotes concorrentes (respeitando os
+limites do embedding_scheduler), com checkpoint no banco; ao terminar, troca o
+modelo ativo dos tenants de forma atômica. Interrompido, retoma com --resume.
+
+Uso:
+    DATABASE_URL=... python tools/reembed_corpus.py --model text-embedding-3-large [--tenant 1] [--estimate-only]
+    DATABASE_URL=... python tools/reembed_corpus.py --resume 7 [--workers 8] [--batch-size 256]
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    print("❌ ERROR: DATABASE_URL environment variable not set")
+    sys.exit(1)
+
+from app.core.database import SessionLocal
+from app.models.models import EmbeddingMigration
+from app.services import reembed
+
+
+def report(migration_id: int, done: threading.Event, interval: float):
+    """Imprime o progresso até a migração terminar."""
+    while not done.wait(interval):
+        db = SessionLocal()
+        try:
+            migration = db.query(EmbeddingMigration).filter(EmbeddingMigration.id == migration_id).first()
+            status = reembed.progress(migration)
+        finally:
+            db.close()
+        eta = f"{status['eta_seconds']:.0f}s" if status["eta_seconds"] is not None else "?"
+        print(
+            f"   {status['chunks_done']}/{status['chunks_total']} chunks ({status['percent']}%), "
+            f"{status['chunks_per_second'] or 0} chunks/s, ETA {eta}, US$ {status['cost_so_far_usd']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embedding do corpus para outro modelo")
+    parser.add_argument("--model", help="Modelo de destino (registro de embedding_models)")
+    parser.add_argument("--tenant", type=int, default=None, help="Só este tenant (padrão: todos)")
+    parser.add_argument("--resume", type=int, default=None, help="Retoma a migração com este id")
+    parser.add_argument("--workers", type=int, default=reembed.REEMBED_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=reembed.REEMBED_BATCH_SIZE)
+    parser.add_argument("--estimate-only", action="store_true", help="Só mostra a estimativa")
+    parser.add_argument("--no-switch", action="store_true", help="Não troca o modelo ativo ao terminar")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Segundos entre relatórios")
+    args = parser.parse_args()
+
+    if not args.model and args.resume is None:
+        parser.error("--model ou --resume é obrigatório")
+
+    db = SessionLocal()
+    try:
+        if args.resume is not None:
+            migration = db.query(EmbeddingMigration).filter(EmbeddingMigration.id == args.resume).first()
+            if migration is None:
+                print(f"❌ Migração {args.resume} não encontrada")
+                sys.exit(1)
+            if not reembed.claim_resume(db, migration.id):
+                print(f"❌ Migração {args.resume} em andamento ou concluída")
+                sys.exit(1)
+        else:
+            stats = reembed.estimate(db, args.model, args.tenant, args.batch_size)
+            scope = f"tenant {args.tenant}" if args.tenant is not None else "todos os tenants"
+            print(f"\n📊 {stats['target_model']} ({scope}): {stats['chunks']} chunks, {stats['tokens']} tokens")
+            print(f"   Custo estimado: US$ {stats['estimated_cost_usd']}")
+            print(f"   Tempo mínimo (limites de RPM/TPM): {stats['estimated_seconds']:.0f}s")
+            if args.estimate_only:
+                return
+            migration = reembed.create_migration(db, args.model, args.tenant)
+        migration_id = migration.id
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+    print(f"\n🔧 Re-embedding {migration_id}...")
+    done = threading.Event()
+    reporter = threading.Thread(target=report, args=(migration_id, done, args.report_every), daemon=True)
+    reporter.start()
+    try:
+        reembed.run_migration(
+            migration_id, workers=args.workers, batch_size=args.batch_size, switch=not args.no_switch
+        )
+    except Exception as e:
+        print(f"❌ Erro: {e} (retome com --resume {migration_id})")
+        sys.exit(1)
+    finally:
+        done.set()
+
+    db = SessionLocal()
+    try:
+        migration = db.query(EmbeddingMigration).filter(EmbeddingMigration.id == migration_id).first()
+        status = reembed.progress(migration)
+    finally:
+        db.close()
+    print(f"✅ {status['status']}: {status['chunks_done']} chunks, US$ {status['cost_so_far_usd']}")
+
+
+if __name__ == "__main__":
+    main()